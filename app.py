@@ -1,23 +1,140 @@
 import gradio as gr
 from dotenv import load_dotenv
 import os
+import threading
 import time
 
-from utils.extract_text import extract_text_from_file
+from utils.extract_text import extraction_key_for_file, iter_pages_from_file, warm_up_ocr
 from utils.summarize import generate_financial_summary
-from utils.parse_kpis import extract_kpis_from_text
-from utils.pdf_report import generate_pdf
-from utils.qa_agent import build_qa_chain_from_text
+from utils.parse_kpis import scan_kpis, compute_ratios
+from utils.kpi_tables import extract_kpi_matrix, compute_period_ratios, matrix_to_markdown, page_may_have_kpi_table
+from utils.pdf_report import new_report_path, submit_pdf
+from utils.qa_agent import QAIndexBuilder, add_to_corpus, build_corpus_chain, get_embeddings, index_key_for_file, metrics_callbacks, warm_up as warm_up_qa
+from utils.corpus import guess_period, parse_periods
+from utils import metrics, qa_cache, revisions
+from utils.disk_cache import file_sha256
+from utils.pipeline import TaskGraph
+from utils.sessions import SessionStore
 
 load_dotenv()
-qa_agent = None  # Global QA chain
-uploaded_file_path = None  # Track uploaded file
+sessions = SessionStore()  # Per-session QA chain and uploaded file, keyed by Gradio session hash
+
+# Minimum time between progress updates while pages are being extracted
+PROGRESS_UPDATE_SECONDS = 0.5
+
+# Request queue: uploads and questions get separate worker limits, so a few heavy uploads can't
+# hold up Q&A requests from other users.
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "2"))
+QA_CONCURRENCY = int(os.getenv("QA_CONCURRENCY", "8"))
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "64"))
+
+DOCUMENT_SCOPE = "This document"
+CORPUS_SCOPE = "All documents (corpus)"
+
+# --------------------------
+# 🔥 Optional Warm-up
+# --------------------------
+def warm_up():
+    # Heavy models are loaded lazily on first use; WARMUP_ON_START=1 loads them in the
+    # background at startup instead, so the first upload doesn't pay for them.
+    start = time.perf_counter()
+    warm_up_ocr()
+    warm_up_qa()
+    print(f"✅ Warm-up finished in {time.perf_counter() - start:.1f}s.")
 
 # --------------------------
 # 📄 Handle Upload
 # --------------------------
-def handle_upload(file):
-    global qa_agent, uploaded_file_path
+def _format_kpis(kpis):
+    output = ""
+    for key, value in kpis.items():
+        # Format numbers for better readability
+        if isinstance(value, (int, float)):
+            output += f"- **{key}**: {value:,.2f}\n"
+        else: # For N/A or non-numeric values
+            output += f"- **{key}**: {value}\n"
+    return output
+
+def _summary_stage(text, pages):
+    summary = generate_financial_summary(text, pages=pages)
+    if not summary or "Error generating summary" in summary: # Check for specific error message from summarize.py
+        raise RuntimeError(f"Failed to generate summary: {summary}")
+    return summary
+
+def _kpi_tables_stage(file_path, table_pages):
+    # Multi-period KPIs from spreadsheet sheets / PDF tables (best effort)
+    period_output = ""
+    kpi_matrix = extract_kpi_matrix(file_path, pages=table_pages)
+    if not kpi_matrix.empty:
+        period_output = "\n---\n\n### 📅 Key Financial KPIs by Period:\n\n" + matrix_to_markdown(kpi_matrix)
+        period_ratios = compute_period_ratios(kpi_matrix)
+        if not period_ratios.empty:
+            period_output += "\n### 📈 Financial Ratios by Period:\n\n" + matrix_to_markdown(period_ratios)
+    return period_output
+
+def _report_stage(kpis, output_path, summary, ratios):
+    # Rendered in the report process pool, which bounds how many reports render at once across all uploads
+    pdf_path = submit_pdf(summary, kpis, ratios, output_path=output_path).result()
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError("PDF report could not be generated. Please check server logs.")
+    return pdf_path
+
+def _render_output(kpis, results, pending=0):
+    # Renders whatever the upload stages have produced so far
+    if "summary" in results:
+        output = f"### 📘 Executive Summary:\n\n{results['summary']}\n"
+    else:
+        output = "### ⏳ Generating executive summary...\n"
+    output += "\n---\n\n### 📊 Key Financial KPIs:\n"
+
+    if kpis:
+        output += _format_kpis(kpis)
+    else:
+        output += "⚠️ No significant financial KPIs could be extracted.\n"
+
+    if "ratios" in results:
+        ratios = results["ratios"]
+        if ratios:
+            output += "\n### 📈 Financial Ratios:\n"
+            for key, value in ratios.items():
+                output += f"- **{key}**: {value}\n"
+        else:
+            output += "\n⚠️ No financial ratios found or computable."
+
+    output += results.get("kpi_tables", "")
+
+    if results.get("corpus"):
+        entry = results["corpus"]
+        output += f"\n\n📚 Added to the corpus as **{entry['company']} {entry['period']}**."
+
+    if pending:
+        ready = "✅ Q&A agent is ready." if "qa_chain" in results else "⏳ Building Q&A agent..."
+        output += f"\n\n---\n\n{ready} ⏳ {pending} step(s) still running..."
+    return output
+
+def _session_id(request):
+    return getattr(request, "session_hash", None)
+
+def _session(request):
+    # Every browser tab and gradio_client instance has its own session hash. Requests without one
+    # are rejected: a shared fallback session would hand one caller's document to another.
+    session_id = _session_id(request)
+    if not session_id:
+        metrics.inc("requests_rejected_total", reason="no_session")
+        raise gr.Error("This request has no session. Use the web UI or gradio_client.")
+    return sessions.get(session_id)
+
+def _revision_owner(request):
+    # Earlier versions of a file are only looked up among the same user's (or session's) uploads
+    username = getattr(request, "username", None)
+    return f"user:{username}" if username else f"session:{_session_id(request)}"
+
+def _corpus_stage(qa_builder, file_name, company, period, text, _qa_chain):
+    # Runs after the Q&A index is built; the corpus keeps its own copy of the index as a shard
+    return add_to_corpus(qa_builder, file_name, company.strip(), period.strip() or guess_period(file_name, text))
+
+def handle_upload(file, add_corpus, company, period, request: gr.Request):
+    session = _session(request)
 
     # Reset UI elements initially
     yield gr.update(value=""), None, gr.update(visible=False), gr.update(selected=0) # Clear previous outputs, hide PDF, keep on upload tab
@@ -25,90 +142,139 @@ def handle_upload(file):
     if file is None:
         return gr.update(value="❌ Error: No file uploaded. Please select a file."), None, gr.update(visible=False), gr.update(selected=0)
 
+    upload_start = time.perf_counter()
+    # Drop the previous document's Q&A chain and report before processing the new one
+    session.clear()
     uploaded_file_path = file.name
+    session.uploaded_file_path = uploaded_file_path
     
     # Show processing message
     yield gr.update(value="### ⏳ Processing file... This may take a moment."), None, gr.update(visible=False), gr.update(selected=0)
     
     try:
-        # Step 1: Extract Text
+        # Step 1: Extract text page by page. KPIs are scanned and the Q&A index is embedded as each
+        # page arrives, so partial results show up before extraction finishes.
         yield gr.update(value="### ⏳ Extracting text from file..."), None, gr.update(visible=False), gr.update(selected=0)
-        extracted_text = extract_text_from_file(uploaded_file_path)
-        if not extracted_text or not extracted_text.strip():
+        page_texts = [] # The executive summary still needs the full text
+        table_pages = [] # PDF pages that may hold a KPI table
+        # Hashed once; the extraction cache, index store and revision manifest are all keyed by it
+        content_hash = file_sha256(uploaded_file_path)
+        # A new version of a PDF analyzed before only re-extracts, re-embeds and rescans changed pages
+        revision = revisions.plan(uploaded_file_path, _revision_owner(request), content_hash)
+        reused = revision.reused_records() if revision else None
+        kpis, kpi_pages = revision.kept_kpis() if revision else ({}, {})
+        first_changed = revision.first_changed if revision else 0
+        # Reloads the persisted index instead of re-embedding when this file was indexed before
+        document_key = index_key_for_file(uploaded_file_path, content_hash)
+        qa_builder = QAIndexBuilder(index_key=document_key, base=revision)
+        last_update = 0.0
+        page_count = 0
+        extraction_start = time.perf_counter()
+        for page in iter_pages_from_file(uploaded_file_path, reused=reused, content_hash=content_hash):
+            page_count += 1
+            if page.text:
+                page_texts.append(page.text)
+            # KPIs found before the first changed page still hold; the first match wins
+            if page.page_num >= first_changed:
+                found_before = set(kpis)
+                scan_kpis(page.text, kpis)
+                kpi_pages.update((key, page.page_num) for key in kpis if key not in found_before)
+            if page_may_have_kpi_table(page.text):
+                table_pages.append(page.page_num)
+            qa_builder.add_page(page)
+            if time.monotonic() - last_update >= PROGRESS_UPDATE_SECONDS:
+                last_update = time.monotonic()
+                progress = f"### ⏳ Extracting text from file... {page.page_num + 1} page(s) processed.\n"
+                if kpis:
+                    progress += "\n#### 📊 KPIs found so far:\n" + _format_kpis(kpis)
+                yield gr.update(value=progress), None, gr.update(visible=False), gr.update(selected=0)
+
+        extraction_seconds = time.perf_counter() - extraction_start
+        extracted_text = "\n".join(page_texts).strip()
+        if not extracted_text:
             raise ValueError("No readable text extracted from the file after processing. The file might be empty or unreadable.")
 
-        # Step 2: Generate Summary
-        yield gr.update(value="### ⏳ Generating executive summary..."), None, gr.update(visible=False), gr.update(selected=0)
-        summary = generate_financial_summary(extracted_text)
-        if not summary or "Error generating summary" in summary: # Check for specific error message from summarize.py
-            raise RuntimeError(f"Failed to generate summary: {summary}")
-
-        # Step 3: Extract KPIs
-        yield gr.update(value="### ⏳ Extracting Key Performance Indicators (KPIs)..."), None, gr.update(visible=False), gr.update(selected=0)
-        kpis, ratios = extract_kpis_from_text(extracted_text)
-
-        # Step 4: Generate PDF Report
-        yield gr.update(value="### ⏳ Generating downloadable PDF report..."), None, gr.update(visible=False), gr.update(selected=0)
-        pdf_path = generate_pdf(summary, kpis, ratios)
-        if not os.path.exists(pdf_path):
-            raise FileNotFoundError("PDF report could not be generated. Please check server logs.")
-
-        # Step 5: Build Q&A Agent
-        yield gr.update(value="### ⏳ Building Q&A agent for interactive querying..."), None, gr.update(visible=False), gr.update(selected=0)
-        qa_agent = build_qa_chain_from_text(extracted_text)
-        print("✅ QA agent created successfully.")
-
-        # Prepare final output
-        output = f"### 📘 Executive Summary:\n\n{summary}\n"
-        output += "\n---\n\n### 📊 Key Financial KPIs:\n"
-        
-        if kpis:
-            for key, value in kpis.items():
-                # Format numbers for better readability
-                if isinstance(value, (int, float)):
-                    output += f"- **{key}**: {value:,.2f}\n"
-                else: # For N/A or non-numeric values
-                    output += f"- **{key}**: {value}\n"
-        else:
-            output += "⚠️ No significant financial KPIs could be extracted.\n"
+        # Steps 2-5 only depend on the extracted text, the KPIs and the Q&A index, so they run
+        # concurrently; each result is shown as soon as its stage finishes.
+        # A unique file per upload, so concurrent users never overwrite each other's download
+        report_path = new_report_path()
+        graph = TaskGraph(metric="upload_stage")
+        graph.add("summary", _summary_stage, args=(extracted_text, page_texts))
+        graph.add("ratios", compute_ratios, args=(kpis,))
+        graph.add("kpi_tables", _kpi_tables_stage, args=(uploaded_file_path, table_pages), optional=True, default="")
+        # The PDF report needs the summary and ratios; everything else is independent
+        graph.add("report", _report_stage, args=(kpis, report_path), deps=("summary", "ratios"))
+        # Chunks were already embedded during extraction; this saves the index and builds the chain
+        graph.add("qa_chain", qa_builder.build_chain)
+        if add_corpus:
+            graph.add("corpus", _corpus_stage, args=(qa_builder, os.path.basename(uploaded_file_path), company or "", period or "", extracted_text), deps=("qa_chain",), optional=True)
+
+        results = {}
+        for stage, result in graph.run():
+            results[stage] = result
+            if stage == "qa_chain":
+                # Questions can be asked while the summary is still being written
+                session.qa_agent = result
+                session.document_key = document_key
+                print("✅ QA agent created successfully.")
+            elif stage == "report":
+                session.set_report(result)
+            if len(results) < len(graph):
+                yield gr.update(value=_render_output(kpis, results, pending=len(graph) - len(results))), None, gr.update(visible=False), gr.update(selected=0)
+        if revision:
+            revision.save(extraction_key_for_file(uploaded_file_path, content_hash), qa_builder.index_key, kpis, kpi_pages)
+        metrics.observe("upload_stage_seconds", extraction_seconds, stage="extraction")
+        metrics.observe("upload_seconds", time.perf_counter() - upload_start)
+        metrics.log_event(
+            "upload_complete",
+            session=session.session_id,
+            file_type=os.path.splitext(uploaded_file_path)[1].lower(),
+            pages=page_count,
+            pages_reused=len(reused or {}),
+            seconds=round(time.perf_counter() - upload_start, 3),
+            stages={"extraction": round(extraction_seconds, 3), **{name: round(seconds, 3) for name, seconds in graph.timings.items()}},
+            peak_rss_mb=round(metrics.peak_rss_bytes() / 1048576, 1),
+        )
 
-
-        if ratios:
-            output += "\n### 📈 Financial Ratios:\n"
-            for key, value in ratios.items():
-                output += f"- **{key}**: {value}\n"
-        else:
-            output += "\n⚠️ No financial ratios found or computable."
-        
         # Return final state
-        yield gr.update(value=output), gr.update(value=pdf_path, visible=True), gr.update(visible=True), gr.update(selected=1)
+        yield gr.update(value=_render_output(kpis, results)), gr.update(value=results["report"], visible=True), gr.update(visible=True), gr.update(selected=1)
 
     except FileNotFoundError as e:
         error_msg = f"❌ File Error: {str(e)}"
         print(error_msg)
+        metrics.inc("upload_errors_total", kind="file")
         yield gr.update(value=error_msg), None, gr.update(visible=False), gr.update(selected=0)
     except ValueError as e:
         error_msg = f"❌ Data Error: {str(e)}"
         print(error_msg)
+        metrics.inc("upload_errors_total", kind="data")
         yield gr.update(value=error_msg), None, gr.update(visible=False), gr.update(selected=0)
     except RuntimeError as e:
         error_msg = f"❌ Processing Error: {str(e)}"
         print(error_msg)
+        metrics.inc("upload_errors_total", kind="processing")
         yield gr.update(value=error_msg), None, gr.update(visible=False), gr.update(selected=0)
     except Exception as e:
         error_msg = f"❌ An unexpected error occurred during upload: {str(e)}. Please try again or check server logs."
         print(error_msg)
+        metrics.inc("upload_errors_total", kind="unexpected")
         yield gr.update(value=error_msg), None, gr.update(visible=False), gr.update(selected=0)
 
 
 # --------------------------
 # 💬 Handle Q&A
 # --------------------------
-def answer_question(user_question):
-    global qa_agent
+def answer_question(user_question, scope, company, periods, request: gr.Request):
+    session = _session(request)
+    qa_agent, document_key = session.qa_agent, session.document_key
+
+    metrics.log_event("question", session=_session_id(request), chars=len(user_question), scope=scope)
+
+    if scope == CORPUS_SCOPE:
+        # Corpus questions go to every matching filing; the chain is cheap to build per question
+        # and the cache is skipped, since the corpus changes as documents are added
+        qa_agent, document_key = build_corpus_chain((company or "").strip() or None, parse_periods(periods)), None
 
-    print("📩 Question:", user_question)
-    
     if qa_agent is None:
         yield gr.update(value="❌ Please upload a file first and wait for processing to complete.")
         return
@@ -117,14 +283,36 @@ def answer_question(user_question):
         yield gr.update(value="❌ Please enter a valid question.")
         return
 
+    # Repeat (or near-identical) questions about this document are answered from the cache
+    cache = qa_cache.get_cache() if qa_cache.is_enabled() and document_key else None
+    if cache:
+        start = time.perf_counter()
+        try:
+            cached_answer = cache.get_answer(document_key, user_question, get_embeddings().embed_query)
+        except Exception as e:
+            print(f"Warning: Q&A cache lookup failed: {e}")
+            cached_answer = None
+        if cached_answer is not None:
+            metrics.log_event("qa_answer", session=_session_id(request), seconds=round(time.perf_counter() - start, 4), answer_chars=len(cached_answer), cached=True)
+            yield gr.update(value=f"### 🔍 Answer:\n\n{cached_answer}")
+            return
+
     # Show processing message
     yield gr.update(value="### ⏳ Getting answer...")
     
     try:
-        response = qa_agent.invoke({"query": user_question})
-        print("🤔 Raw LLM Response:", response)
+        start = time.perf_counter()
+        with metrics.span("qa_query"):
+            response = qa_agent.invoke({"query": user_question}, config={"callbacks": metrics_callbacks()})
 
         answer = response.get("result", "").strip()
+        metrics.log_event(
+            "qa_answer",
+            session=_session_id(request),
+            seconds=round(time.perf_counter() - start, 3),
+            answer_chars=len(answer),
+            sources=len(response.get("source_documents", [])),
+        )
 
         if not answer or answer == "I am sorry, but the answer to your question is not available in the provided document excerpts.":
             final_answer_display = "### 🔍 Answer:\n\n" + "I am sorry, but the answer to your question is not available in the provided document excerpts or cannot be reliably determined from the document."
@@ -132,6 +320,8 @@ def answer_question(user_question):
             return
 
         final_answer_display = f"### 🔍 Answer:\n\n{answer}"
+        if cache:
+            cache.put_answer(document_key, user_question, answer, get_embeddings().embed_query)
         
         # --- REMOVED / COMMENTED OUT THE SOURCE DISPLAY SECTION ---
         # source_docs = response.get("source_documents", [])
@@ -141,81 +331,112 @@ def answer_question(user_question):
         #         content_preview = doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
         #         final_answer_display += f"- Source {i+1}: \"{content_preview}\"\n"
 
-        # Debugging prints (you can remove these once confirmed working)
-        print(f"DEBUG: Final answer display content length: {len(final_answer_display)}")
-        print(f"DEBUG: Final answer display content (first 500 chars): {final_answer_display[:500]}")
-        
         yield gr.update(value=final_answer_display)
 
     except Exception as e:
         print("❌ QA error:", e)
+        metrics.inc("qa_errors_total")
         yield gr.update(value=f"❌ Error answering question: {str(e)}. Please try re-uploading the document or a different question.")
 
 # --------------------------
 # ⬆️ Reset Handler
 # --------------------------
-def reset_all():
-    global qa_agent, uploaded_file_path
-    qa_agent = None
-    uploaded_file_path = None
+def reset_all(request: gr.Request):
+    _session(request).clear()
     # Reset all relevant UI components
     return gr.update(value=""), None, gr.update(value="", visible=False), gr.File(value=None), gr.update(value="")
 
+def close_session(request: gr.Request):
+    session_id = _session_id(request)
+    if session_id:
+        sessions.drop(session_id)
+
 # --------------------------
 # 🎨 Gradio UI
 # --------------------------
-with gr.Blocks(css="""
-    .gr-box { border-width: 1px !important; }
-    .gradio-container { padding: 1rem !important; }
-    .gr-button { font-weight: bold; }
-    h3 { margin-top: 1.5rem; }
-""") as demo:
-    gr.Markdown("# 🤔 Financial Document Analyzer") # Updated project name here
-    gr.Markdown("Upload a financial file (PDF, Word, Excel, TXT, or Image) to get an AI-generated executive summary, KPIs, and ask questions.")
-
-    tab_state = gr.State(0)
-
-    with gr.Tab("📄 Upload & Summary", id="upload_tab"):
-        file_input = gr.File(label="📄 Upload Financial File", file_types=[".pdf", ".docx", ".txt", ".xls", ".xlsx", ".png", ".jpg", ".jpeg", ".tiff", ".bmp"])
-        submit_upload = gr.Button("🚀 Submit")
-        output_display = gr.Markdown()
-        pdf_download = gr.File(label="📅 Download AI Report", visible=False, file_count="single")
-        reset_button_upload = gr.Button("🔄 Reset")
-
-    with gr.Tab("💬 Ask a Question", id="qa_tab"):
-        user_input = gr.Textbox(label=None, placeholder="E.g., What was the net profit?", lines=2)
-        ask_button = gr.Button("🔍 Get Answer")
-        answer_display = gr.Markdown()
-        reset_button_question = gr.Button("🔄 Reset")
-
-    # Connect components
-    submit_upload.click(
-        fn=handle_upload,
-        inputs=[file_input],
-        outputs=[output_display, pdf_download, pdf_download, tab_state],
-        show_progress="hidden"
-    )
-
-    ask_button.click(
-        fn=answer_question,
-        inputs=[user_input],
-        outputs=[answer_display],
-        show_progress="hidden"
-    )
-    
-    # Input clearing for Q&A (currently commented out based on your preference)
-    # ask_button.click(lambda: "", outputs=[user_input], queue=False)
-
-    reset_button_upload.click(
-        fn=reset_all,
-        inputs=[],
-        outputs=[output_display, pdf_download, answer_display, file_input, user_input]
-    )
-
-    reset_button_question.click(
-        fn=reset_all,
-        inputs=[],
-        outputs=[output_display, pdf_download, answer_display, file_input, user_input]
-    )
-
-    demo.launch()
+def build_demo():
+    """
+    Builds the Gradio UI. Called only when app.py runs as a script: extraction and report workers
+    are started with "spawn", which re-imports the main module in every worker process, and they
+    must not build a UI each.
+    """
+    with gr.Blocks(css="""
+        .gr-box { border-width: 1px !important; }
+        .gradio-container { padding: 1rem !important; }
+        .gr-button { font-weight: bold; }
+        h3 { margin-top: 1.5rem; }
+    """) as demo:
+        gr.Markdown("# 🤔 Financial Document Analyzer") # Updated project name here
+        gr.Markdown("Upload a financial file (PDF, Word, Excel, TXT, or Image) to get an AI-generated executive summary, KPIs, and ask questions.")
+
+        tab_state = gr.State(0)
+
+        with gr.Tab("📄 Upload & Summary", id="upload_tab"):
+            file_input = gr.File(label="📄 Upload Financial File", file_types=[".pdf", ".docx", ".txt", ".xls", ".xlsx", ".png", ".jpg", ".jpeg", ".tiff", ".bmp"])
+            with gr.Row():
+                corpus_checkbox = gr.Checkbox(label="📚 Add to the shared corpus", value=False)
+                company_input = gr.Textbox(label="Company (optional)", placeholder="Guessed from the file name")
+                period_input = gr.Textbox(label="Fiscal year (optional)", placeholder="Guessed from the file")
+            submit_upload = gr.Button("🚀 Submit")
+            output_display = gr.Markdown()
+            pdf_download = gr.File(label="📅 Download AI Report", visible=False, file_count="single")
+            reset_button_upload = gr.Button("🔄 Reset")
+
+        with gr.Tab("💬 Ask a Question", id="qa_tab"):
+            user_input = gr.Textbox(label=None, placeholder="E.g., What was the net profit?", lines=2)
+            with gr.Row():
+                scope_input = gr.Radio([DOCUMENT_SCOPE, CORPUS_SCOPE], value=DOCUMENT_SCOPE, label="Search in")
+                company_filter = gr.Textbox(label="Company filter (corpus)", placeholder="E.g., BMW")
+                period_filter = gr.Textbox(label="Years (corpus)", placeholder="E.g., 2019-2023")
+            ask_button = gr.Button("🔍 Get Answer")
+            answer_display = gr.Markdown()
+            reset_button_question = gr.Button("🔄 Reset")
+
+        # Connect components
+        submit_upload.click(
+            fn=handle_upload,
+            inputs=[file_input, corpus_checkbox, company_input, period_input],
+            api_name="handle_upload",
+            outputs=[output_display, pdf_download, pdf_download, tab_state],
+            show_progress="hidden",
+            concurrency_limit=UPLOAD_CONCURRENCY,
+            concurrency_id="upload"
+        )
+
+        ask_button.click(
+            fn=answer_question,
+            inputs=[user_input, scope_input, company_filter, period_filter],
+            api_name="answer_question",
+            outputs=[answer_display],
+            show_progress="hidden",
+            concurrency_limit=QA_CONCURRENCY,
+            concurrency_id="qa"
+        )
+
+        # Input clearing for Q&A (currently commented out based on your preference)
+        # ask_button.click(lambda: "", outputs=[user_input], queue=False)
+
+        reset_button_upload.click(
+            fn=reset_all,
+            inputs=[],
+            outputs=[output_display, pdf_download, answer_display, file_input, user_input]
+        )
+
+        reset_button_question.click(
+            fn=reset_all,
+            inputs=[],
+            outputs=[output_display, pdf_download, answer_display, file_input, user_input]
+        )
+
+        # Free a session's Q&A chain and report as soon as its browser tab is closed
+        demo.unload(close_session)
+
+    demo.queue(max_size=QUEUE_MAX_SIZE)
+    return demo
+
+
+if __name__ == "__main__":
+    metrics.start_metrics_server()
+    if os.getenv("WARMUP_ON_START", "0") == "1":
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    build_demo().launch()
@@ -0,0 +1,290 @@
+"""
+Headless batch mode: analyzes every supported file in a directory (or listed in a manifest) and
+writes one JSON result per document (KPIs, ratios, KPIs by period, summary, report path),
+optionally as Parquet too.
+
+Results are named after the file's content hash and written atomically, so an interrupted run
+can simply be started again: documents that already have a result are skipped.
+
+    python batch.py filings/ --out results/
+    python batch.py manifest.txt --out results/ --workers 4 --parquet
+    python batch.py filings/ --out results/ --no-summary --retry-failed
+    python batch.py filings/ --out results/ --corpus      # also add every filing to the Q&A corpus
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from dotenv import load_dotenv
+
+from utils.disk_cache import file_sha256
+
+load_dotenv()
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".xls", ".xlsx", ".png", ".jpg", ".jpeg", ".tiff", ".bmp"}
+
+
+# --------------------------
+# 📂 Inputs
+# --------------------------
+def collect_inputs(source, recursive=False):
+    """Files to process: the supported files in a directory, or the paths listed in a manifest (one per line)."""
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files))
+            if not recursive:
+                break
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+        paths = [line if os.path.isabs(line) else os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+    return [path for path in paths if os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS]
+
+
+def result_name(file_path, content_hash):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return f"{stem}-{content_hash[:12]}"
+
+
+def _load_result(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    # Write to a temp file and rename, so a crash never leaves a truncated result behind
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# --------------------------
+# ⚙️ Worker
+# --------------------------
+def _init_worker():
+    # Documents are processed in parallel, so keep torch single-threaded in each worker. Set through
+    # the environment, which torch reads when it is imported, so a worker only imports torch if a
+    # document needs OCR or embeddings.
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = "1"
+
+
+def _kpis_by_period(file_path):
+    from utils.kpi_tables import compute_period_ratios, extract_kpi_matrix
+
+    matrix = extract_kpi_matrix(file_path)
+    if matrix.empty:
+        return {}, {}
+    return _frame_to_dict(matrix), _frame_to_dict(compute_period_ratios(matrix))
+
+
+def _frame_to_dict(frame):
+    # {period: {kpi: value}}, with NaN -> None so the JSON stays valid
+    return {str(period): {kpi: (None if value != value else value) for kpi, value in column.items()} for period, column in frame.items()}
+
+
+def _build_index(file_path, content_hash, pages):
+    # Persisted in the index store; the parent process copies it into the corpus
+    from utils.qa_agent import QAIndexBuilder, index_key_for_file
+
+    builder = QAIndexBuilder(index_key=index_key_for_file(file_path, content_hash))
+    for page in pages:
+        builder.add_page(page)
+    builder.build_index()
+    return builder.index_key
+
+
+def process_document(file_path, content_hash, out_dir, with_summary=True, with_index=False):
+    """Runs the analysis pipeline on one document. Never raises: failures are returned as status "error"."""
+    from utils.corpus import guess_period
+    from utils.extract_text import iter_pages_from_file
+    from utils.parse_kpis import extract_kpis_from_text
+    from utils.pdf_report import generate_pdf
+    from utils.summarize import generate_financial_summary
+
+    result = {"file": os.path.abspath(file_path), "sha256": content_hash, "status": "ok", "seconds": {}}
+    start = time.perf_counter()
+
+    def stage(name, fn, *args, **kwargs):
+        stage_start = time.perf_counter()
+        value = fn(*args, **kwargs)
+        result["seconds"][name] = round(time.perf_counter() - stage_start, 3)
+        return value
+
+    try:
+        # One document per worker process: extract its pages in-process rather than in a nested pool
+        pages = stage("extract", lambda: list(iter_pages_from_file(file_path, workers=1, content_hash=content_hash)))
+        page_texts = [page.text for page in pages if page.text]
+        text = "\n".join(page_texts).strip()
+        kpis, ratios = stage("kpis", extract_kpis_from_text, text)
+        try:
+            kpis_by_period, ratios_by_period = stage("kpi_tables", _kpis_by_period, file_path)
+        except Exception as e:
+            print(f"Warning: multi-period KPI table extraction failed for {file_path}: {e}")
+            kpis_by_period, ratios_by_period = {}, {}
+        summary = stage("summary", generate_financial_summary, text, pages=page_texts) if with_summary else ""
+        if with_summary and (not summary or "Error generating summary" in summary):
+            raise RuntimeError(f"Failed to generate summary: {summary}")
+        report_path = os.path.join(out_dir, "reports", result_name(file_path, content_hash) + ".pdf")
+        stage("report", generate_pdf, summary, kpis, ratios, report_path)
+        if with_index:
+            result["index_key"] = stage("index", _build_index, file_path, content_hash, pages)
+            result["period"] = guess_period(file_path, text)
+
+        result.update({
+            "kpis": kpis,
+            "ratios": ratios,
+            "kpis_by_period": kpis_by_period,
+            "ratios_by_period": ratios_by_period,
+            "summary": summary,
+            "report_path": report_path,
+        })
+    except Exception as e:
+        result.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    result["seconds"]["total"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+# --------------------------
+# 💾 Outputs
+# --------------------------
+def _add_to_corpus(result):
+    # In the parent process only: the corpus catalog is a single file
+    from utils.corpus import get_corpus
+    from utils.embeddings import EMBEDDING_MODEL_NAME
+
+    entry = get_corpus().add_from_store(result["index_key"], result["file"], period=result.get("period", ""), embedding_model=EMBEDDING_MODEL_NAME)
+    if entry is None:
+        print(f"Warning: {os.path.basename(result['file'])} was not added to the corpus (its index wasn't persisted; is INDEX_STORE disabled?).")
+
+
+def _resume_corpus(path, previous, out_dir):
+    """
+    For a document with an ok result from an earlier run: makes sure it is in the corpus, from its
+    persisted index. Returns False when the index has to be built first (the earlier run had no
+    --corpus, or crashed before indexing, and the index store doesn't have it).
+    """
+    from utils import index_store
+    from utils.corpus import get_corpus, guess_period
+    from utils.qa_agent import index_key_for_file
+
+    key = previous.get("index_key") or index_key_for_file(path, previous["sha256"])
+    if key in get_corpus():
+        return True
+    if not index_store.exists(key):
+        return False
+    result = dict(previous, index_key=key, period=previous.get("period") or guess_period(path))
+    _add_to_corpus(result)
+    if result != previous:
+        save_result(result, out_dir)
+    return True
+
+
+_parquet_warned = False
+
+
+def save_result(result, out_dir, parquet=False):
+    global _parquet_warned
+    name = result_name(result["file"], result["sha256"])
+    json_path = os.path.join(out_dir, name + ".json")
+
+    def write_json(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    if parquet and result["status"] == "ok":
+        try:
+            import pandas as pd
+
+            row = {key: result[key] for key in ("file", "sha256", "status", "summary", "report_path")}
+            row.update({f"kpi_{key}": value for key, value in result["kpis"].items()})
+            # Ratios hold "N/A (...)" strings when they can't be computed; keep the column numeric
+            row.update({f"ratio_{key}": value if isinstance(value, (int, float)) else None for key, value in result["ratios"].items()})
+            frame = pd.DataFrame([row])
+            _write_atomic(os.path.join(out_dir, name + ".parquet"), lambda path: frame.to_parquet(path, index=False))
+        except ImportError as e:
+            if not _parquet_warned:
+                print(f"Warning: Parquet output needs pandas and pyarrow, writing JSON only. Error: {e}")
+                _parquet_warned = True
+    # JSON is written last: its presence marks the document as done when a run is resumed
+    _write_atomic(json_path, write_json)
+    return json_path
+
+
+# --------------------------
+# 🚀 Main
+# --------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of filings, or a manifest file with one path per line")
+    parser.add_argument("--out", default="batch_results", help="output directory")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="documents processed in parallel")
+    parser.add_argument("--recursive", action="store_true", help="include subdirectories")
+    parser.add_argument("--parquet", action="store_true", help="also write a one-row Parquet file per document")
+    parser.add_argument("--no-summary", action="store_true", help="skip the LLM summary (offline runs)")
+    parser.add_argument("--retry-failed", action="store_true", help="reprocess documents whose previous result is an error")
+    parser.add_argument("--corpus", action="store_true", help="also build each document's Q&A index and add it to the corpus")
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.join(args.out, "reports"), exist_ok=True)
+    paths = collect_inputs(args.source, recursive=args.recursive)
+
+    # Resume: skip documents whose content already has a result (with --corpus, once they are in
+    # the corpus too)
+    todo, skipped = [], 0
+    for path in paths:
+        content_hash = file_sha256(path)
+        previous = _load_result(os.path.join(args.out, result_name(path, content_hash) + ".json"))
+        if args.corpus and previous and previous.get("status") == "ok" and not _resume_corpus(path, previous, args.out):
+            previous = None # processed without its Q&A index: run it again to build one
+        if previous and (previous.get("status") == "ok" or not args.retry_failed):
+            skipped += 1
+            continue
+        todo.append((path, content_hash))
+    print(f"📂 {len(paths)} document(s) found, {skipped} already processed, {len(todo)} to go.")
+    if not todo:
+        return 0
+
+    start = time.perf_counter()
+    done = failed = 0
+    # "spawn": the workers load torch/EasyOCR, which isn't fork-safe once threads are running
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=get_context("spawn"), initializer=_init_worker) as pool:
+        futures = {pool.submit(process_document, path, content_hash, args.out, not args.no_summary, args.corpus): (path, content_hash) for path, content_hash in todo}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e: # the worker process itself died
+                path, content_hash = futures[future]
+                result = {"file": os.path.abspath(path), "sha256": content_hash, "status": "error", "error": f"{type(e).__name__}: {e}", "seconds": {}}
+            if args.corpus and result.get("index_key"):
+                _add_to_corpus(result)
+            save_result(result, args.out, parquet=args.parquet)
+            done += 1
+            failed += result["status"] != "ok"
+            rate = done / (time.perf_counter() - start) * 60
+            status = "✅" if result["status"] == "ok" else f"❌ {result.get('error')}"
+            print(f"[{done}/{len(todo)}] {os.path.basename(result['file'])} {status} ({result['seconds'].get('total', 0):.1f}s, {rate:.1f} docs/min)")
+
+    elapsed = time.perf_counter() - start
+    print(f"🏁 {done - failed} succeeded, {failed} failed in {elapsed:.1f}s ({done / elapsed * 60:.1f} docs/min). Results in {args.out}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
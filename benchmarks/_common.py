@@ -0,0 +1,10 @@
+"""Helpers shared by the benchmark scripts."""
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
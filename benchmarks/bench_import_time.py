@@ -0,0 +1,86 @@
+"""
+Import-time / cold-start benchmark.
+
+Every scenario runs in a fresh interpreter and reports wall-clock time and peak RSS,
+so the numbers reflect what a new worker process pays before doing any real work.
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --repo /path/to/older/checkout --json before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> code executed in the child after the timer starts
+SCENARIOS = {
+    "import utils.extract_text": "import utils.extract_text",
+    "import utils.qa_agent": "import utils.qa_agent",
+    "import utils.summarize": "import utils.summarize",
+    "import utils.parse_kpis": "import utils.parse_kpis",
+    "import utils.pdf_report": "import utils.pdf_report",
+    "extract .txt file": (
+        "from utils.extract_text import extract_text_from_file\n"
+        "extract_text_from_file(SAMPLE_TXT, use_cache=False)"
+    ),
+}
+
+CHILD_TEMPLATE = """
+import os, resource, sys, time
+sys.path.insert(0, {repo!r})
+os.chdir({repo!r})
+SAMPLE_TXT = {sample!r}
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss_kb)
+"""
+
+
+def run_scenario(repo, code, sample_txt):
+    child = CHILD_TEMPLATE.format(repo=repo, sample=sample_txt, code=code)
+    result = subprocess.run([sys.executable, "-c", child], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+    elapsed, rss_kb = result.stdout.strip().splitlines()[-1].split()
+    return float(elapsed), int(rss_kb) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=REPO_ROOT, help="checkout to benchmark (default: this one)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per scenario")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    sample_txt = os.path.join(args.repo, ".cache", "bench_sample.txt")
+    os.makedirs(os.path.dirname(sample_txt), exist_ok=True)
+    with open(sample_txt, "w", encoding="utf-8") as f:
+        f.write("Total assets 1,000\nTotal liabilities 400\n")
+
+    results = {}
+    print(f"{'scenario':<28} {'median s':>10} {'peak RSS MB':>12}")
+    for name, code in SCENARIOS.items():
+        try:
+            runs = [run_scenario(args.repo, code, sample_txt) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{name:<28} {'failed':>10}  ({e})")
+            results[name] = {"error": str(e)}
+            continue
+        seconds = statistics.median(r[0] for r in runs)
+        rss_mb = statistics.median(r[1] for r in runs)
+        results[name] = {"seconds": seconds, "peak_rss_mb": rss_mb, "runs": args.repeat}
+        print(f"{name:<28} {seconds:>10.3f} {rss_mb:>12.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"repo": os.path.abspath(args.repo), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
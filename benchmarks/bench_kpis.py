@@ -0,0 +1,191 @@
+"""
+KPI scanner benchmark: the single-pass scanner in utils/parse_kpis.py against the previous
+implementation (one finditer() per KPI, multiplier regexes compiled per value, rfind/find
+line slicing), which is kept below as the baseline.
+
+Checks that both return identical KPIs on every input, then reports the speedup.
+Inputs are the bundled sample_docs (when the extraction dependencies are installed) and
+synthetic filings of a few sizes.
+
+    python benchmarks/bench_kpis.py
+    python benchmarks/bench_kpis.py --size-mb 2 --repeat 5 --json kpis.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.parse_kpis import scan_kpis  # noqa: E402
+
+
+# --------------------------
+# Baseline (previous implementation)
+# --------------------------
+def _legacy_normalize_value(value_str, text_context=""):
+    value = value_str.replace(",", "").strip()
+    if value.startswith("(") and value.endswith(")"):
+        value = "-" + value[1:-1]
+    try:
+        numeric_value = float(value)
+    except ValueError:
+        return None
+    text_context_lower = text_context.lower()
+    if re.search(r'\b(in thousands|\d{3}s?|k)\b', text_context_lower):
+        numeric_value *= 1_000
+    elif re.search(r'\b(in millions|mm|m)\b', text_context_lower) and not re.search(r'\bper square metre\b', text_context_lower):
+        numeric_value *= 1_000_000
+    elif re.search(r'\b(in billions|bn|b)\b', text_context_lower):
+        numeric_value *= 1_000_000_000
+    return numeric_value
+
+
+_LEGACY_PATTERNS = {
+    "Total Assets": r"(?:Total assets|Assets, total|Total Current and Non-current Assets)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Total Liabilities": r"(?:Total liabilities|Liabilities, total|Total Current and Non-current Liabilities)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Equity": r"(?:Shareholders' equity|Total equity|Equity attributable to(?: parent| owners)?)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Cash": r"Cash (?:and cash equivalents)?\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Net Profit": r"(?:Net income|Profit(?: and loss)?|Net earnings)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Revenue": r"(?:Total net sales|Revenue|Sales)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Current Assets": r"(?:Total current assets|Current assets, total)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Current Liabilities": r"(?:Total current liabilities|Current liabilities, total)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+}
+
+
+def legacy_scan_kpis(text):
+    kpis = {}
+    for key, pattern in _LEGACY_PATTERNS.items():
+        for match in re.finditer(pattern, text, flags=re.IGNORECASE):
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            line_end = text.find('\n', match.end())
+            if line_end == -1:
+                line_end = len(text)
+            normalized_value = _legacy_normalize_value(match.group(1), text[line_start:line_end])
+            if normalized_value is not None:
+                kpis[key] = normalized_value
+                break
+    return kpis
+
+
+# --------------------------
+# Inputs
+# --------------------------
+_FILLER = [
+    "The Group continued to invest in research and development during the reporting period.",
+    "Revenue recognition follows IFRS 15; see note 7 for the disaggregation by segment.",
+    "Sales volumes in the Asia region increased compared with the previous year.",
+    "Profit before tax was affected by currency translation effects of € (120) million.",
+    "Cash flows from operating activities: see consolidated cash flow statement.",
+    "Trade receivables | 1,204 | 1,187 | 1,022",
+    "Other provisions  .......  :  n/a",
+]
+_KPI_LINES = [
+    "Total assets  ..........  {v} in millions",
+    "Total liabilities   {v}",
+    "Total equity   ({v})",
+    "Cash and cash equivalents   {v}",
+    "Net income {v} bn",
+    "Total net sales   {v}",
+    "Total current assets   {v}",
+    "Total current liabilities {v} K",
+]
+
+
+def synthetic_filing(size_bytes, seed=0, kpi_every=None, drop=()):
+    """
+    Deterministic synthetic filing text of about size_bytes. KPI lines are placed roughly every
+    kpi_every lines (default: only in the last tenth, the worst case for first-match scanning);
+    labels listed in drop never appear, forcing full scans for those KPIs.
+    """
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    kpi_lines = [line for line in _KPI_LINES if not any(d in line for d in drop)]
+    while size < size_bytes:
+        if kpi_every:
+            use_kpi = rng.randrange(kpi_every) == 0
+        else:
+            use_kpi = size > size_bytes * 0.9 and rng.randrange(20) == 0
+        if use_kpi and kpi_lines:
+            line = rng.choice(kpi_lines).format(v=f"{rng.randrange(1, 999_999):,}")
+        else:
+            line = rng.choice(_FILLER)
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def sample_doc_texts():
+    texts = {}
+    try:
+        from utils.extract_text import extract_text_from_file
+    except ImportError as e:
+        print(f"Skipping sample_docs: {e}")
+        return texts
+    for name in ("BMW.pdf", "BMW.xlsx"):
+        path = os.path.join(REPO_ROOT, "sample_docs", name)
+        try:
+            texts[f"sample_docs/{name}"] = extract_text_from_file(path)
+        except Exception as e:
+            print(f"Skipping sample_docs/{name}: {e}")
+    return texts
+
+
+def best_of(fn, text, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=2.0, help="size of the largest synthetic filing")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    inputs = sample_doc_texts()
+    inputs.update({
+        f"synthetic {args.size_mb:g} MB, KPIs near the end": synthetic_filing(size),
+        f"synthetic {args.size_mb:g} MB, two KPIs missing": synthetic_filing(size, seed=1, drop=("Total current", "Net income")),
+        f"synthetic {args.size_mb / 4:g} MB, KPIs throughout": synthetic_filing(size // 4, seed=2, kpi_every=50),
+    })
+
+    results = {}
+    mismatches = 0
+    print(f"{'input':<48} {'legacy ms':>10} {'scanner ms':>11} {'speedup':>8}  equal")
+    for name, text in inputs.items():
+        legacy_s, legacy_kpis = best_of(legacy_scan_kpis, text, args.repeat)
+        new_s, new_kpis = best_of(lambda t: scan_kpis(t, {}), text, args.repeat)
+        equal = legacy_kpis == new_kpis
+        mismatches += not equal
+        speedup = legacy_s / new_s if new_s else float("inf")
+        results[name] = {
+            "bytes": len(text.encode("utf-8")),
+            "legacy_seconds": legacy_s,
+            "scanner_seconds": new_s,
+            "speedup": speedup,
+            "equal": equal,
+        }
+        print(f"{name:<48} {legacy_s * 1000:>10.1f} {new_s * 1000:>11.1f} {speedup:>7.1f}x  {equal}")
+        if not equal:
+            print(f"    legacy:  {legacy_kpis}\n    scanner: {new_kpis}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+LLM client benchmark against a local mock of the Groq chat completions API that rate-limits
+(token bucket of --server-rps requests/sec, 429 with Retry-After and x-ratelimit-* headers) and
+fails a share of requests with 503.
+
+Compares unmanaged requests (one shot each, no limiter, as when a rate limit was reported straight
+to the user) with the shared client in utils/llm_client.py (pooled connections, jittered retries,
+adaptive limiter, in-flight deduplication), at several concurrency levels. Reports completed and
+failed requests, p50/p95 latency, throughput and the requests the server actually received.
+
+    python benchmarks/bench_llm_client.py
+    python benchmarks/bench_llm_client.py --requests 200 --concurrency 4 16 64 --server-rps 20 --duplicates 0.3 --json llm.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _common import percentile # benchmarks/ is on sys.path when a script here is run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("METRICS_LOG", "0")
+
+from utils import llm_client  # noqa: E402
+
+
+# --------------------------
+# Mock server
+# --------------------------
+class MockGroqServer:
+    """Chat completions endpoint with a requests-per-second token bucket, latency and random 503s."""
+
+    def __init__(self, rps, burst, latency, error_rate, seed=0):
+        self.rps = rps
+        self.burst = burst
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.level = float(burst)
+        self.updated = time.monotonic()
+        self.counts = {"received": 0, "ok": 0, "429": 0, "503": 0}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/openai/v1"
+
+    def _admit(self):
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.burst, self.level + (now - self.updated) * self.rps)
+            self.updated = now
+            self.counts["received"] += 1
+            if self.random.random() < self.error_rate:
+                self.counts["503"] += 1
+                return 503, self.level
+            if self.level < 1:
+                self.counts["429"] += 1
+                return 429, self.level
+            self.level -= 1
+            self.counts["ok"] += 1
+            return 200, self.level
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, so connection pooling shows
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                status, level = server._admit()
+                headers = {
+                    "x-ratelimit-limit-requests": str(server.burst),
+                    "x-ratelimit-remaining-requests": str(max(0, int(level))),
+                    "x-ratelimit-reset-requests": f"{(server.burst - level) / server.rps:.2f}s",
+                }
+                if status == 200:
+                    time.sleep(server.latency)
+                    prompt = payload["messages"][-1]["content"]
+                    body = {
+                        "choices": [{"message": {"role": "assistant", "content": f"Answer to: {prompt[:40]}"}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4 + 1, "completion_tokens": 8},
+                    }
+                elif status == 429:
+                    headers["retry-after"] = f"{(1 - level) / server.rps:.2f}"
+                    body = {"error": {"message": "Rate limit reached for requests", "type": "requests"}}
+                else:
+                    body = {"error": {"message": "Service unavailable"}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def reset(self):
+        with self.lock:
+            self.level = float(self.burst)
+            self.updated = time.monotonic()
+            self.counts = {key: 0 for key in self.counts}
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+# --------------------------
+# Clients
+# --------------------------
+def unmanaged_sender(url):
+    import httpx
+
+    def send(payload):
+        # One shot on a fresh connection; any error goes straight back to the caller
+        response = httpx.post(f"{url}/chat/completions", json=payload, timeout=llm_client.LLM_TIMEOUT)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.json()
+    return send, lambda: None
+
+
+def managed_sender(url, concurrency):
+    client = llm_client.LLMClient(api_key="bench", base_url=url, limiter=llm_client.RateLimiter(max_concurrency=concurrency))
+    return client.request, client.close
+
+
+# --------------------------
+# Measurement
+# --------------------------
+def workload(count, duplicates, seed=0):
+    rng = random.Random(seed)
+    prompts = []
+    for i in range(count):
+        # A share of requests repeats a recent prompt, as when several users ask the same question
+        if prompts and rng.random() < duplicates:
+            prompts.append(rng.choice(prompts[-8:]))
+        else:
+            prompts.append(f"Question {i}: what was the net profit in the period?")
+    return [{"model": "llama3-8b-8192", "messages": [{"role": "user", "content": prompt}], "max_tokens": 64} for prompt in prompts]
+
+
+def run(label, send, close, payloads, concurrency, server):
+    server.reset()
+    latencies, failures = [], 0
+
+    def one(payload):
+        start = time.perf_counter()
+        try:
+            send(payload)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for seconds, error in pool.map(one, payloads):
+            if error is None:
+                latencies.append(seconds)
+            else:
+                failures += 1
+    elapsed = time.perf_counter() - start
+    close()
+    result = {
+        "completed": len(latencies),
+        "failed": failures,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "server": dict(server.counts),
+    }
+    print(f"{label:<28} {concurrency:>5} {result['completed']:>9} {failures:>7} {result['p50']:>8.3f} {result['p95']:>8.3f} "
+          f"{result['throughput']:>9.1f} {server.counts['received']:>9} {server.counts['429']:>6}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=120, help="requests per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64], help="concurrent callers")
+    parser.add_argument("--server-rps", type=float, default=20.0, help="requests/sec the mock server admits")
+    parser.add_argument("--server-burst", type=int, default=10, help="mock server bucket size")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock completion latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of requests answered with 503")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of requests repeating a recent prompt")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    server = MockGroqServer(args.server_rps, args.server_burst, args.latency, args.error_rate).start()
+    payloads = workload(args.requests, args.duplicates)
+    results = {}
+    print(f"{'client':<28} {'conc':>5} {'completed':>9} {'failed':>7} {'p50':>8} {'p95':>8} {'req/s':>9} {'received':>9} {'429s':>6}")
+    try:
+        for concurrency in args.concurrency:
+            results[f"unmanaged@{concurrency}"] = run("unmanaged (no retry)", *unmanaged_sender(server.url), payloads, concurrency, server)
+            results[f"llm_client@{concurrency}"] = run("llm_client", *managed_sender(server.url, concurrency), payloads, concurrency, server)
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+PDF report benchmark: throughput (reports/sec) of the Platypus renderer in utils/pdf_report.py,
+rendering one report at a time and concurrently on the report pool. The previous single-page
+canvas implementation is kept below as the baseline. It clips long summaries instead of flowing
+them onto more pages, so its page count is reported too.
+
+    python benchmarks/bench_reports.py
+    python benchmarks/bench_reports.py --reports 100 --summary-lines 300 --workers 4 --json reports.json
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils import pdf_report  # noqa: E402
+
+
+# --------------------------
+# Baseline (previous implementation)
+# --------------------------
+def legacy_generate_pdf(summary, kpis, ratios, output_path="financial_report.pdf"):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(output_path, pagesize=letter)
+    width, height = letter
+    margin = 40
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width / 2, height - 50, "Smart Financial Summary Agent")
+    c.setFont("Helvetica", 10)
+    c.drawString(margin, height - 70, f"Generated on: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    text = c.beginText(margin, height - 100)
+    text.setFont("Helvetica-Bold", 12)
+    text.textLine("Executive Summary")
+    text.setFont("Helvetica", 11)
+    for line in re.sub(r"\*\*(.*?)\*\*", r"\1", summary).strip().split("\n"):
+        text.textLine(line)
+    text.textLine("")
+    text.setFont("Helvetica-Bold", 12)
+    text.textLine("Key Financial KPIs")
+    text.setFont("Helvetica", 11)
+    for key, value in kpis.items():
+        text.textLine(f"- {key}: {value:,.2f}")
+    text.textLine("")
+    text.setFont("Helvetica-Bold", 12)
+    text.textLine("Financial Ratios")
+    text.setFont("Helvetica", 11)
+    for key, value in ratios.items():
+        text.textLine(f"- {key}: {value}")
+    c.drawText(text)
+    c.showPage()
+    c.save()
+    return output_path
+
+
+# --------------------------
+# Inputs
+# --------------------------
+_SENTENCES = [
+    "Revenue grew by **8.4%** year over year, driven by higher volumes in the premium segment and favourable pricing.",
+    "The EBIT margin in the Automotive segment came in at 9.8%, within the guided corridor.",
+    "Free cash flow remained strong despite elevated investment in electrification and software.",
+    "Net debt decreased as operating cash flows exceeded capital expenditure and dividend payments.",
+    "Currency headwinds weighed on reported figures, particularly the weaker Chinese renminbi.",
+]
+
+
+def synthetic_report(summary_lines, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(summary_lines):
+        if i % 25 == 0:
+            lines.append(f"### Section {i // 25 + 1}")
+        elif i % 5 == 0:
+            lines.append("- " + rng.choice(_SENTENCES))
+        else:
+            lines.append(" ".join(rng.choice(_SENTENCES) for _ in range(2)))
+    kpis = {name: rng.uniform(1e6, 1e9) for name in (
+        "Total Assets", "Total Liabilities", "Equity", "Cash", "Net Profit", "Revenue", "Current Assets", "Current Liabilities")}
+    ratios = {"Current Ratio": 1.24, "Debt to Equity": 2.8, "Net Profit Margin": "7.10%", "Return on Equity": "N/A (Equity not found)"}
+    return "\n".join(lines), kpis, ratios
+
+
+def page_count(path):
+    with open(path, "rb") as f:
+        return len(re.findall(rb"/Type\s*/Page[^s]", f.read()))
+
+
+def run(label, render, reports, out_dir):
+    start = time.perf_counter()
+    paths = render(reports, out_dir)
+    elapsed = time.perf_counter() - start
+    result = {
+        "reports": len(reports),
+        "seconds": elapsed,
+        "reports_per_sec": len(reports) / elapsed if elapsed else float("inf"),
+        "pages": page_count(paths[0]),
+    }
+    print(f"{label:<34} {result['reports_per_sec']:>12.1f} {elapsed:>9.2f} {result['pages']:>6}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=50, help="reports rendered per variant")
+    parser.add_argument("--summary-lines", type=int, default=120, help="summary length (the legacy renderer clips beyond ~50)")
+    parser.add_argument("--workers", type=int, default=pdf_report.REPORT_WORKERS, help="report pool processes for the concurrent run")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    pdf_report.REPORT_WORKERS = args.workers
+    reports = [synthetic_report(args.summary_lines, seed=i) for i in range(args.reports)]
+    pdf_report.generate_pdf(*reports[0], output_path=os.path.join(tempfile.gettempdir(), "bench_warmup.pdf")) # fonts, styles, imports
+
+    def legacy(reports, out_dir):
+        return [legacy_generate_pdf(*report, output_path=os.path.join(out_dir, f"legacy_{i}.pdf")) for i, report in enumerate(reports)]
+
+    def sequential(reports, out_dir):
+        return [pdf_report.generate_pdf(*report, output_path=os.path.join(out_dir, f"seq_{i}.pdf")) for i, report in enumerate(reports)]
+
+    def concurrent(reports, out_dir):
+        futures = [pdf_report.submit_pdf(*report, output_path=os.path.join(out_dir, f"pool_{i}.pdf")) for i, report in enumerate(reports)]
+        return [future.result() for future in futures]
+
+    results = {}
+    print(f"{'renderer':<34} {'reports/sec':>12} {'seconds':>9} {'pages':>6}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        results["legacy canvas (single page)"] = run("legacy canvas (single page)", legacy, reports, out_dir)
+        results["platypus, sequential"] = run("platypus, sequential", sequential, reports, out_dir)
+        results[f"platypus, pool of {args.workers}"] = run(f"platypus, pool of {args.workers}", concurrent, reports, out_dir)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
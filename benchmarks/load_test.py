@@ -0,0 +1,119 @@
+"""
+Load test for a running app: N simulated analysts upload a document and then ask questions,
+each in its own Gradio session, at several concurrency levels.
+
+Reports per-level throughput and p50/p95 latency for uploads and questions, and counts
+isolation failures (a question answered as if no document had been uploaded in that session).
+
+    python app.py &
+    python benchmarks/load_test.py --url http://127.0.0.1:7860 --users 1 2 4 8
+    python benchmarks/load_test.py --files sample_docs/BMW.pdf sample_docs/BMW.xlsx --questions 3 --json load.json
+
+Requires gradio_client (installed with gradio).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import percentile # benchmarks/ is on sys.path when a script here is run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "What was the net profit?",
+    "What were the total assets?",
+    "How did revenue change compared with the previous year?",
+]
+
+
+def simulate_user(url, file_path, question_count):
+    """One analyst: own client (and so own session), one upload, then questions."""
+    from gradio_client import Client, handle_file
+
+    client = Client(url, verbose=False)
+    result = {"upload": None, "questions": [], "errors": 0, "isolation_failures": 0}
+
+    start = time.perf_counter()
+    try:
+        output = client.predict(handle_file(file_path), False, "", "", api_name="/handle_upload")
+        result["upload"] = time.perf_counter() - start
+        if str(output[0]).startswith("❌"):
+            result["errors"] += 1
+            return result
+    except Exception as e:
+        print(f"Upload failed: {e}")
+        result["errors"] += 1
+        return result
+
+    for i in range(question_count):
+        start = time.perf_counter()
+        try:
+            answer = client.predict(QUESTIONS[i % len(QUESTIONS)], "This document", "", "", api_name="/answer_question")
+        except Exception as e:
+            print(f"Question failed: {e}")
+            result["errors"] += 1
+            continue
+        result["questions"].append(time.perf_counter() - start)
+        if "Please upload a file first" in str(answer):
+            result["isolation_failures"] += 1
+    return result
+
+
+def run_level(url, files, users, question_count):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        futures = [pool.submit(simulate_user, url, files[i % len(files)], question_count) for i in range(users)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    uploads = [r["upload"] for r in results if r["upload"] is not None]
+    questions = [q for r in results for q in r["questions"]]
+    return {
+        "users": users,
+        "seconds": elapsed,
+        "uploads_per_min": len(uploads) / elapsed * 60,
+        "questions_per_min": len(questions) / elapsed * 60,
+        "upload_p50": percentile(uploads, 50),
+        "upload_p95": percentile(uploads, 95),
+        "question_p50": percentile(questions, 50),
+        "question_p95": percentile(questions, 95),
+        "errors": sum(r["errors"] for r in results),
+        "isolation_failures": sum(r["isolation_failures"] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:7860")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrency levels to run")
+    parser.add_argument("--files", nargs="+", default=[os.path.join(REPO_ROOT, "sample_docs", "BMW.pdf")])
+    parser.add_argument("--questions", type=int, default=2, help="questions per user after the upload")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    levels = []
+    print(f"{'users':>5} {'uploads/min':>12} {'questions/min':>14} {'upload p50/p95 s':>18} {'question p50/p95 s':>20} {'errors':>7} {'isolation':>10}")
+    for users in args.users:
+        level = run_level(args.url, args.files, users, args.questions)
+        levels.append(level)
+        print(
+            f"{users:>5} {level['uploads_per_min']:>12.1f} {level['questions_per_min']:>14.1f} "
+            f"{level['upload_p50']:>8.1f}/{level['upload_p95']:<9.1f} {level['question_p50']:>9.2f}/{level['question_p95']:<10.2f} "
+            f"{level['errors']:>7} {level['isolation_failures']:>10}"
+        )
+
+    if len(levels) > 1 and levels[0]["uploads_per_min"]:
+        scaling = levels[-1]["uploads_per_min"] / levels[0]["uploads_per_min"]
+        print(f"\nUpload throughput at {levels[-1]['users']} users: {scaling:.2f}x the {levels[0]['users']}-user level")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(levels, f, indent=2)
+    sys.exit(1 if any(level["isolation_failures"] for level in levels) else 0)
+
+
+if __name__ == "__main__":
+    main()
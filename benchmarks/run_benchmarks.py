@@ -0,0 +1,282 @@
+"""
+Offline pipeline benchmark: extraction, KPI parsing, summary, Q&A index build and query, and PDF
+report, on sample_docs and on synthetic filings of 10-1000 pages (optionally with scanned,
+image-only pages that go through OCR).
+
+The Groq client, ChatGroq and (unless --real-embeddings) the embedding model are replaced with
+deterministic local stubs, and the on-disk caches are disabled, so runs need no network and are
+comparable across commits. Reports p50/p95 latency, throughput and peak RSS per stage.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --pages 10 100 1000 --scanned-every 10 --repeat 5 --json after.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+
+Peak RSS is process-wide: "peak_rss_mb" is the process peak after the stage and "rss_growth_mb"
+how much the stage raised it. Scanned pages need the EasyOCR model; without it they extract empty.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from _common import percentile # benchmarks/ is on sys.path when a script here is run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Measure the work itself, not cache hits; keep the JSON event logs out of the report
+for _name in ("EXTRACTION_CACHE", "INDEX_STORE", "EMBED_CACHE", "METRICS_LOG"):
+    os.environ.setdefault(_name, "0")
+
+QUESTIONS = [
+    "What was the net profit?",
+    "What were the total assets?",
+    "How much cash and cash equivalents does the company hold?",
+]
+STAGES = ["extract", "kpis", "summary", "qa_build", "qa_query", "pdf"]
+
+
+# --------------------------
+# Stubs
+# --------------------------
+class StubGroqClient:
+    """Deterministic stand-in for groq.Groq: replies derive from the prompt hash, after an optional fixed latency."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, model, temperature, max_tokens):
+        prompt = messages[-1]["content"]
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        content = (
+            f"Summary {digest}: the company reports its total assets, total liabilities, revenue and "
+            "net profit for the period. Liquidity is adequate; no explicit risks were identified."
+        )
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4 + 1, completion_tokens=len(content) // 4 + 1)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+
+def stub_llm():
+    from langchain_core.language_models.fake import FakeListLLM
+    return FakeListLLM(responses=["The net profit was 1,234 million for the period."])
+
+
+def stub_embeddings():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=384) # same width as all-MiniLM-L6-v2
+
+
+# --------------------------
+# Synthetic documents
+# --------------------------
+LINES_PER_PAGE = 45
+
+
+def _scanned_page_image(lines):
+    # Text rendered into an image, so the page has no text layer and needs OCR
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (1700, 2200), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((100, 100 + i * 44), line, fill="black")
+    return image
+
+
+def synthetic_pdf(path, pages, scanned_every=0, seed=0):
+    """Writes a synthetic filing of the given page count; every scanned_every-th page is image-only."""
+    from benchmarks.bench_kpis import synthetic_filing
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    lines = synthetic_filing(pages * LINES_PER_PAGE * 80, seed=seed, kpi_every=40).split("\n")
+    c = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    for page_num in range(pages):
+        page_lines = lines[page_num * LINES_PER_PAGE:(page_num + 1) * LINES_PER_PAGE] or ["(blank)"]
+        if scanned_every and page_num % scanned_every == scanned_every - 1:
+            c.drawImage(ImageReader(_scanned_page_image(page_lines)), 0, 0, width=width, height=height)
+        else:
+            text = c.beginText(40, height - 40)
+            text.setFont("Helvetica", 9)
+            for line in page_lines:
+                text.textLine(line)
+            c.drawText(text)
+        c.showPage()
+    c.save()
+    return path
+
+
+# --------------------------
+# Measurement
+# --------------------------
+def run_document(path, repeat, workers, llm_latency, real_embeddings):
+    from utils.extract_text import iter_pages_from_file
+    from utils.metrics import peak_rss_bytes
+    from utils.parse_kpis import extract_kpis_from_text
+    from utils.pdf_report import generate_pdf
+    from utils.qa_agent import build_qa_chain_from_text
+    from utils.summarize import generate_financial_summary
+
+    client = StubGroqClient(latency=llm_latency)
+    embeddings = None if real_embeddings else stub_embeddings()
+    samples = {stage: [] for stage in STAGES}
+    units = {stage: 0 for stage in STAGES}
+    peaks = {stage: 0.0 for stage in STAGES}
+    growth = {stage: 0.0 for stage in STAGES}
+    info = {}
+    out_dir = tempfile.mkdtemp(prefix="bench-report-")
+
+    def timed(stage, fn, count=1):
+        before = peak_rss_bytes()
+        start = time.perf_counter()
+        result = fn()
+        samples[stage].append(time.perf_counter() - start)
+        units[stage] += count
+        after = peak_rss_bytes()
+        peaks[stage] = max(peaks[stage], after / 1048576)
+        growth[stage] = max(growth[stage], (after - before) / 1048576)
+        return result
+
+    try:
+        for _ in range(repeat):
+            pages = timed("extract", lambda: list(iter_pages_from_file(path, workers=workers, use_cache=False)), count=0)
+            units["extract"] += len(pages) # extraction throughput is in pages/s
+            info = {"pages": len(pages), "ocr_pages": sum(page.used_ocr for page in pages)}
+            text = "\n".join(page.text for page in pages if page.text).strip()
+
+            kpis, ratios = timed("kpis", lambda: extract_kpis_from_text(text))
+            summary = timed("summary", lambda: generate_financial_summary(text, client=client))
+            chain = timed("qa_build", lambda: build_qa_chain_from_text(text, embeddings=embeddings, llm=stub_llm()))
+            for question in QUESTIONS:
+                timed("qa_query", lambda: chain.invoke({"query": question}))
+            timed("pdf", lambda: generate_pdf(summary, kpis, ratios, output_path=os.path.join(out_dir, "report.pdf")))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    unit_names = {"extract": "pages", "qa_query": "queries"}
+    stages = {}
+    for stage in STAGES:
+        total = sum(samples[stage])
+        stages[stage] = {
+            "runs": len(samples[stage]),
+            "p50": percentile(samples[stage], 50),
+            "p95": percentile(samples[stage], 95),
+            "mean": total / len(samples[stage]) if samples[stage] else 0.0,
+            "throughput": units[stage] / total if total else 0.0,
+            "throughput_unit": f"{unit_names.get(stage, 'docs')}/s",
+            "peak_rss_mb": round(peaks[stage], 1),
+            "rss_growth_mb": round(growth[stage], 1),
+        }
+    return {**info, "stages": stages}
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(results):
+    print(f"{'document':<34} {'stage':<9} {'p50 ms':>10} {'p95 ms':>10} {'throughput':>18} {'peak RSS MB':>12}")
+    for name, doc in results["documents"].items():
+        if "error" in doc:
+            print(f"{name:<34} {'-':<9} failed: {doc['error']}")
+            continue
+        for stage, s in doc["stages"].items():
+            throughput = f"{s['throughput']:.1f} {s['throughput_unit']}"
+            print(f"{name:<34} {stage:<9} {s['p50'] * 1000:>10.1f} {s['p95'] * 1000:>10.1f} {throughput:>18} {s['peak_rss_mb']:>12.1f}")
+
+
+def compare(before_path, after_path):
+    with open(before_path, "r", encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, "r", encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')} (p50, lower is better)")
+    print(f"{'document':<34} {'stage':<9} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for name, doc in after["documents"].items():
+        old = before["documents"].get(name)
+        if not old or "stages" not in old or "stages" not in doc:
+            continue
+        for stage, s in doc["stages"].items():
+            old_p50 = old["stages"].get(stage, {}).get("p50")
+            if not old_p50:
+                continue
+            change = (s["p50"] - old_p50) / old_p50 * 100
+            print(f"{name:<34} {stage:<9} {old_p50 * 1000:>10.1f} {s['p50'] * 1000:>10.1f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="*", default=[10, 100], help="synthetic PDF sizes (e.g. 10 100 1000)")
+    parser.add_argument("--scanned-every", type=int, default=10, help="also benchmark variants where every Nth page is scanned (0 = none)")
+    parser.add_argument("--no-samples", action="store_true", help="skip sample_docs/BMW.pdf and BMW.xlsx")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="PDF extraction workers (default: PDF_EXTRACT_WORKERS)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stub LLM sleeps per request")
+    parser.add_argument("--real-embeddings", action="store_true", help="use the real embedding model instead of the stub")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench-docs-")
+    try:
+        documents = {}
+        if not args.no_samples:
+            for name in ("BMW.pdf", "BMW.xlsx"):
+                documents[f"sample_docs/{name}"] = os.path.join(REPO_ROOT, "sample_docs", name)
+        for pages in args.pages:
+            documents[f"synthetic {pages}p"] = synthetic_pdf(os.path.join(work_dir, f"digital-{pages}.pdf"), pages)
+            if args.scanned_every:
+                documents[f"synthetic {pages}p, 1/{args.scanned_every} scanned"] = synthetic_pdf(
+                    os.path.join(work_dir, f"scanned-{pages}.pdf"), pages, scanned_every=args.scanned_every
+                )
+
+        results = {
+            "meta": {
+                "commit": _git_commit(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+            },
+            "documents": {},
+        }
+        for name, path in documents.items():
+            print(f"Benchmarking {name}...", flush=True)
+            try:
+                results["documents"][name] = run_document(path, args.repeat, args.workers, args.llm_latency, args.real_embeddings)
+            except Exception as e:
+                results["documents"][name] = {"error": str(e)}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import re
+import threading
+from collections import defaultdict
+
+from utils import metrics
+
+# Pre-LLM prompt compaction. Before text is sent to the LLM (the summary prompts, the chunks
+# stuffed into a Q&A prompt), it is compacted:
+#   - lines repeated on many pages (running headers, footers, disclaimers) are kept once, and
+#     page numbers ("Page 12 of 300", or "12" where it follows the page sequence) at the top or
+#     bottom of a page are dropped
+#   - whitespace-padded table dumps (DataFrame.to_string(), dot leaders) are collapsed to " | "
+#     separated cells, and lines that are mostly OCR noise are dropped
+#   - token budgets are measured with tiktoken instead of the 4-characters-per-token estimate.
+#     tiktoken downloads its BPE file on first use and keeps it in TIKTOKEN_CACHE_DIR (default
+#     .cache/tiktoken); copy the file there to run offline. Without it, the estimate is used.
+# Tokens saved are counted per request ("prompt_tokens_saved_total") and logged.
+#
+# COMPACTION=0 disables it.
+COMPACTION_REPEAT_MIN = int(os.getenv("COMPACTION_REPEAT_MIN", "3")) # occurrences that make a line boilerplate
+COMPACTION_TOKENIZER = os.getenv("COMPACTION_TOKENIZER", "cl100k_base") # tiktoken encoding
+# Kept with the other caches rather than in tiktoken's default temp dir, so it survives restarts
+TIKTOKEN_CACHE_DIR = os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.join(".cache", "tiktoken"))
+# Rough characters-per-token ratio for English financial text, used without tiktoken
+CHARS_PER_TOKEN = 4
+
+# Page numbers: "Page 12", "12 of 300" are always page numbers at the top or bottom of a page. A
+# bare "12" there only counts if it follows the page sequence on several pages; it may be a figure.
+_PAGE_LABEL_RE = re.compile(r"^(?:page\s*\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?|\d{1,4}\s*(?:of|/)\s*\d{1,4})$", re.IGNORECASE)
+_BARE_NUMBER_RE = re.compile(r"^\d{1,4}$")
+_LEADER_RE = re.compile(r"(?:\s*[.…_]){4,}\s*|(?:\s*-){4,}\s*") # dot leaders, rules
+_GAP_RE = re.compile(r"[ \t ]{2,}")
+_SPACE_RE = re.compile(r"[ \t ]+")
+_MIN_SHARED_LINE = 20 # shorter lines ("Revenue", "2023") may repeat legitimately across chunks
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def is_enabled():
+    return os.getenv("COMPACTION", "1") != "0"
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(COMPACTION_TOKENIZER)
+            except Exception as e: # not installed, or the encoding isn't cached and can't be downloaded
+                print(f"Note: tiktoken unavailable ({e}); token counts are estimated from characters.")
+                _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Tokens in text, with tiktoken when available, else the characters-per-token estimate."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts text to at most max_tokens, at a line boundary where possible."""
+    if max_tokens <= 0 or count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        cut = text[:max_tokens * CHARS_PER_TOKEN]
+    newline = cut.rfind("\n")
+    return cut[:newline] if newline > len(cut) // 2 else cut
+
+
+def _compact_line(line):
+    line = _LEADER_RE.sub("  ", line.strip())
+    # Two or more cells separated by runs of spaces: a table row
+    cells = [cell for cell in _GAP_RE.split(line) if cell]
+    if len(cells) > 2:
+        return " | ".join(_SPACE_RE.sub(" ", cell) for cell in cells)
+    return _SPACE_RE.sub(" ", line)
+
+
+def _is_noise(line):
+    # OCR debris: runs of symbols, or lines with hardly any letters or digits. A lone "-" or "—"
+    # is kept: in a table it is a nil value.
+    alnum = sum(ch.isalnum() for ch in line)
+    return (alnum == 0 and len(line) > 1) or (len(line) >= 4 and alnum / len(line) < 0.3)
+
+
+def _edges(lines):
+    # First and last non-empty line: where page numbers are printed
+    content = [i for i, line in enumerate(lines) if line]
+    return {content[0], content[-1]} if content else set()
+
+
+def _page_lines(text):
+    """Compacted lines of one page, with page labels ("Page 3 of 9") and noise blanked out."""
+    lines = [_compact_line(line) for line in text.splitlines()]
+    edges = _edges(lines)
+    return ["" if (i in edges and _PAGE_LABEL_RE.match(line)) or _is_noise(line) else line for i, line in enumerate(lines)]
+
+
+def _drop_page_numbers(pages, page_ids, repeat_min):
+    """
+    Blanks bare numbers at the top or bottom of a page that follow the page sequence (number minus
+    page position is the same on at least repeat_min pages). page_ids are (source, position) pairs;
+    source None means the position isn't a page number. Any other number stays: it may be a figure.
+    """
+    candidates = []
+    offsets = defaultdict(set)
+    for (source, position), lines in zip(page_ids, pages):
+        if source is None:
+            continue
+        for i in _edges(lines):
+            if _BARE_NUMBER_RE.match(lines[i]):
+                offset = (source, int(lines[i]) - position)
+                candidates.append((lines, i, offset))
+                offsets[offset].add(position)
+    for lines, i, offset in candidates:
+        if len(offsets[offset]) >= repeat_min:
+            lines[i] = ""
+
+
+def _dedupe(pages, page_ids, repeat_min):
+    """
+    pages: line lists from _page_lines(); page_ids: the page each one comes from (retrieved chunks
+    of the same page share an id). A line on at least repeat_min distinct pages (running header,
+    footer, disclaimer) is kept on its first page only. A long line an earlier entry of the same
+    page already had (chunk overlap) is dropped. Repeats within one entry (table rows, "Total")
+    are kept. Returns the compacted text of every entry.
+    """
+    _drop_page_numbers(pages, page_ids, repeat_min)
+    line_pages = defaultdict(set)
+    for page_id, lines in zip(page_ids, pages):
+        for line in lines:
+            if line:
+                line_pages[line].add(page_id)
+    first_seen = {} # line -> (page id, entry) where it was first kept
+    results = []
+    for entry, (page_id, lines) in enumerate(zip(page_ids, pages)):
+        kept = []
+        for line in lines:
+            if not line:
+                if kept and kept[-1]: # keep paragraph breaks, but only one
+                    kept.append("")
+                continue
+            first = first_seen.setdefault(line, (page_id, entry))
+            if first[0] != page_id and len(line_pages[line]) >= repeat_min:
+                continue
+            if first[0] == page_id and first[1] != entry and len(line) >= _MIN_SHARED_LINE:
+                continue
+            kept.append(line)
+        results.append("\n".join(kept).strip())
+    return results
+
+
+def compact_pages(pages, repeat_min=COMPACTION_REPEAT_MIN):
+    """
+    Compacts a document given as page texts: boilerplate repeated on at least repeat_min pages is
+    kept once, page numbers at the top or bottom of a page and noise are dropped, and padded
+    table rows are collapsed. Returns the compacted pages.
+    """
+    return _dedupe([_page_lines(page) for page in pages], [("", position) for position in range(len(pages))], repeat_min)
+
+
+def compact_text(text, repeat_min=COMPACTION_REPEAT_MIN):
+    """Compacts text that has no page boundaries (treated as one page, so nothing is deduplicated)."""
+    return compact_pages([text], repeat_min)[0]
+
+
+def _record(stage, before, after):
+    metrics.inc("prompt_tokens_total", before, stage=stage, kind="raw")
+    metrics.inc("prompt_tokens_total", after, stage=stage, kind="compacted")
+    metrics.inc("prompt_tokens_saved_total", max(0, before - after), stage=stage)
+    metrics.log_event("prompt_compaction", stage=stage, tokens_before=before, tokens_after=after, saved=before - after)
+
+
+def compact(text, stage, max_tokens=0, pages=None):
+    """
+    Compacts text for an LLM prompt, cuts it to max_tokens (0 = no limit) and records the tokens
+    saved under stage (e.g. "summary"). pages, the same text split by page, lets boilerplate that
+    repeats across pages be removed. Returns the compacted text.
+    """
+    if not is_enabled():
+        return truncate_to_tokens(text, max_tokens)
+    with metrics.span("compaction", stage=stage):
+        before = count_tokens(text)
+        compacted = "\n".join(page for page in compact_pages(pages) if page) if pages else compact_text(text)
+        compacted = truncate_to_tokens(compacted, max_tokens)
+        after = count_tokens(compacted)
+    _record(stage, before, after)
+    return compacted
+
+
+def compact_documents(documents, stage, max_tokens=0):
+    """
+    Compacts retrieved chunks (LangChain Documents, best first) for a "stuff" prompt. Lines a chunk
+    of the same page already had (chunk overlap) and boilerplate repeated across pages are dropped,
+    and chunks are added until max_tokens (0 = no limit); the first chunk is always kept.
+    Returns new Documents.
+    """
+    from langchain.docstore.document import Document
+
+    enabled = is_enabled()
+    if enabled:
+        # Chunks without a page number count as pages of their own
+        page_ids = [
+            (document.metadata.get("file_name", ""), document.metadata["page"]) if "page" in document.metadata else (None, i)
+            for i, document in enumerate(documents)
+        ]
+        texts = _dedupe([_page_lines(document.page_content) for document in documents], page_ids, COMPACTION_REPEAT_MIN)
+    else:
+        texts = [document.page_content for document in documents]
+    results = []
+    before = after = 0
+    for document, text in zip(documents, texts):
+        raw_tokens = count_tokens(document.page_content)
+        tokens = count_tokens(text) if enabled else raw_tokens
+        if results and max_tokens and after + tokens > max_tokens:
+            break
+        before += raw_tokens
+        after += tokens
+        if text:
+            results.append(Document(page_content=text, metadata=document.metadata))
+    if not results and documents:
+        results = [documents[0]]
+    if enabled:
+        _record(stage, before, after)
+    return results
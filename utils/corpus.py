@@ -0,0 +1,287 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from heapq import nsmallest
+
+from utils import index_store, metrics
+
+# Corpus Q&A across many filings. Every document added to the corpus keeps its own FAISS shard
+# on disk, plus a catalog entry with its metadata (company, period). A question is embedded once,
+# searched in parallel in every shard that passes the metadata filters, and the global top-k chunks
+# are merged by distance.
+#
+# Shard vectors are memory-mapped and their chunk texts are only loaded for shards that return a
+# hit. At most CORPUS_OPEN_SHARDS shards are open at a time (least recently used are closed first),
+# so memory stays bounded however many documents the corpus holds.
+CORPUS_DIR = os.getenv("CORPUS_DIR", os.path.join(".cache", "corpus"))
+CORPUS_K = int(os.getenv("CORPUS_K", "8"))
+CORPUS_OPEN_SHARDS = int(os.getenv("CORPUS_OPEN_SHARDS", "64"))
+CORPUS_SEARCH_THREADS = int(os.getenv("CORPUS_SEARCH_THREADS", "8"))
+
+_YEAR_RE = re.compile(r"(?<!\d)(?:19[89]\d|20\d\d)(?!\d)")
+_FILE_NAME_NOISE = frozenset(
+    "annual report reports financial statements statement results interim quarterly half year "
+    "10k k 20f f form filing fy q1 q2 q3 q4 h1 h2 final draft amended".split()
+)
+
+
+def guess_company(file_name):
+    """Company name from a file name: "BMW_Annual_Report_2022.pdf" -> "BMW"."""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    words = [word for word in re.split(r"[\s_.\-]+", stem) if word]
+    kept = [word for word in words if word.lower() not in _FILE_NAME_NOISE and not any(ch.isdigit() for ch in word)]
+    return " ".join(kept) or stem
+
+
+def guess_period(file_name, text=""):
+    """Fiscal year of a filing: a year in the file name, else the most frequent year near the start of the text."""
+    years = _YEAR_RE.findall(os.path.basename(file_name))
+    if years:
+        return years[-1]
+    counts = Counter(_YEAR_RE.findall(text[:20000]))
+    if not counts:
+        return ""
+    # Ties go to the latest year (comparative columns show the prior year as often as the current one)
+    return max(counts, key=lambda year: (counts[year], year))
+
+
+def parse_periods(value):
+    """Period filter from user input: "2019-2023", "2021, 2023" or "" (no filter). Returns a set or None."""
+    periods = set()
+    for part in re.split(r"[,;\s]+", (value or "").strip()):
+        bounds = part.split("-")
+        if len(bounds) == 2 and bounds[0].isdigit() and bounds[1].isdigit():
+            periods.update(str(year) for year in range(int(bounds[0]), int(bounds[1]) + 1))
+        elif part:
+            periods.add(part)
+    return periods or None
+
+
+class _Shard:
+    """One document's index. Vectors are memory-mapped; chunk texts are loaded on first hit."""
+
+    def __init__(self, key, store_dir):
+        self.key = key
+        self.store_dir = store_dir
+        self.index = index_store.load_index(key, mmap=True, store_dir=store_dir)
+        self._docstore = None
+        self._lock = threading.Lock()
+
+    def search(self, vector, k):
+        distances, positions = self.index.search(vector, k)
+        return [(float(distance), self.key, int(position)) for distance, position in zip(distances[0], positions[0]) if position >= 0]
+
+    def document(self, position):
+        with self._lock:
+            if self._docstore is None:
+                stored = index_store.load_docstore(self.key, self.store_dir)
+                if stored is None:
+                    return None
+                self._docstore = stored
+        docstore, index_to_docstore_id = self._docstore
+        return docstore.search(index_to_docstore_id[position])
+
+
+class Corpus:
+    def __init__(self, corpus_dir=CORPUS_DIR, max_open_shards=CORPUS_OPEN_SHARDS, search_threads=CORPUS_SEARCH_THREADS):
+        self.corpus_dir = corpus_dir
+        self.shard_dir = os.path.join(corpus_dir, "shards")
+        self.max_open_shards = max_open_shards
+        self._catalog_path = os.path.join(corpus_dir, "catalog.json")
+        self._catalog = self._load_catalog()
+        self._loaded_mtime = self._catalog_mtime()
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, search_threads), thread_name_prefix="corpus")
+        metrics.register_gauge("corpus_documents", lambda: len(self._catalog))
+        metrics.register_gauge("corpus_open_shards", lambda: len(self._shards))
+
+    def _load_catalog(self):
+        try:
+            with open(self._catalog_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable corpus catalog {self._catalog_path}: {e}")
+            return {}
+
+    def _catalog_mtime(self):
+        try:
+            return os.path.getmtime(self._catalog_path)
+        except OSError:
+            return None
+
+    def _refresh_locked(self):
+        # Other processes (batch runs) add documents too; pick up their changes to the catalog
+        mtime = self._catalog_mtime()
+        if mtime != self._loaded_mtime:
+            self._catalog = self._load_catalog()
+            self._loaded_mtime = mtime
+
+    def _update_catalog(self, update):
+        # Read-modify-write of the file on disk, so entries added by other processes aren't lost
+        with self._lock:
+            catalog = self._load_catalog()
+            update(catalog)
+            os.makedirs(self.corpus_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.corpus_dir, prefix=".tmp-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(catalog, f, ensure_ascii=False)
+                os.replace(tmp_path, self._catalog_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._catalog = catalog
+            self._loaded_mtime = self._catalog_mtime()
+
+    def __len__(self):
+        return len(self._catalog)
+
+    def __contains__(self, key):
+        with self._lock:
+            self._refresh_locked()
+            return key in self._catalog
+
+    def _register(self, key, file_name, company, period, chunks, embedding_model):
+        entry = {
+            "file_name": os.path.basename(file_name),
+            "company": company or guess_company(file_name),
+            "period": str(period or ""),
+            "chunks": chunks,
+            "embedding_model": embedding_model,
+            "added": time.time(),
+        }
+
+        def update(catalog):
+            catalog[key] = entry
+        self._update_catalog(update)
+        with self._lock:
+            self._shards.pop(key, None)
+        return entry
+
+    def add(self, key, vectorstore, file_name, company="", period="", embedding_model=""):
+        """
+        Adds (or re-labels) a document as a shard, from its FAISS vector store. key is the document's
+        content key, so adding the same file twice stores it once.
+        """
+        if not index_store.exists(key, self.shard_dir):
+            with metrics.span("corpus_add"):
+                index_store.save(key, vectorstore, metadata={"file_name": os.path.basename(file_name)}, store_dir=self.shard_dir)
+        return self._register(key, file_name, company, period, vectorstore.index.ntotal, embedding_model)
+
+    def add_from_store(self, key, file_name, company="", period="", embedding_model=""):
+        """
+        Adds a document whose index is already persisted in the index store (e.g. built by a batch
+        worker process) by copying the entry. Returns the catalog entry, or None if there is no entry.
+        """
+        source = os.path.join(index_store.INDEX_STORE_DIR, key)
+        if not index_store.exists(key):
+            return None
+        if not index_store.exists(key, self.shard_dir):
+            os.makedirs(self.shard_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=self.shard_dir, prefix=".tmp-")
+            try:
+                shutil.copytree(source, tmp_dir, dirs_exist_ok=True)
+                os.replace(tmp_dir, os.path.join(self.shard_dir, key))
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        with open(os.path.join(self.shard_dir, key, "meta.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f).get("chunks", 0)
+        return self._register(key, file_name, company, period, chunks, embedding_model)
+
+    def remove(self, key):
+        def update(catalog):
+            catalog.pop(key, None)
+        self._update_catalog(update)
+        with self._lock:
+            self._shards.pop(key, None)
+        shutil.rmtree(os.path.join(self.shard_dir, key), ignore_errors=True)
+
+    def documents(self, company=None, periods=None, embedding_model=None):
+        """Catalog entries (key, entry) that pass the filters. company matches case-insensitively as a substring."""
+        company = (company or "").strip().lower()
+        with self._lock:
+            self._refresh_locked()
+            entries = list(self._catalog.items())
+        return [
+            (key, entry) for key, entry in entries
+            if (not company or company in entry["company"].lower())
+            and (not periods or entry["period"] in periods)
+            and (not embedding_model or not entry.get("embedding_model") or entry["embedding_model"] == embedding_model)
+        ]
+
+    def _shard(self, key):
+        with self._lock:
+            shard = self._shards.get(key)
+            if shard is not None:
+                self._shards.move_to_end(key)
+                return shard
+        # Opened outside the lock; two threads may open the same shard, the second one wins
+        shard = _Shard(key, self.shard_dir)
+        if shard.index is None:
+            return None
+        with self._lock:
+            self._shards[key] = shard
+            while len(self._shards) > self.max_open_shards:
+                self._shards.popitem(last=False)
+        return shard
+
+    def _search_shard(self, key, vector, k):
+        shard = self._shard(key)
+        return shard.search(vector, k) if shard is not None else []
+
+    def search(self, vector, k=CORPUS_K, company=None, periods=None, embedding_model=None):
+        """
+        Returns the k chunks (LangChain Documents) closest to the query vector across the filtered
+        shards. Each chunk's metadata gets the document's file name, company and period.
+        """
+        import numpy as np
+        from langchain.docstore.document import Document
+
+        documents = self.documents(company, periods, embedding_model)
+        if not documents:
+            return []
+        query = np.asarray([vector], dtype=np.float32)
+        with metrics.span("corpus_search"):
+            futures = [self._pool.submit(self._search_shard, key, query, k) for key, _ in documents]
+            hits = [hit for future in futures for hit in future.result()]
+        metrics.inc("corpus_shards_searched_total", len(documents))
+
+        entries = dict(documents)
+        results = []
+        for _, key, position in nsmallest(k, hits):
+            shard = self._shard(key)
+            document = shard.document(position) if shard is not None else None
+            if document is None:
+                continue
+            entry = entries[key]
+            # Label every excerpt with its source, so answers can compare companies and years
+            source = f"{entry['company']} {entry['period']}".strip()
+            label = f"[{source}, page {document.metadata.get('page', 0) + 1}]"
+            results.append(Document(
+                page_content=f"{label}\n{document.page_content}",
+                metadata={**document.metadata, "file_name": entry["file_name"], "company": entry["company"], "period": entry["period"]},
+            ))
+        return results
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def get_corpus():
+    """Returns the process-wide corpus."""
+    global _corpus
+    if _corpus is None:
+        with _corpus_lock:
+            if _corpus is None:
+                _corpus = Corpus()
+    return _corpus
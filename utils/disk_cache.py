@@ -0,0 +1,75 @@
+import hashlib
+import os
+import shutil
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """Hashes a file in fixed-size blocks so large uploads are never read into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def touch(path):
+    # Entries are evicted oldest-mtime first, so bumping the mtime on a hit marks it as recently used.
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def entry_size(path):
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def evict_lru(cache_dir, max_bytes):
+    """
+    Deletes the least recently used entries (files or directories) directly under cache_dir
+    until the total size fits in max_bytes. Returns the number of entries removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if name.startswith("."): # in-progress writes
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        size = entry_size(path)
+        entries.append((mtime, size, path))
+        total += size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            print(f"Warning: could not evict cache entry {path}: {e}")
+            continue
+        total -= size
+        removed += 1
+    return removed
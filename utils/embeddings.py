@@ -0,0 +1,268 @@
+# Process-wide embedding service: one shared sentence-transformers model, batched encoding, and a
+# persistent chunk-hash -> vector cache, so boilerplate that repeats across filings (auditor letters,
+# standard notes) is only embedded once.
+# Import this module lazily: it pulls in LangChain, and the first get_embeddings() call loads torch.
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils import metrics
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# sentence-transformers batch size; larger batches amortize per-call overhead on CPU
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(".cache", "embeddings"))
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "256"))
+
+_KEY_BYTES = 16 # truncated SHA-256; plenty for chunk identity
+
+
+class VectorCache:
+    """
+    Append-only on-disk store of float32 vectors keyed by chunk hash.
+    keys.bin holds one 16-byte key per row and vectors.f32 the matching rows, so the store
+    is as compact as the raw vectors. Several processes (the app, batch workers) may share the
+    directory: appends take an exclusive file lock, number their rows from the files' current
+    size and first pick up rows other processes appended. A torn write from a crash is ignored
+    on load and cut off before the next append. Once the size budget is reached new vectors are
+    no longer stored.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._keys_path = os.path.join(cache_dir, "keys.bin")
+        self._vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._meta_path = os.path.join(cache_dir, "meta.json")
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._row_count = 0 # rows on disk that have been read into _rows
+        self._dim = None
+        self._vectors = None # memmap over vectors.f32, refreshed after appends
+        self._full = False
+        with self._lock:
+            self._refresh()
+
+    def _read_dim(self):
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)["dim"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_rows(self):
+        # Complete rows on disk: vectors are written before keys, so a row counts once its key is there
+        try:
+            key_bytes = os.path.getsize(self._keys_path)
+            vector_bytes = os.path.getsize(self._vectors_path)
+        except OSError:
+            return 0
+        return min(key_bytes // _KEY_BYTES, vector_bytes // (4 * self._dim))
+
+    def _refresh(self):
+        """Reads rows appended since the last refresh, by this or another process. Returns the row count on disk."""
+        if self._dim is None:
+            self._dim = self._read_dim()
+            if self._dim is None:
+                return 0
+        row_count = self._disk_rows()
+        if row_count < self._row_count: # the directory was cleared
+            self._rows, self._row_count, self._vectors = {}, 0, None
+        if row_count > self._row_count:
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._row_count * _KEY_BYTES)
+                keys = f.read((row_count - self._row_count) * _KEY_BYTES)
+            for i in range(row_count - self._row_count):
+                self._rows.setdefault(keys[i * _KEY_BYTES:(i + 1) * _KEY_BYTES], self._row_count + i)
+            self._row_count = row_count
+            self._map(row_count)
+        return row_count
+
+    @contextmanager
+    def _file_lock(self):
+        # Serializes appends across processes (no-op where fcntl is unavailable, i.e. Windows)
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _map(self, row_count):
+        if row_count:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(row_count, self._dim))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, keys):
+        """Returns a list with a vector (list of floats) or None for every key."""
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh() # other processes may have stored them since
+            rows = [self._rows.get(key) for key in keys]
+            return [self._vectors[row].tolist() if row is not None else None for row in rows]
+
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._full:
+                return
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with self._file_lock():
+                    self._append(keys, array)
+            except OSError as e:
+                print(f"Warning: could not write embedding cache: {e}")
+                self._full = True
+
+    def _append(self, keys, array):
+        # Called with both locks held
+        row_count = self._refresh()
+        if self._dim is None:
+            self._dim = array.shape[1]
+            with open(self._meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self._dim}, f)
+        if array.shape[1] != self._dim:
+            return
+        new = {}
+        for key, row in zip(keys, array):
+            if key not in self._rows:
+                new.setdefault(key, row)
+        if not new:
+            return
+        row_bytes = _KEY_BYTES + 4 * self._dim
+        if (row_count + len(new)) * row_bytes > self.max_bytes:
+            self._full = True
+            print(f"Embedding cache reached its {self.max_bytes / 1024 / 1024:.0f} MB budget; new vectors won't be cached.")
+            return
+        # Cut off a torn write left by a crash, so new rows line up in both files
+        for path, size in ((self._vectors_path, row_count * 4 * self._dim), (self._keys_path, row_count * _KEY_BYTES)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        # Vectors first, keys second: a row only counts once its key is written.
+        with open(self._vectors_path, "ab") as f:
+            f.write(np.stack(list(new.values())).astype(np.float32).tobytes())
+        with open(self._keys_path, "ab") as f:
+            f.write(b"".join(new))
+        for offset, key in enumerate(new):
+            self._rows[key] = row_count + offset
+        self._row_count = row_count + len(new)
+        self._map(self._row_count)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings backed by the shared model and the vector cache.
+    Keeps running counters for embeddings/sec and the cache hit rate (see stats()).
+    """
+
+    def __init__(self, model, cache, model_name):
+        self.model = model
+        self.cache = cache
+        self.model_name = model_name
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._embedded = 0
+        self._embed_seconds = 0.0
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()[:_KEY_BYTES]
+
+    def _encode(self, texts):
+        start = time.perf_counter()
+        with metrics.span("embed_documents"):
+            vectors = self.model.embed_documents(texts)
+        metrics.inc("chunks_embedded_total", len(texts))
+        with self._stats_lock:
+            self._embedded += len(texts)
+            self._embed_seconds += time.perf_counter() - start
+        return vectors
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts] if self.cache is not None else []
+        vectors = self.cache.get_many(keys) if self.cache is not None else [None] * len(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        with self._stats_lock:
+            self._hits += len(texts) - len(missing)
+            self._misses += len(missing)
+
+        if missing:
+            # Duplicate chunks within the batch are only encoded once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique_texts, self._encode(unique_texts)))
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+            if self.cache is not None:
+                self.cache.put_many([self._key(text) for text in unique_texts], [computed[text] for text in unique_texts])
+        return vectors
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        with metrics.span("embed_query"):
+            vector = self.model.embed_query(text)
+        with self._stats_lock:
+            self._embedded += 1
+            self._embed_seconds += time.perf_counter() - start
+        return vector
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self._hits + self._misses
+            return {
+                "embedded": self._embedded,
+                "embeddings_per_sec": round(self._embedded / self._embed_seconds, 1) if self._embed_seconds else 0.0,
+                "cache_hits": self._hits,
+                "cache_misses": self._misses,
+                "cache_hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "cached_vectors": len(self.cache) if self.cache is not None else 0,
+            }
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embeddings():
+    """Returns the process-wide embedding service, loading the model on the first call."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                model = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL_NAME,
+                    encode_kwargs={"batch_size": EMBED_BATCH_SIZE},
+                )
+                cache = None
+                if os.getenv("EMBED_CACHE", "1") != "0" and EMBED_CACHE_MAX_MB > 0:
+                    model_dir = EMBEDDING_MODEL_NAME.replace("/", "__")
+                    cache = VectorCache(os.path.join(EMBED_CACHE_DIR, model_dir), EMBED_CACHE_MAX_MB * 1024 * 1024)
+                _service = CachedEmbeddings(model, cache, EMBEDDING_MODEL_NAME)
+                metrics.register_gauge("embedding_cache_hit_rate", lambda: _service.stats()["cache_hit_rate"])
+                metrics.register_gauge("embedding_cache_vectors", lambda: _service.stats()["cached_vectors"])
+    return _service
+
+
+def get_stats():
+    """Embedding throughput and cache statistics, or an empty dict if the service isn't loaded yet."""
+    return _service.stats() if _service is not None else {}
@@ -1,91 +1,385 @@
 import os
-import pdfplumber
-import docx
-import pandas as pd
-import easyocr
-from PIL import Image
-import numpy as np
-
-# Initialize EasyOCR reader once to avoid re-loading models for every call.
-# This will download the 'en' model the first time it's run.
-# For CPU-only, use: reader = easyocr.Reader(['en'], gpu=False)
-try:
-    reader = easyocr.Reader(['en'])
-except Exception as e:
-    print(f"Warning: EasyOCR failed to initialize. OCR functionality might be limited or unavailable. Error: {e}")
-    reader = None
-
-def extract_text_from_file(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
-    text = ""
+import atexit
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+from utils import extraction_cache, metrics, ocr, office
+
+# pdfplumber, openpyxl/xlrd, Pillow/numpy and above all EasyOCR (torch) are imported on first
+# use, so a process that only ever handles .txt or .docx files never pays for the OCR stack.
+_reader = None
+_reader_failed = False
+_reader_lock = threading.Lock()
+
+
+def get_ocr_reader():
+    """
+    Returns the process-wide EasyOCR reader, loading it on the first call.
+    This will download the 'en' model the first time it's run.
+    Returns None if EasyOCR is unavailable; the failure is remembered so it isn't retried per page.
+    """
+    global _reader, _reader_failed
+    if _reader is not None or _reader_failed:
+        return _reader
+    with _reader_lock:
+        if _reader is None and not _reader_failed:
+            try:
+                import easyocr
+                # For CPU-only, use: easyocr.Reader(['en'], gpu=False)
+                _reader = easyocr.Reader(['en'])
+            except Exception as e:
+                print(f"Warning: EasyOCR failed to initialize. OCR functionality might be limited or unavailable. Error: {e}")
+                _reader_failed = True
+    return _reader
+
+
+def warm_up_ocr():
+    """Optional warm-up hook: loads the OCR model ahead of the first scanned page."""
+    return get_ocr_reader() is not None
+
+
+# Parallel PDF extraction settings.
+# PDF_EXTRACT_WORKERS: size of the process pool (0 = one worker per CPU core, 1 = no pool).
+# PDF_PARALLEL_MIN_PAGES: shorter PDFs are extracted in-process, the pool isn't worth it.
+# PDF_PAGES_PER_TASK: pages handed to a worker at a time. Small ranges keep the load
+# balanced when scanned (OCR) pages are clustered in one part of the document.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+
+# One extracted page. Formats without real pages come as sections of about _SECTION_CHARS
+# characters (DOCX, TXT, XLSX) or a single record (images).
+# seconds is the time spent extracting the page (0.0 when it was read back from the cache).
+# ocr_missing: the page needed OCR but the process extracting it (maybe a pool worker) had no
+# OCR reader, so its text is incomplete.
+PageRecord = namedtuple("PageRecord", ["page_num", "text", "used_ocr", "seconds", "ocr_missing"], defaults=(0.0, False))
+_SECTION_CHARS = 1 << 20
+
+_pdf_pool = None
+_pdf_pool_workers = 0
+_pdf_pool_lock = threading.Lock()
+
+
+def _init_pdf_worker():
+    # Keep torch single-threaded so N workers don't oversubscribe N cores. Set through the
+    # environment, which torch reads when it is imported, so the worker doesn't import it now.
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = "1"
+    # The EasyOCR model (and torch) is not loaded here: get_ocr_reader() loads it once per worker,
+    # on the first page that needs OCR, so digital PDFs never pay for it.
+
+
+def _get_pdf_pool(workers):
+    """Returns the shared extraction pool, (re)creating it if the requested size changed."""
+    global _pdf_pool, _pdf_pool_workers
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_workers != workers:
+            if _pdf_pool is not None:
+                _pdf_pool.shutdown(wait=False)
+            # "spawn" rather than fork: forking a process that already runs torch threads can deadlock.
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_pdf_worker,
+            )
+            _pdf_pool_workers = workers
+        return _pdf_pool
 
+
+def _shutdown_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(wait=True, cancel_futures=True)
+            _pdf_pool = None
+
+
+atexit.register(_shutdown_pdf_pool)
+
+
+def _extract_pdf_pages(pages, file_name):
+    """
+    Yields a PageRecord for every (page_num, pdfplumber page) pair, in page order. Regions without
+    a text layer are OCR'd (see utils/ocr.py); their images are collected over up to OCR_BATCH_SIZE
+    pages and recognized in one batch, so a page may wait for the next ones before it is yielded.
+    A record's text is "" when nothing could be read.
+    """
+    buffered = [] # [page_num, text, region images, seconds spent so far, OCR needed but unavailable]
+
+    def flush():
+        images = [image for entry in buffered for image in entry[2]]
+        start = time.perf_counter()
+        texts = []
+        if images:
+            with metrics.span("ocr_recognize"):
+                texts = ocr.recognize(get_ocr_reader(), images)
+            metrics.inc("ocr_regions_total", len(images))
+        # Recognition time is shared out over the pages by their number of regions
+        share = (time.perf_counter() - start) / len(images) if images else 0.0
+        position = 0
+        for page_num, text, regions, seconds, ocr_missing in buffered:
+            ocr_text = " ".join(part for part in texts[position:position + len(regions)] if part)
+            position += len(regions)
+            if ocr_text:
+                text = f"{text}\n{ocr_text}" if text else ocr_text
+            if not text:
+                print(f"No text extracted (digital or OCR) from PDF page {page_num + 1}.")
+            yield PageRecord(page_num, text, bool(ocr_text), seconds + share * len(regions), ocr_missing)
+        buffered.clear()
+
+    pending_images = 0
+    for page_num, page in pages:
+        start = time.perf_counter()
+        page_text = page.extract_text() or ""
+        has_text = bool(page_text.strip())
+        if not has_text:
+            page_text = ""
+        regions = ocr.plan_regions(page, has_text)
+        images = []
+        ocr_missing = bool(regions) and get_ocr_reader() is None
+        if regions and not ocr_missing:
+            print(f"Attempting OCR for PDF page {page_num + 1} of {file_name} ({len(regions)} region(s))...")
+            with metrics.span("ocr_render"):
+                images = [ocr.render_region(page, bbox, dpi) for bbox, dpi in regions]
+        page.close() # Drop pdfplumber's per-page object caches as we go
+        buffered.append([page_num, page_text, images, time.perf_counter() - start, ocr_missing])
+        pending_images += len(images)
+        # Digital pages are yielded right away unless an OCR page ahead of them is still waiting
+        if pending_images >= ocr.OCR_BATCH_SIZE or len(buffered) >= ocr.OCR_BATCH_SIZE or not pending_images:
+            yield from flush()
+            pending_images = 0
+    yield from flush()
+
+
+def _extract_pdf_page_range(file_path, page_numbers):
+    # Runs inside pool workers: every task opens its own handle on the PDF.
+    import pdfplumber
+    file_name = os.path.basename(file_path)
+    with pdfplumber.open(file_path) as pdf:
+        return list(_extract_pdf_pages(((i, pdf.pages[i]) for i in page_numbers), file_name))
+
+
+def _resolve_pdf_workers(workers, page_count):
+    if workers is None:
+        workers = PDF_EXTRACT_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    if page_count < PDF_PARALLEL_MIN_PAGES:
+        return 1
+    # No point in more workers than there are page ranges to hand out.
+    return max(1, min(workers, -(-page_count // PDF_PAGES_PER_TASK)))
+
+
+def _iter_pdf_pool(file_path, workers, page_numbers):
+    pool = _get_pdf_pool(workers)
+    ranges = (page_numbers[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(page_numbers), PDF_PAGES_PER_TASK))
+    pending = deque(pool.submit(_extract_pdf_page_range, file_path, page_range) for page_range in islice(ranges, workers * 2))
     try:
-        if ext == ".pdf":
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-                    if page_text and page_text.strip():
-                        text += page_text + "\n"
-                    elif reader: # Fallback to OCR if direct text extraction yields nothing
-                        print(f"Attempting OCR for PDF page {page_num + 1} of {os.path.basename(file_path)}...")
-                        # Render page to an image
-                        im = page.to_image(resolution=300) # Higher resolution for better OCR
-                        # Convert PIL Image to numpy array for EasyOCR
-                        img_array = np.array(im.original)
-                        # Perform OCR
-                        ocr_results = reader.readtext(img_array, detail=0) # detail=0 for simpler output (just text)
-                        if ocr_results:
-                            text += " ".join(ocr_results) + "\n"
-                        else:
-                            print(f"No text extracted (digital or OCR) from PDF page {page_num + 1}.")
-            
-            # If after trying all pages, no text is found, raise an error
-            if not text.strip():
-                 raise ValueError("PDF contains no readable digital text and OCR extraction failed or yielded no results.")
-
-        elif ext == ".docx":
-            doc = docx.Document(file_path)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-        elif ext in [".xls", ".xlsx"]:
-            xls = pd.ExcelFile(file_path)
-            for sheet_name in xls.sheet_names:
-                df = xls.parse(sheet_name)
-                # Convert DataFrame to string, handling potential NaN values better
-                text += df.to_string(index=False, header=True, na_rep='').strip() + "\n\n" 
-        elif ext == ".txt":
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-        elif ext in [".png", ".jpg", ".jpeg", ".tiff", ".bmp"]: # Handle direct image files with OCR
-            if reader:
-                print(f"Performing OCR on image file {os.path.basename(file_path)}...")
-                img = Image.open(file_path).convert('RGB') # Ensure RGB for consistent processing
-                img_array = np.array(img)
-                ocr_results = reader.readtext(img_array, detail=0)
-                if ocr_results:
-                    text += " ".join(ocr_results)
-                else:
-                    raise ValueError(f"No text found in image file {ext} using OCR.")
+        while pending:
+            page_range = pending.popleft().result()
+            next_range = next(ranges, None)
+            if next_range:
+                pending.append(pool.submit(_extract_pdf_page_range, file_path, next_range))
+            yield from page_range
+    finally:
+        # The consumer may stop early (error, cancelled upload); don't leave work queued in the pool.
+        for future in pending:
+            future.cancel()
+
+
+def _with_reused(page_count, reused, extracted):
+    # Interleaves the reused records with the freshly extracted pages, in page order
+    for page_num in range(page_count):
+        record = reused.get(page_num)
+        yield record if record is not None else next(extracted)
+
+
+def iter_pdf_pages(file_path, workers=None, reused=None):
+    """
+    Yields a PageRecord for every page of a PDF, in page order, as soon as it is ready.
+    Large documents are spread over a process pool in page ranges; only a small window of
+    ranges is in flight at a time, so finished pages never pile up ahead of the consumer.
+    reused maps page numbers to records carried over from a previous version of the file;
+    those pages are not extracted again.
+    """
+    import pdfplumber
+    reused = reused or {}
+    file_name = os.path.basename(file_path)
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+        page_numbers = [page_num for page_num in range(page_count) if page_num not in reused]
+        workers = _resolve_pdf_workers(workers, len(page_numbers))
+        if workers <= 1:
+            extracted = _extract_pdf_pages(((i, pdf.pages[i]) for i in page_numbers), file_name)
+            yield from _with_reused(page_count, reused, extracted)
+            return
+
+    yield from _with_reused(page_count, reused, _iter_pdf_pool(file_path, workers, page_numbers))
+
+
+def extract_pdf_pages(file_path, workers=None):
+    """Extracts every page of a PDF. Returns a list of PageRecords in page order."""
+    return list(iter_pdf_pages(file_path, workers=workers))
+
+
+def _iter_sections(parts):
+    # Groups streamed text into records of about _SECTION_CHARS, cut at line ends
+    buffered, size, page_num = [], 0, 0
+    start = time.perf_counter()
+    for part in parts:
+        buffered.append(part)
+        size += len(part)
+        if size < _SECTION_CHARS:
+            continue
+        text = "".join(buffered)
+        cut = text.rfind("\n") + 1 or len(text)
+        yield PageRecord(page_num, text[:cut], False, time.perf_counter() - start)
+        page_num += 1
+        buffered, size = [text[cut:]], len(text) - cut
+        start = time.perf_counter()
+    text = "".join(buffered)
+    if text or not page_num:
+        yield PageRecord(page_num, text, False, time.perf_counter() - start)
+
+
+def _iter_single_file(file_path, ext, budget):
+    """
+    Extracts the formats that have no real pages. Word, spreadsheet and text files are read in a
+    stream and yielded in sections, so chunking and KPI scanning start before the file is read to
+    the end and the whole text is never held here; an image is a single record.
+    """
+    if ext == ".docx":
+        # Paragraphs and table rows in document order, streamed (see utils/office.py)
+        yield from _iter_sections(office.iter_docx_text(file_path, budget))
+    elif ext in [".xls", ".xlsx"]:
+        # Row by row, one sheet at a time; empty and irrelevant sheets are skipped
+        yield from _iter_sections(office.iter_spreadsheet_text(file_path, budget))
+    elif ext == ".txt":
+        yield from _iter_sections(office.iter_txt_text(file_path, budget))
+    elif ext in [".png", ".jpg", ".jpeg", ".tiff", ".bmp"]: # Handle direct image files with OCR
+        start = time.perf_counter()
+        reader = get_ocr_reader()
+        if reader:
+            import numpy as np
+            from PIL import Image
+            print(f"Performing OCR on image file {os.path.basename(file_path)}...")
+            img = Image.open(file_path).convert('RGB') # Ensure RGB for consistent processing
+            img_array = np.array(img)
+            ocr_results = reader.readtext(img_array, detail=0)
+            if ocr_results:
+                yield PageRecord(0, " ".join(ocr_results), True, time.perf_counter() - start)
             else:
-                raise RuntimeError("EasyOCR not initialized. Cannot process image files.")
+                raise ValueError(f"No text found in image file {ext} using OCR.")
         else:
-            raise ValueError(f"Unsupported file format: {ext}. Supported types: PDF (with OCR fallback), DOCX, TXT, XLS/XLSX, and Image files (PNG, JPG, JPEG, TIFF, BMP) with OCR.")
-        
-        text = text.strip()
-        if not text:
-            raise ValueError("No readable text extracted from the file.")
+            raise RuntimeError("EasyOCR not initialized. Cannot process image files.")
+    else:
+        raise ValueError(f"Unsupported file format: {ext}. Supported types: PDF (with OCR fallback), DOCX, TXT, XLS/XLSX, and Image files (PNG, JPG, JPEG, TIFF, BMP) with OCR.")
+
+
+def _iter_raw_pages(file_path, ext, budget, workers=None, reused=None):
+    if ext == ".pdf":
+        yield from iter_pdf_pages(file_path, workers=workers, reused=reused)
+    else:
+        yield from _iter_single_file(file_path, ext, budget)
+
+
+def _extractor_settings(ext):
+    # Everything that changes the extracted text for a given file goes into the cache key.
+    return {
+        "ext": ext,
+        "ocr": ocr.settings(),
+        "office": office.settings(),
+    }
+
 
-        return text
+def extraction_key_for_file(file_path, content_hash=None):
+    """Extraction cache key of a file (the cache entry may or may not exist). content_hash: its SHA-256, if known."""
+    ext = os.path.splitext(file_path)[1].lower()
+    return extraction_cache.cache_key(file_path, _extractor_settings(ext), content_hash)
+
+
+def _extraction_error(e, file_path):
+    # Map low-level library errors to more informative ones
+    if "No such file or directory" in str(e):
+        return FileNotFoundError(f"File not found: {file_path}")
+    elif "BadZipFile" in str(e) or "not a valid Word document" in str(e):
+        return ValueError(f"Invalid or corrupted DOCX file: {str(e)}")
+    elif "XLRDError" in str(e) or "excel file format" in str(e):
+        return ValueError(f"Invalid or corrupted Excel file: {str(e)}")
+    elif "PDFInfoNotInstalledError" in str(e) or "pdfplumber.pdf.PDFSyntaxError" in str(e):
+        return ValueError(f"Invalid or corrupted PDF file, or necessary PDF tools not installed: {str(e)}")
+    else:
+        return RuntimeError(f"Failed to extract text from {os.path.basename(file_path)}: {str(e)}")
+
+
+def iter_pages_from_file(file_path, workers=None, use_cache=True, reused=None, content_hash=None):
+    """
+    Streaming extraction API: yields a PageRecord(page_num, text, used_ocr) per page as soon as it
+    is extracted (or read back from the extraction cache). Word, spreadsheet and text files yield
+    sections of about 1 MB of text, images a single record.
+    reused: {page_num: PageRecord} of PDF pages unchanged since a previous version (see
+    utils/revisions.py), which are passed through instead of being extracted again.
+    content_hash: the file's SHA-256 when the caller already has it (saves hashing the file again).
+    Raises the same errors as extract_text_from_file, from the point where extraction fails.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    try:
+        cache_key = None
+        if use_cache and extraction_cache.is_enabled():
+            cache_key = extraction_key_for_file(file_path, content_hash)
+            cached_pages = extraction_cache.load(cache_key)
+            if cached_pages is not None:
+                print(f"✅ Extraction cache hit for {os.path.basename(file_path)}.")
+                for record in cached_pages:
+                    metrics.inc("pages_extracted_total", method="cache")
+                    yield record
+                return
+
+        writer = extraction_cache.open_writer(cache_key, os.path.basename(file_path)) if cache_key else None
+        budget = office.ExtractionBudget(file_path)
+        found_text = False
+        ocr_missing = False
+        try:
+            for record in _iter_raw_pages(file_path, ext, budget, workers=workers, reused=reused):
+                found_text = found_text or bool(record.text.strip())
+                ocr_missing = ocr_missing or record.ocr_missing
+                if reused and record.page_num in reused:
+                    metrics.inc("pages_extracted_total", method="reused")
+                else:
+                    # Per-page timings come from the record: pages may be extracted in pool workers
+                    method = "ocr" if record.used_ocr else "digital"
+                    metrics.inc("pages_extracted_total", method=method)
+                    metrics.observe("page_extract_seconds", record.seconds, method=method, ext=ext)
+                if writer:
+                    writer.add(record)
+                yield record
+
+            if not found_text:
+                if ext == ".pdf":
+                    # If after trying all pages, no text is found, raise an error
+                    raise ValueError("PDF contains no readable digital text and OCR extraction failed or yielded no results.")
+                raise ValueError("No readable text extracted from the file.")
+
+            # Text cut off by the extraction budget, or missing pages that needed OCR when no OCR
+            # reader could be loaded, is used for this upload but not cached: the next upload may
+            # get the whole document (the time budget depends on the load, OCR may load next time)
+            if writer and not budget.exceeded and not ocr_missing:
+                writer.commit()
+                writer = None
+        finally:
+            if writer:
+                writer.abort()
 
     except Exception as e:
-        # Catch and re-raise more informative errors
-        if "No such file or directory" in str(e):
-            raise FileNotFoundError(f"File not found: {file_path}") from e
-        elif "BadZipFile" in str(e) or "not a valid Word document" in str(e):
-            raise ValueError(f"Invalid or corrupted DOCX file: {str(e)}") from e
-        elif "XLRDError" in str(e) or "excel file format" in str(e):
-            raise ValueError(f"Invalid or corrupted Excel file: {str(e)}") from e
-        elif "PDFInfoNotInstalledError" in str(e) or "pdfplumber.pdf.PDFSyntaxError" in str(e):
-             raise ValueError(f"Invalid or corrupted PDF file, or necessary PDF tools not installed: {str(e)}") from e
-        else:
-            raise RuntimeError(f"Failed to extract text from {os.path.basename(file_path)}: {str(e)}")
\ No newline at end of file
+        raise _extraction_error(e, file_path) from e
+
+
+def extract_text_from_file(file_path, workers=None, use_cache=True):
+    with metrics.span("extract_text"):
+        pages = iter_pages_from_file(file_path, workers=workers, use_cache=use_cache)
+        return "\n".join(record.text for record in pages if record.text).strip()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from utils.disk_cache import evict_lru, file_sha256, touch
+
+# Bump whenever extraction output changes for the same input, so stale entries are never served.
+EXTRACTOR_VERSION = 5
+
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(".cache", "extraction"))
+EXTRACTION_CACHE_MAX_MB = float(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+
+
+def is_enabled():
+    return os.getenv("EXTRACTION_CACHE", "1") != "0" and EXTRACTION_CACHE_MAX_MB > 0
+
+
+def cache_key(file_path, settings, content_hash=None):
+    """
+    Content-addressed key: SHA-256 of the file bytes plus the extractor version and settings.
+    Pass content_hash when the file's SHA-256 is already known, so the file isn't read again.
+    """
+    payload = json.dumps(
+        {"file": content_hash or file_sha256(file_path), "version": EXTRACTOR_VERSION, "settings": settings},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    # JSON Lines: a header line, then one line per page, so entries can be written and read page by page.
+    return os.path.join(EXTRACTION_CACHE_DIR, f"{key}.jsonl")
+
+
+def _iter_entry(f):
+    from utils.extract_text import PageRecord
+    with f:
+        for line in f:
+            page = json.loads(line)
+            yield PageRecord(page["page"], page["text"], page["ocr"])
+
+
+def load(key):
+    """
+    Returns an iterator over the cached PageRecords for key, or None on a miss.
+    Pages are read lazily, one line at a time.
+    """
+    path = _entry_path(key)
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Warning: ignoring unreadable extraction cache entry {path}: {e}")
+        return None
+
+    try:
+        header = json.loads(f.readline())
+        if header.get("version") != EXTRACTOR_VERSION:
+            raise ValueError(f"extractor version {header.get('version')}")
+    except (OSError, ValueError, AttributeError) as e:
+        f.close()
+        print(f"Warning: ignoring unreadable extraction cache entry {path}: {e}")
+        return None
+
+    touch(path)
+    return _iter_entry(f)
+
+
+class CacheWriter:
+    """
+    Writes one cache entry page by page. Nothing becomes visible to readers until commit();
+    abort() discards the partial entry (e.g. when extraction fails half-way).
+    """
+
+    def __init__(self, key, file_name=""):
+        self.key = key
+        os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=EXTRACTION_CACHE_DIR, prefix=".tmp-", suffix=".jsonl")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        self._write({"version": EXTRACTOR_VERSION, "file_name": file_name})
+
+    def _write(self, obj):
+        self._file.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+    def add(self, record):
+        if self._file.closed:
+            return
+        try:
+            self._write({"page": record.page_num, "text": record.text, "ocr": record.used_ocr})
+        except OSError as e:
+            print(f"Warning: could not write extraction cache entry: {e}")
+            self.abort()
+
+    def commit(self):
+        if self._file.closed:
+            return
+        try:
+            self._file.close()
+            # Rename into place, so a concurrent reader never sees a half-written entry.
+            os.replace(self._tmp_path, _entry_path(self.key))
+        except OSError as e:
+            print(f"Warning: could not write extraction cache entry: {e}")
+            self.abort()
+            return
+        evict_lru(EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_MB * 1024 * 1024)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class _NullWriter:
+    def add(self, record):
+        pass
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+def open_writer(key, file_name=""):
+    # The cache is an optimisation only; never fail an upload because of it.
+    try:
+        return CacheWriter(key, file_name)
+    except OSError as e:
+        print(f"Warning: could not write extraction cache entry: {e}")
+        return _NullWriter()
+
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from utils.disk_cache import evict_lru, touch
+
+# Bump whenever the on-disk layout changes.
+INDEX_FORMAT_VERSION = 1
+
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", os.path.join(".cache", "faiss"))
+INDEX_STORE_MAX_MB = float(os.getenv("INDEX_STORE_MAX_MB", "1024"))
+
+
+def is_enabled():
+    return os.getenv("INDEX_STORE", "1") != "0" and INDEX_STORE_MAX_MB > 0
+
+
+def index_key(content_hash, settings):
+    """Key for a stored index: the document's content hash plus everything that shapes the index."""
+    payload = json.dumps(
+        {"content": content_hash, "format": INDEX_FORMAT_VERSION, "settings": settings},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_dir(key, store_dir=None):
+    return os.path.join(store_dir or INDEX_STORE_DIR, key)
+
+
+def exists(key, store_dir=None):
+    return os.path.isfile(os.path.join(_entry_dir(key, store_dir), "meta.json"))
+
+
+def _read_index(faiss, path, mmap):
+    if mmap:
+        # Memory-map the vectors instead of reading them into RAM. Only the pages touched by
+        # searches become resident, and several processes share the same page cache.
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            pass # This FAISS build can't mmap this index type; fall back to a regular read
+    return faiss.read_index(path)
+
+
+def load_index(key, mmap=True, store_dir=None):
+    """Returns only the raw FAISS index stored under key (no chunk texts), or None."""
+    entry_dir = _entry_dir(key, store_dir)
+    if not exists(key, store_dir):
+        return None
+
+    import faiss
+
+    try:
+        index = _read_index(faiss, os.path.join(entry_dir, "index.faiss"), mmap)
+    except (OSError, RuntimeError) as e:
+        print(f"Warning: ignoring unreadable index store entry {entry_dir}: {e}")
+        return None
+    touch(entry_dir)
+    return index
+
+
+def load_docstore(key, store_dir=None):
+    """Returns (docstore, index_to_docstore_id) stored under key, or None."""
+    entry_dir = _entry_dir(key, store_dir)
+    try:
+        # Chunk texts and metadata, written by this module (never load pickles from elsewhere).
+        with open(os.path.join(entry_dir, "index.pkl"), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, ValueError) as e:
+        print(f"Warning: ignoring unreadable index store entry {entry_dir}: {e}")
+        return None
+
+
+def load(key, embeddings, mmap=True, store_dir=None):
+    """
+    Returns the stored LangChain FAISS vector store for key, or None if there is none.
+    With mmap=True the index is read-only; pass mmap=False to get an index that can be modified.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    index = load_index(key, mmap=mmap, store_dir=store_dir)
+    stored = load_docstore(key, store_dir) if index is not None else None
+    if stored is None:
+        return None
+    docstore, index_to_docstore_id = stored
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
+def save(key, vectorstore, metadata=None, store_dir=None):
+    """
+    Persists a LangChain FAISS vector store under key. Entries of the default store are then evicted
+    over the size budget; other stores (e.g. the corpus shards) manage their own entries.
+    """
+    tmp_dir = None
+    try:
+        os.makedirs(store_dir or INDEX_STORE_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=store_dir or INDEX_STORE_DIR, prefix=".tmp-")
+        # Writes index.faiss (vectors) and index.pkl (docstore + id mapping)
+        vectorstore.save_local(tmp_dir)
+        meta = {
+            "format": INDEX_FORMAT_VERSION,
+            "chunks": vectorstore.index.ntotal,
+            "created": time.time(),
+            **(metadata or {}),
+        }
+        # meta.json is written last: its presence marks a complete entry
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        entry_dir = _entry_dir(key, store_dir)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        tmp_dir = None
+        if store_dir is None:
+            evict_lru(INDEX_STORE_DIR, INDEX_STORE_MAX_MB * 1024 * 1024)
+    except OSError as e:
+        # The store is an optimisation only; the in-memory index is still usable.
+        print(f"Warning: could not persist FAISS index: {e}")
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
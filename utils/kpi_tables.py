@@ -0,0 +1,251 @@
+import datetime
+import os
+import re
+
+from utils.parse_kpis import KPI_LABELS
+
+# Structured KPI extraction: spreadsheet sheets and PDF tables are read as DataFrames, row labels
+# are mapped to KPIs and whole columns are normalized at once, giving a KPI x period matrix
+# (one column per reporting period) instead of the single first value found in flattened text.
+# pandas/numpy are imported on first use, like the other extractors.
+
+# Row labels that identify a KPI in a table, on top of the text scanner's labels.
+# Labels are compared after _normalize_label().
+_TABLE_LABELS = {
+    "Total Assets": ["total assets"],
+    "Total Liabilities": ["total liabilities"],
+    "Equity": ["total shareholders funds", "shareholders funds", "total shareholders equity", "total equity"],
+    "Cash": ["cash and cash equivalents", "cash and bank balances", "cash"],
+    "Net Profit": ["net profit", "net income", "profit for the year", "profit for the period", "net earnings"],
+    "Revenue": ["revenue", "total revenue", "revenue from operations", "total net sales", "net sales", "sales"],
+    "Current Assets": ["total current assets"],
+    "Current Liabilities": ["total current liabilities"],
+    # Helper row: Total Liabilities is derived from it when a balance sheet has no total line
+    "Non-current Liabilities": ["total non current liabilities"],
+}
+
+KPI_ORDER = list(KPI_LABELS)
+
+# Unit statements such as "in Rs. Cr." or "€ million" found above a table, checked in this order
+_UNIT_MULTIPLIERS = [
+    (re.compile(r"\b(?:crores?|cr)\b"), 10_000_000),
+    (re.compile(r"\b(?:lakhs?|lacs?)\b"), 100_000),
+    (re.compile(r"\b(?:billions?|bn)\b"), 1_000_000_000),
+    (re.compile(r"\b(?:millions?|mn|mio)\b"), 1_000_000),
+    (re.compile(r"\b(?:thousands?|'000|000s)\b"), 1_000),
+]
+
+# Period headers: "Mar 25", "FY24", "2023", "2023-24", "Dec-2024", "Q4 2024" ...
+_PERIOD_RE = re.compile(
+    r"^(?:(?:fy|q[1-4])\s*'?\d{2,4}|(?:19|20)\d{2}(?:\s*[-/]\s*\d{2,4})?|"
+    r"[a-z]{3,9}[\s\-'/]*(?:19|20)?\d{2}|(?:q[1-4]|h[12])\s*(?:19|20)?\d{2})$",
+    re.IGNORECASE,
+)
+
+# How many leading rows are searched for the period header
+_HEADER_SCAN_ROWS = 15
+
+
+def _normalize_label(label):
+    label = re.sub(r"\[.*?\]|\(.*?\)", " ", str(label).lower()) # drop "[Net]", "(Rs. Cr.)" ...
+    return re.sub(r"[^a-z0-9]+", " ", label).strip()
+
+
+_LABEL_TO_KPI = {}
+for _kpi, _labels in list(KPI_LABELS.items()) + list(_TABLE_LABELS.items()):
+    for _label in _labels:
+        _LABEL_TO_KPI.setdefault(_normalize_label(_label), _kpi)
+
+
+def _period_name(value):
+    """Returns a period name for a header cell, or None if the cell isn't a period."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%b %y")
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and 1990 <= value <= 2100 and value == int(value):
+        return str(int(value))
+    if isinstance(value, str) and _PERIOD_RE.match(value.strip()):
+        return value.strip()
+    return None
+
+
+def _unit_multiplier(text):
+    text = text.lower()
+    for pattern, multiplier in _UNIT_MULTIPLIERS:
+        if pattern.search(text):
+            return multiplier
+    return 1
+
+
+def _normalize_column(column):
+    import pandas as pd
+
+    text = column.astype(str).str.strip()
+    text = text.str.replace(r"[,\s$€£₹]", "", regex=True) # thousands separators, currency symbols
+    text = text.str.replace(r"^\((.*)\)$", r"-\1", regex=True) # (1234) -> -1234
+    text = text.str.replace(r"^[-–—]$", "", regex=True) # a lone dash means nil
+    return pd.to_numeric(text, errors="coerce")
+
+
+def normalize_numeric(frame):
+    """
+    Vectorized number cleanup for a whole DataFrame, column by column: thousands separators,
+    parentheses negatives ("(1,234)" -> -1234), dashes for nil and currency symbols.
+    Unparseable cells become NaN.
+    """
+    return frame.apply(_normalize_column)
+
+
+def table_to_kpi_matrix(table, context=""):
+    """
+    Turns one raw table (DataFrame without a header, as read from a sheet or a PDF) into a
+    KPI x period DataFrame. context is extra text (e.g. sheet or page title) searched for a unit
+    statement. Returns None if the table has no period header or no KPI rows.
+    """
+    if table is None or table.empty:
+        return None
+    table = table.dropna(how="all").dropna(axis=1, how="all").reset_index(drop=True)
+    if table.empty:
+        return None
+
+    # Header row: the leading row with the most period-like cells
+    header_row, period_columns = None, {}
+    for row_index in range(min(_HEADER_SCAN_ROWS, len(table))):
+        periods = {}
+        for column, value in table.iloc[row_index].items():
+            name = _period_name(value)
+            if name and name not in periods.values():
+                periods[column] = name
+        if len(periods) > len(period_columns):
+            header_row, period_columns = row_index, periods
+    if header_row is None:
+        return None
+
+    # Label column: the non-period column with the most text cells below the header
+    body = table.iloc[header_row + 1:]
+    label_candidates = [column for column in table.columns if column not in period_columns]
+    if not label_candidates:
+        return None
+    label_column = max(label_candidates, key=lambda column: body[column].map(lambda v: isinstance(v, str)).sum())
+
+    kpis = body[label_column].map(_normalize_label).map(_LABEL_TO_KPI)
+    rows = body[kpis.notna()]
+    if rows.empty:
+        return None
+
+    values = normalize_numeric(rows[list(period_columns)])
+    values.columns = list(period_columns.values())
+    values.index = kpis[kpis.notna()].values
+
+    header_text = " ".join(str(v) for v in table.iloc[:header_row + 1].values.ravel() if isinstance(v, str))
+    values = values * _unit_multiplier(f"{context} {header_text}")
+    # A KPI can appear on several rows (e.g. in two statements); keep the first value per period
+    return values.groupby(level=0, sort=False).first()
+
+
+def _combine(matrices):
+    import pandas as pd
+
+    matrix = None
+    for table_matrix in matrices:
+        if table_matrix is None:
+            continue
+        matrix = table_matrix if matrix is None else matrix.combine_first(table_matrix)
+    if matrix is None:
+        return pd.DataFrame()
+
+    # Derive Total Liabilities from its current and non-current parts where it wasn't reported
+    if {"Current Liabilities", "Non-current Liabilities"} <= set(matrix.index):
+        derived = matrix.loc["Current Liabilities"] + matrix.loc["Non-current Liabilities"]
+        if "Total Liabilities" in matrix.index:
+            matrix.loc["Total Liabilities"] = matrix.loc["Total Liabilities"].fillna(derived)
+        else:
+            matrix.loc["Total Liabilities"] = derived
+
+    rows = [kpi for kpi in KPI_ORDER if kpi in matrix.index]
+    return matrix.loc[rows].dropna(axis=1, how="all")
+
+
+# Multi-word row labels only: single words like "cash" or "sales" appear on nearly every page
+_PAGE_HINTS = [label for labels in _TABLE_LABELS.values() for label in labels if " " in label]
+
+
+def page_may_have_kpi_table(text):
+    """Cheap pre-check used to pick the PDF pages worth running table detection on."""
+    text = text.lower()
+    return any(hint in text for hint in _PAGE_HINTS)
+
+
+def _spreadsheet_tables(file_path):
+    import pandas as pd
+    from utils.office import iter_sheet_rows
+
+    # Streamed one sheet at a time, skipping sheets without figures (see utils/office.py). Every cell
+    # is kept (no header row); the period header is located per sheet.
+    for sheet_name, rows in iter_sheet_rows(file_path):
+        yield pd.DataFrame(list(rows)), sheet_name
+
+
+def _pdf_tables(file_path, pages=None):
+    import pandas as pd
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        page_numbers = range(len(pdf.pages)) if pages is None else [p for p in pages if 0 <= p < len(pdf.pages)]
+        for page_num in page_numbers:
+            page = pdf.pages[page_num]
+            for rows in page.extract_tables():
+                if rows:
+                    yield pd.DataFrame(rows), ""
+            page.close()
+
+
+def extract_kpi_matrix(file_path, pages=None):
+    """
+    Structured multi-period KPI extraction for spreadsheets and PDFs.
+    Returns a DataFrame with one row per KPI and one column per reporting period (empty if no
+    KPI table was found). For PDFs, pages limits table detection to those page numbers.
+    """
+    import pandas as pd
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in [".xls", ".xlsx"]:
+        tables = _spreadsheet_tables(file_path)
+    elif ext == ".pdf":
+        tables = _pdf_tables(file_path, pages)
+    else:
+        return pd.DataFrame()
+    return _combine(table_to_kpi_matrix(table, context) for table, context in tables)
+
+
+def compute_period_ratios(matrix):
+    """
+    Computes the financial ratios for every period at once from a KPI x period matrix.
+    Returns a ratio x period DataFrame; ratios that can't be computed for a period are NaN.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if matrix.empty:
+        return pd.DataFrame()
+    m = matrix.reindex(KPI_ORDER)
+    ratios = pd.DataFrame({
+        "Debt-to-Equity": m.loc["Total Liabilities"] / m.loc["Equity"],
+        "Current Ratio": m.loc["Current Assets"] / m.loc["Current Liabilities"],
+        "Working Capital": m.loc["Current Assets"] - m.loc["Current Liabilities"],
+        "Net Profit Margin (%)": m.loc["Net Profit"] / m.loc["Revenue"] * 100,
+    }).T
+    # Division by zero gives inf; treat it like a missing value
+    return ratios.replace([np.inf, -np.inf], np.nan).round(2).dropna(how="all")
+
+
+def matrix_to_markdown(matrix, number_format="{:,.2f}"):
+    """Renders a KPI/ratio x period DataFrame as a Markdown table."""
+    if matrix.empty:
+        return ""
+    header = "| | " + " | ".join(str(column) for column in matrix.columns) + " |\n"
+    header += "|---" * (len(matrix.columns) + 1) + "|\n"
+    rows = []
+    for name, values in matrix.iterrows():
+        cells = ["" if value != value else number_format.format(value) for value in values] # NaN != NaN
+        rows.append(f"| **{name}** | " + " | ".join(cells) + " |")
+    return header + "\n".join(rows) + "\n"
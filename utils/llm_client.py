@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+from typing import Optional
+
+from utils import metrics
+
+# Shared LLM client. Every Groq call (summaries and Q&A) goes through one pooled HTTP client, so
+# connections are reused across requests and users. Requests are:
+#   - retried on 429, 5xx and connection errors, with full-jitter exponential backoff (at least
+#     the server's Retry-After)
+#   - admitted by an adaptive limiter: token buckets for requests and tokens, sized and refilled
+#     from the x-ratelimit-* response headers, plus a concurrency limit that halves on every 429
+#     and grows back by one after that many successes
+#   - deduplicated: an identical request that is already in flight is joined, not sent again
+# so a burst of users slows down under rate limiting instead of failing.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60")) # seconds per attempt
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5")) # seconds, doubled per attempt
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", "20"))
+LLM_DEDUP = os.getenv("LLM_DEDUP", "1") != "0"
+
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class LLMError(RuntimeError):
+    """A chat completion that failed for good (retries exhausted, or a non-retryable status)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _parse_duration(value):
+    """Seconds in a rate-limit header: "7.66s", "2m59.56s", "120ms" or a bare number. None if absent."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts) if parts else None
+
+
+def _parse_number(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# --------------------------
+# 🚦 Rate limiting
+# --------------------------
+class _Bucket:
+    """Token bucket. Unlimited until the first rate-limit headers arrive; refilled at the rate they imply."""
+
+    def __init__(self):
+        self.capacity = None
+        self.level = 0.0
+        self.rate = 0.0 # units per second
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        self._refill(now)
+        if self.capacity is None:
+            return 0.0
+        cost = min(cost, self.capacity)
+        if self.level >= cost:
+            return 0.0
+        return (cost - self.level) / self.rate if self.rate > 0 else 1.0
+
+    def take(self, cost):
+        if self.capacity is not None:
+            self.level -= min(cost, self.capacity)
+
+    def update(self, limit, remaining, reset, now):
+        if remaining is None:
+            return
+        self._refill(now)
+        first = self.capacity is None
+        self.capacity = max(limit or self.capacity or 0, remaining, 1)
+        # The server's count wins when it is lower (other clients share the key)
+        self.level = remaining if first else min(self.level, remaining)
+        # reset is the time until the bucket is full again, so the deficit refills over it
+        if reset:
+            deficit = self.capacity - remaining
+            self.rate = deficit / reset if deficit > 0 else max(self.rate, self.capacity / reset)
+        if self.rate <= 0:
+            self.rate = self.capacity / 60
+
+
+class RateLimiter:
+    """
+    Admits requests while the request and token buckets allow it and fewer than the current
+    concurrency limit are in flight. The limit adapts AIMD-style: halved on a 429, increased by
+    1/limit on every success, never above max_concurrency.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.requests = _Bucket()
+        self.tokens = _Bucket()
+        self._cond = threading.Condition()
+
+    def acquire(self, cost):
+        """Blocks until a request estimated at cost tokens may be sent."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(cost, now))
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.requests.take(1)
+                    self.tokens.take(cost)
+                    self.in_flight += 1
+                    return
+                # Woken early by release() when a slot frees up or the headers change the budget
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, status=None, headers=None):
+        """Records the outcome of an acquired request (status None: no response) and its headers."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            headers = headers or {}
+            for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+                bucket.update(
+                    _parse_number(headers.get(f"x-ratelimit-limit-{kind}")),
+                    _parse_number(headers.get(f"x-ratelimit-remaining-{kind}")),
+                    _parse_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+                    now,
+                )
+            if status == 429:
+                self.limit = max(1.0, self.limit / 2)
+                # Everyone waits out the server's Retry-After, not just the request that got the 429
+                retry_after = _parse_duration(headers.get("retry-after")) or LLM_BACKOFF_BASE
+                self.paused_until = max(self.paused_until, now + retry_after)
+            elif status is not None and status < 400:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+# --------------------------
+# 🔌 Client
+# --------------------------
+def _namespace(value):
+    # JSON -> attribute access, the shape of the Groq SDK's response objects
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+def _error_detail(response):
+    try:
+        body = response.json()
+        error = body.get("error", body) if isinstance(body, dict) else body
+        return error.get("message", str(error)) if isinstance(error, dict) else str(error)
+    except ValueError:
+        return response.text[:200]
+
+
+def _token_cost(payload):
+    # Rate limits count the prompt and the completion budget
+    from utils.compaction import count_tokens
+
+    prompt = "\n".join(str(message.get("content", "")) for message in payload.get("messages", ()))
+    return count_tokens(prompt) + int(payload.get("max_tokens") or 0)
+
+
+class LLMClient:
+    """
+    Pooled, retrying, rate-limited client for the OpenAI-compatible chat completions API of Groq.
+    client.chat.completions.create(...) mirrors the Groq SDK, so it is a drop-in for groq.Groq.
+    """
+
+    def __init__(self, api_key=None, base_url=GROQ_BASE_URL, limiter=None, max_retries=LLM_MAX_RETRIES,
+                 dedup=LLM_DEDUP, pool_connections=LLM_POOL_CONNECTIONS, timeout=LLM_TIMEOUT):
+        import httpx
+
+        self.max_retries = max_retries
+        self.dedup = dedup
+        self.limiter = limiter or RateLimiter()
+        self._http = httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_connections, max_keepalive_connections=pool_connections),
+            headers={"Authorization": f"Bearer {api_key or os.getenv('GROQ_API_KEY', '')}"},
+        )
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, model, **params):
+        """Chat completion with the Groq SDK's signature; returns the response with attribute access."""
+        payload = {"model": model, "messages": messages, **{key: value for key, value in params.items() if value is not None}}
+        return _namespace(self.request(payload))
+
+    def request(self, payload):
+        """Posts a chat completion request and returns the response JSON. Identical requests in flight share one call."""
+        if not self.dedup:
+            return self._send(payload)
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            metrics.inc("llm_dedup_hits_total", model=payload.get("model", ""))
+            return future.result()
+        try:
+            result = self._send(payload)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _backoff(self, attempt, headers):
+        # Full jitter, so clients that failed together don't retry together
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        retry_after = _parse_duration((headers or {}).get("retry-after"))
+        return max(delay, retry_after or 0.0)
+
+    def _send(self, payload):
+        import httpx
+
+        model = payload.get("model", "")
+        cost = _token_cost(payload)
+        for attempt in range(self.max_retries + 1):
+            with metrics.span("llm_queue", model=model):
+                self.limiter.acquire(cost)
+            response, headers, failure = None, None, None
+            try:
+                response = self._http.post("chat/completions", json=payload)
+                headers = {key.lower(): value for key, value in response.headers.items()}
+            except httpx.TransportError as e: # timeouts, refused or dropped connections
+                failure = e
+            finally:
+                self.limiter.release(response.status_code if response is not None else None, headers)
+
+            status = response.status_code if response is not None else None
+            metrics.inc("llm_responses_total", model=model, status=str(status or "error"))
+            if status is not None and status < 400:
+                return response.json()
+            if status is not None and status not in RETRY_STATUSES:
+                raise LLMError(f"HTTP {status}: {_error_detail(response)}", status)
+            if attempt == self.max_retries:
+                break
+            metrics.inc("llm_retries_total", model=model, reason=str(status or type(failure).__name__))
+            time.sleep(self._backoff(attempt, headers))
+
+        attempts = self.max_retries + 1
+        if status == 429:
+            raise LLMError(f"Rate limit exceeded (HTTP 429) after {attempts} attempts: {_error_detail(response)}", status)
+        if status is not None:
+            raise LLMError(f"HTTP {status} after {attempts} attempts: {_error_detail(response)}", status)
+        raise LLMError(f"Could not reach {self._http.base_url} after {attempts} attempts: {failure}")
+
+    def close(self):
+        self._http.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide LLM client (created on first use)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+                metrics.register_gauge("llm_in_flight", lambda: _client.limiter.in_flight)
+                metrics.register_gauge("llm_concurrency_limit", lambda: _client.limiter.limit)
+    return _client
+
+
+# --------------------------
+# 🦜 LangChain chat model
+# --------------------------
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+_chat_model_class = None
+
+
+def get_chat_model(model, temperature=None):
+    """A LangChain chat model whose requests go through the shared client (see get_client())."""
+    global _chat_model_class
+    if _chat_model_class is None:
+        from langchain_core.language_models.chat_models import BaseChatModel
+        from langchain_core.messages import AIMessage
+        from langchain_core.outputs import ChatGeneration, ChatResult
+
+        class PooledChatModel(BaseChatModel):
+            model: str
+            temperature: Optional[float] = None
+
+            @property
+            def _llm_type(self):
+                return "pooled-groq"
+
+            def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+                payload = {
+                    "model": self.model,
+                    "messages": [{"role": _ROLES.get(message.type, "user"), "content": message.content} for message in messages],
+                }
+                if self.temperature is not None:
+                    payload["temperature"] = self.temperature
+                if stop:
+                    payload["stop"] = stop
+                response = get_client().request(payload)
+                content = response["choices"][0]["message"].get("content") or ""
+                return ChatResult(
+                    generations=[ChatGeneration(message=AIMessage(content=content))],
+                    llm_output={"token_usage": response.get("usage") or {}, "model_name": self.model},
+                )
+
+        _chat_model_class = PooledChatModel
+    return _chat_model_class(model=model, temperature=temperature)
@@ -0,0 +1,222 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Lightweight, stdlib-only instrumentation: timing spans, counters and gauges kept in-process,
+# exported in Prometheus text format (/metrics) or JSON (/metrics.json), plus one-line JSON logs.
+#
+# METRICS_PORT: start the metrics HTTP server on this port (0 = off).
+# METRICS_LOG: set to 0 to silence the structured JSON log lines.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LOG = os.getenv("METRICS_LOG", "1") != "0"
+
+PREFIX = "fda_"
+
+# Histogram buckets (seconds): from a single KPI scan up to a whole map-reduce summary
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_lock = threading.Lock()
+_counters = {} # (name, labels) -> value
+_histograms = {} # (name, labels) -> [bucket counts..., count, sum, max]
+_gauges = {} # name -> callable returning a number
+_started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds value to a counter, e.g. inc("llm_tokens_total", 512, kind="prompt")."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Records one duration in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * len(BUCKETS) + [0, 0.0, 0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-3] += 1
+        histogram[-2] += seconds
+        histogram[-1] = max(histogram[-1], seconds)
+
+
+def register_gauge(name, fn):
+    """Registers a gauge whose value is read from fn() at export time."""
+    with _lock:
+        _gauges[name] = fn
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (0 where the resource module isn't available)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def log_event(event, **fields):
+    """Writes one structured JSON log line."""
+    if not METRICS_LOG:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, **fields}
+    print(json.dumps(record, default=str), flush=True)
+
+
+@contextmanager
+def span(name, log=False, **labels):
+    """
+    Times a block and records it in the "<name>_seconds" histogram. With log=True a structured
+    log line with the duration and the process's peak RSS is written as well.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(f"{name}_seconds", seconds, **labels)
+        if status == "error":
+            inc(f"{name}_errors_total", **labels)
+        if log:
+            log_event("span", span=name, seconds=round(seconds, 4), status=status, peak_rss_mb=round(peak_rss_bytes() / 1048576, 1), **labels)
+
+
+def timed(name, log=False):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, log=log):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+register_gauge("peak_rss_bytes", peak_rss_bytes)
+register_gauge("uptime_seconds", lambda: time.time() - _started)
+
+
+def _gauge_values():
+    with _lock:
+        gauges = dict(_gauges)
+    values = {}
+    for name, fn in gauges.items():
+        try:
+            values[name] = float(fn())
+        except Exception:
+            continue
+    return values
+
+
+def snapshot():
+    """All metrics as a JSON-serializable dict."""
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in _counters.items()]
+        histograms = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": h[-3],
+                "sum": round(h[-2], 6),
+                "max": round(h[-1], 6),
+                "mean": round(h[-2] / h[-3], 6) if h[-3] else 0.0,
+            }
+            for (name, labels), h in _histograms.items()
+        ]
+    return {"counters": counters, "histograms": histograms, "gauges": _gauge_values()}
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(h)) for key, h in _histograms.items())
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            typed.add(name)
+        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+    for (name, labels), h in histograms:
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            typed.add(name)
+        for bound, count in zip(BUCKETS, h):
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {h[-3]}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {h[-3]}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {h[-2]}")
+    for name, value in sorted(_gauge_values().items()):
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        lines.append(f"{PREFIX}{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+_server = None
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """
+    Serves /metrics (Prometheus text) and /metrics.json from a daemon thread.
+    Does nothing if port is 0 or the server is already running. Returns the server or None.
+    """
+    global _server
+    if not port or _server is not None:
+        return _server
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body, content_type = prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                body, content_type = json.dumps(snapshot()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes would otherwise flood the console
+
+    try:
+        _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Warning: could not start metrics server on port {port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics available at http://{host}:{port}/metrics and /metrics.json")
+    return _server
@@ -0,0 +1,155 @@
+import math
+import os
+import statistics
+
+# Adaptive OCR for PDF pages: only the regions without a text layer are rendered, each at a DPI
+# picked for that region, and the rendered images are recognized in batches.
+#
+# OCR_MIN_DPI / OCR_MAX_DPI: bounds for the render resolution (300 was the previous fixed value).
+# OCR_TARGET_GLYPH_PX: render so that text comes out about this many pixels tall.
+# OCR_MAX_PIXELS: cap on the pixels of one rendered region (keeps huge pages in check).
+# OCR_MIN_REGION_FRACTION: images smaller than this share of the page (logos, icons) are ignored.
+# OCR_IMAGE_REGIONS: also OCR large images without text on pages that do have a text layer.
+# OCR_BATCH_SIZE: images per recognition call.
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "150"))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", "300"))
+OCR_TARGET_GLYPH_PX = int(os.getenv("OCR_TARGET_GLYPH_PX", "24"))
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "12000000"))
+OCR_MIN_REGION_FRACTION = float(os.getenv("OCR_MIN_REGION_FRACTION", "0.05"))
+OCR_IMAGE_REGIONS = os.getenv("OCR_IMAGE_REGIONS", "1") != "0"
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+
+
+def settings():
+    """Everything here that changes the OCR output, for the extraction cache key."""
+    return {
+        "min_dpi": OCR_MIN_DPI,
+        "max_dpi": OCR_MAX_DPI,
+        "glyph_px": OCR_TARGET_GLYPH_PX,
+        "max_pixels": OCR_MAX_PIXELS,
+        "min_region": OCR_MIN_REGION_FRACTION,
+        "image_regions": OCR_IMAGE_REGIONS,
+    }
+
+
+def _area(bbox):
+    x0, top, x1, bottom = bbox
+    return max(0.0, x1 - x0) * max(0.0, bottom - top)
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge(boxes):
+    """Merges overlapping boxes, so overlapping images are rendered and recognized once."""
+    merged = []
+    for box in sorted(boxes):
+        for i, other in enumerate(merged):
+            if _overlaps(box, other):
+                merged[i] = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                break
+        else:
+            merged.append(box)
+    return merged if len(merged) == len(boxes) else _merge(merged)
+
+
+def choose_dpi(page, bbox, images=()):
+    """
+    Render resolution for one region: enough for glyphs of OCR_TARGET_GLYPH_PX pixels when the page's
+    text size is known, never above the embedded scan's own resolution (more pixels add no detail),
+    and within OCR_MAX_PIXELS for the region.
+    """
+    dpi = OCR_MAX_DPI
+    sizes = [char["size"] for char in page.chars if char.get("size")]
+    if sizes:
+        dpi = OCR_TARGET_GLYPH_PX * 72 / statistics.median(sizes)
+    native = [
+        image["srcsize"][0] * 72 / (image["x1"] - image["x0"])
+        for image in images
+        if image.get("srcsize") and image["x1"] > image["x0"]
+    ]
+    if native:
+        dpi = min(dpi, max(native))
+    dpi = max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi))
+    width_in, height_in = (bbox[2] - bbox[0]) / 72, (bbox[3] - bbox[1]) / 72
+    if width_in > 0 and height_in > 0:
+        dpi = min(dpi, math.sqrt(OCR_MAX_PIXELS / (width_in * height_in)))
+    return int(dpi)
+
+
+def plan_regions(page, has_text):
+    """
+    Returns the regions of a pdfplumber page that need OCR, as (bbox, dpi) pairs in reading order.
+    Pages without a text layer get their large images (or the whole page if it has none); pages with
+    text get only large images that contain no characters (scanned tables, charts with labels).
+    """
+    page_bbox = (page.bbox[0], page.bbox[1], page.bbox[2], page.bbox[3])
+    min_area = OCR_MIN_REGION_FRACTION * _area(page_bbox)
+    images = []
+    for image in page.images:
+        # Clip to the page; scans are often placed slightly past its edges
+        box = (max(image["x0"], page_bbox[0]), max(image["top"], page_bbox[1]), min(image["x1"], page_bbox[2]), min(image["bottom"], page_bbox[3]))
+        if _area(box) >= min_area:
+            images.append((box, image))
+
+    if not has_text:
+        if not images:
+            return [(page_bbox, choose_dpi(page, page_bbox))]
+        boxes = _merge([box for box, _ in images])
+    elif OCR_IMAGE_REGIONS and images:
+        chars = page.chars
+        boxes = _merge([
+            box for box, _ in images
+            if not any(box[0] <= c["x0"] and c["x1"] <= box[2] and box[1] <= c["top"] and c["bottom"] <= box[3] for c in chars)
+        ])
+    else:
+        return []
+
+    regions = []
+    for box in sorted(boxes, key=lambda b: (b[1], b[0])):
+        inside = [image for image_box, image in images if _overlaps(image_box, box)]
+        regions.append((box, choose_dpi(page, box, inside)))
+    return regions
+
+
+def render_region(page, bbox, dpi):
+    """Renders only bbox of the page, as an RGB numpy array."""
+    import numpy as np
+
+    region = page if tuple(bbox) == tuple(page.bbox) else page.crop(bbox)
+    image = region.to_image(resolution=dpi).original.convert("RGB")
+    return np.array(image)
+
+
+def _pad(image, height, width):
+    import numpy as np
+
+    if image.shape[0] == height and image.shape[1] == width:
+        return image
+    padded = np.full((height, width, image.shape[2]), 255, dtype=image.dtype) # white, like paper
+    padded[:image.shape[0], :image.shape[1]] = image
+    return padded
+
+
+def recognize(reader, images, batch_size=OCR_BATCH_SIZE):
+    """
+    Returns the recognized text of every image. Images are grouped by size and padded to a common
+    shape so several go through EasyOCR's batched inference in one call.
+    """
+    if not images:
+        return []
+    if batch_size <= 1 or len(images) == 1 or not hasattr(reader, "readtext_batched"):
+        return [" ".join(reader.readtext(image, detail=0)) for image in images]
+
+    texts = [""] * len(images)
+    # Similar sizes in the same batch keep the padding (wasted pixels) small
+    order = sorted(range(len(images)), key=lambda i: images[i].shape[0] * images[i].shape[1])
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        height = max(images[i].shape[0] for i in batch)
+        width = max(images[i].shape[1] for i in batch)
+        results = reader.readtext_batched([_pad(images[i], height, width) for i in batch], detail=0, batch_size=len(batch))
+        for i, words in zip(batch, results):
+            texts[i] = " ".join(words)
+    return texts
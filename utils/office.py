@@ -0,0 +1,292 @@
+import datetime
+import os
+import time
+import zipfile
+from itertools import chain, islice
+from xml.etree.ElementTree import iterparse
+
+from utils import metrics
+from utils.parse_kpis import KPI_LABELS
+
+# Streaming readers for spreadsheets and Word documents, so memory stays bounded for very large
+# files (e.g. multi-hundred-MB ERP exports):
+#   - .xlsx rows are read one at a time from a read-only workbook; .xls sheets are loaded one at a
+#     time and released after use
+#   - .docx body XML is parsed incrementally; paragraphs and table rows come out in document order
+#   - hidden sheets, empty sheets and sheets whose first SHEET_SCAN_ROWS rows hold no numbers and
+#     no KPI labels are skipped without reading them to the end (SHEET_SCAN_ROWS=0 keeps every sheet)
+#   - each document has a budget: reading stops once EXTRACT_MAX_MB of text has been produced or
+#     EXTRACT_MAX_SECONDS have passed, and the text read so far is used (0 = no limit)
+SHEET_SCAN_ROWS = int(os.getenv("SHEET_SCAN_ROWS", "50"))
+EXTRACT_MAX_MB = float(os.getenv("EXTRACT_MAX_MB", "64"))
+EXTRACT_MAX_SECONDS = float(os.getenv("EXTRACT_MAX_SECONDS", "300"))
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_KPI_HINTS = tuple(label.strip() for labels in KPI_LABELS.values() for label in labels)
+_TXT_CHUNK_CHARS = 1 << 20
+
+
+def settings():
+    """
+    Settings that change the extracted text (part of the extraction cache key). The budget isn't
+    one of them: text cut off by the budget is never cached.
+    """
+    return {"sheet_scan_rows": SHEET_SCAN_ROWS}
+
+
+class ExtractionBudget:
+    """Per-document limit on the text produced (which is what grows with the file) and on time."""
+
+    def __init__(self, file_name, max_mb=EXTRACT_MAX_MB, max_seconds=EXTRACT_MAX_SECONDS):
+        self.file_name = os.path.basename(file_name)
+        self.max_chars = int(max_mb * 1024 * 1024) if max_mb > 0 else 0
+        self.deadline = time.monotonic() + max_seconds if max_seconds > 0 else None
+        self.chars = 0
+        self.exceeded = None # "size" or "time" once spent
+
+    def charge(self, chars):
+        """Adds chars of output. Returns False once the budget is spent."""
+        if self.exceeded:
+            return False
+        self.chars += chars
+        if self.max_chars and self.chars > self.max_chars:
+            self._exceed("size")
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            self._exceed("time")
+        return not self.exceeded
+
+    def _exceed(self, reason):
+        self.exceeded = reason
+        metrics.inc("extraction_budget_exceeded_total", reason=reason)
+        print(f"Warning: {self.file_name} exceeds the extraction {reason} budget; the rest of the document is skipped.")
+
+
+# --------------------------
+# 📊 Spreadsheets
+# --------------------------
+def _trim(row):
+    # Trailing empty cells are formatting, not data; leading ones keep the column positions
+    end = len(row)
+    while end and (row[end - 1] is None or row[end - 1] == ""):
+        end -= 1
+    return list(row[:end])
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _looks_relevant(rows):
+    # Cheap header scan: financial sheets have figures, or at least KPI labels, near the top
+    for row in rows:
+        for value in row:
+            if _is_number(value) or isinstance(value, datetime.date):
+                return True
+            if isinstance(value, str) and any(hint in value.lower() for hint in _KPI_HINTS):
+                return True
+    return False
+
+
+def _xlsx_sheets(file_path):
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile) as e:
+        raise ValueError(f"Invalid excel file format: {e}") from e
+    try:
+        for sheet in workbook.worksheets:
+            if sheet.sheet_state != "visible" and SHEET_SCAN_ROWS:
+                yield sheet.title, None
+                continue
+            if hasattr(sheet, "reset_dimensions"):
+                sheet.reset_dimensions() # exports often declare a wrong used range; read what is there
+            yield sheet.title, sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _xls_sheets(file_path):
+    import xlrd
+
+    workbook = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        for index in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(index)
+            if sheet.visibility != 0 and SHEET_SCAN_ROWS:
+                yield sheet.name, None
+            else:
+                yield sheet.name, (_xls_row(workbook, sheet, row) for row in range(sheet.nrows))
+            workbook.unload_sheet(index)
+    finally:
+        workbook.release_resources()
+
+
+def _xls_row(workbook, sheet, row):
+    import xlrd
+
+    values = []
+    for cell in sheet.row(row):
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            values.append(xlrd.xldate.xldate_as_datetime(cell.value, workbook.datemode))
+        elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+            values.append(None)
+        else:
+            values.append(cell.value)
+    return values
+
+
+def iter_sheet_rows(file_path, budget=None):
+    """
+    Streams the relevant sheets of a .xlsx/.xls workbook: yields (sheet_name, rows), where rows
+    iterates the sheet's non-empty rows as lists of cell values. Consume rows before advancing to
+    the next sheet. Stops early when the budget is spent.
+    """
+    budget = budget or ExtractionBudget(file_path)
+    ext = os.path.splitext(file_path)[1].lower()
+    sheets = _xls_sheets(file_path) if ext == ".xls" else _xlsx_sheets(file_path)
+
+    def non_empty(rows):
+        for row in rows:
+            row = _trim(row)
+            if not budget.charge(sum(len(str(value)) for value in row if value is not None)):
+                return
+            if row:
+                yield row
+
+    for sheet_name, rows in sheets:
+        if budget.exceeded:
+            break
+        if rows is None:
+            metrics.inc("sheets_skipped_total", reason="hidden")
+            continue
+        rows = non_empty(rows)
+        if SHEET_SCAN_ROWS:
+            head = list(islice(rows, SHEET_SCAN_ROWS))
+            if not head:
+                metrics.inc("sheets_skipped_total", reason="empty")
+                continue
+            if not _looks_relevant(head):
+                metrics.inc("sheets_skipped_total", reason="irrelevant")
+                continue
+            rows = chain(head, rows)
+        yield sheet_name, rows
+
+
+def _format_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def iter_spreadsheet_text(file_path, budget=None):
+    """Text of a workbook, a line per row ("|"-separated cells) under a "Sheet: <name>" line per sheet."""
+    for sheet_name, rows in iter_sheet_rows(file_path, budget):
+        yield f"Sheet: {sheet_name}\n"
+        for row in rows:
+            yield " | ".join(_format_cell(value) for value in row) + "\n"
+        yield "\n"
+
+
+# --------------------------
+# 📝 Word documents
+# --------------------------
+def _paragraph_text(paragraph):
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == _W + "t":
+            parts.append(node.text or "")
+        elif node.tag == _W + "tab":
+            parts.append("\t")
+        elif node.tag in (_W + "br", _W + "cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def iter_docx_blocks(file_path):
+    """
+    Streams the body of a .docx: yields each paragraph's text and each table row ("|"-separated
+    cells) in document order. The XML is parsed incrementally and processed elements are freed.
+    """
+    try:
+        archive = zipfile.ZipFile(file_path)
+        source = archive.open("word/document.xml")
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"File is not a valid Word document: {e}") from e
+
+    with archive, source:
+        body = None
+        tables = [] # open tables (they nest)
+        cells, rows = [], [] # paragraphs of the open cells, cells of the open rows
+        for event, element in iterparse(source, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == _W + "body":
+                    body = element
+                elif tag == _W + "tbl":
+                    tables.append(element)
+                elif tag == _W + "tr":
+                    rows.append([])
+                elif tag == _W + "tc":
+                    cells.append([])
+                continue
+
+            if tag == _W + "p":
+                text = _paragraph_text(element)
+                element.clear()
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    yield text
+                    # A top-level paragraph is done: free it and everything before it
+                    if body is not None:
+                        body.clear()
+            elif tag == _W + "tc" and cells:
+                rows[-1].append(" ".join(text.strip() for text in cells.pop() if text.strip()))
+                element.clear()
+            elif tag == _W + "tr" and rows:
+                line = " | ".join(rows.pop())
+                element.clear()
+                if tables:
+                    try:
+                        tables[-1].remove(element) # rows of a long table must not pile up
+                    except ValueError:
+                        pass
+                if cells: # a table nested in a cell becomes part of that cell's text
+                    cells[-1].append(line)
+                else:
+                    yield line
+            elif tag == _W + "tbl" and tables:
+                tables.pop()
+                if not tables and body is not None:
+                    body.clear()
+
+
+def iter_docx_text(file_path, budget=None):
+    budget = budget or ExtractionBudget(file_path)
+    for block in iter_docx_blocks(file_path):
+        if not budget.charge(len(block) + 1):
+            break
+        yield block + "\n"
+
+
+# --------------------------
+# 📃 Plain text
+# --------------------------
+def iter_txt_text(file_path, budget=None):
+    budget = budget or ExtractionBudget(file_path)
+    with open(file_path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(_TXT_CHUNK_CHARS)
+            if not chunk:
+                break
+            yield chunk
+            if not budget.charge(len(chunk)):
+                break
@@ -1,4 +1,47 @@
 import re
+from bisect import bisect_left
+from heapq import heapify, heappop, heappush
+
+from utils import metrics
+
+# Multiplier detection, compiled once instead of on every candidate value
+_THOUSANDS_RE = re.compile(r'\b(in thousands|\d{3}s?|k)\b')
+_MILLIONS_RE = re.compile(r'\b(in millions|mm|m)\b')
+_PER_SQUARE_METRE_RE = re.compile(r'\bper square metre\b')
+_BILLIONS_RE = re.compile(r'\b(in billions|bn|b)\b')
+
+# Define patterns with a wider capture group to include potential multipliers
+# The (?:...) is a non-capturing group.
+# We try to capture some context around the number for multiplier detection.
+# The number itself is in the last capturing group ([\d,\.]+)
+_KPI_PATTERNS = {key: re.compile(pattern, re.IGNORECASE) for key, pattern in {
+    "Total Assets": r"(?:Total assets|Assets, total|Total Current and Non-current Assets)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Total Liabilities": r"(?:Total liabilities|Liabilities, total|Total Current and Non-current Liabilities)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Equity": r"(?:Shareholders' equity|Total equity|Equity attributable to(?: parent| owners)?)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Cash": r"Cash (?:and cash equivalents)?\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Net Profit": r"(?:Net income|Profit(?: and loss)?|Net earnings)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Revenue": r"(?:Total net sales|Revenue|Sales)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Current Assets": r"(?:Total current assets|Current assets, total)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
+    "Current Liabilities": r"(?:Total current liabilities|Current liabilities, total)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?"
+}.items()}
+
+# Label index: the literal text every match of a KPI pattern starts with (lowercase).
+# Must stay in sync with _KPI_PATTERNS; the scanner only tries a pattern where one of these occurs.
+KPI_LABELS = {
+    "Total Assets": ["total assets", "assets, total", "total current and non-current assets"],
+    "Total Liabilities": ["total liabilities", "liabilities, total", "total current and non-current liabilities"],
+    "Equity": ["shareholders' equity", "total equity", "equity attributable to"],
+    "Cash": ["cash "],
+    "Net Profit": ["net income", "profit", "net earnings"],
+    "Revenue": ["total net sales", "revenue", "sales"],
+    "Current Assets": ["total current assets", "current assets, total"],
+    "Current Liabilities": ["total current liabilities", "current liabilities, total"],
+}
+
+# Together with str.lower(), folds text exactly like re.IGNORECASE does for the label characters,
+# without changing its length (so offsets in the folded copy are offsets in the original).
+_CASE_FOLD = str.maketrans({"İ": "i", "ı": "i", "ſ": "s"})
+
 
 def _normalize_value(value_str, text_context=""):
     """
@@ -21,52 +64,113 @@ def _normalize_value(value_str, text_context=""):
     text_context_lower = text_context.lower()
     
     # Check for "in thousands", "000s", "K", "k"
-    if re.search(r'\b(in thousands|\d{3}s?|k)\b', text_context_lower):
+    if _THOUSANDS_RE.search(text_context_lower):
         numeric_value *= 1_000
     # Check for "in millions", "MM", "M"
-    elif re.search(r'\b(in millions|mm|m)\b', text_context_lower) and not re.search(r'\bper square metre\b', text_context_lower): # Avoid "m" for meter
+    elif _MILLIONS_RE.search(text_context_lower) and not _PER_SQUARE_METRE_RE.search(text_context_lower): # Avoid "m" for meter
         numeric_value *= 1_000_000
     # Check for "in billions", "B", "Bn"
-    elif re.search(r'\b(in billions|bn|b)\b', text_context_lower):
+    elif _BILLIONS_RE.search(text_context_lower):
         numeric_value *= 1_000_000_000
     
     return numeric_value
 
-def extract_kpis_from_text(text):
+
+class _LineIndex:
+    """Newline offsets of a text, built on first use, so the line around a match is found by bisection."""
+
+    def __init__(self, text):
+        self.text = text
+        self._newlines = None
+
+    def line_around(self, start, end):
+        # Same span as text[rfind('\n', 0, start) + 1 : find('\n', end)]
+        if self._newlines is None:
+            self._newlines = [m.start() for m in re.finditer("\n", self.text)]
+        newlines = self._newlines
+        i = bisect_left(newlines, start)
+        line_start = newlines[i - 1] + 1 if i else 0
+        j = bisect_left(newlines, end, i)
+        line_end = newlines[j] if j < len(newlines) else len(self.text)
+        return self.text[line_start:line_end]
+
+
+@metrics.timed("kpi_scan")
+def scan_kpis(text, kpis):
+    """
+    Scans text for the KPIs that are not in kpis yet and adds them in place (first match wins).
+    Calling it page by page in document order gives incremental results while a file is still
+    being extracted. Returns kpis.
+
+    Gives the same result as running finditer() with each KPI pattern in turn, in a single pass:
+    label occurrences are found with str.find() on a case-folded copy and merged in text order,
+    the full pattern is only tried at those offsets, and scanning stops once every KPI is found.
+    """
+    remaining = {key for key in _KPI_PATTERNS if key not in kpis}
+    if not remaining:
+        return kpis
+
+    folded = text.lower()
+    if "İ" in text or "ı" in text or "ſ" in text: # str.translate is slow; only pay for it when needed
+        folded = text.translate(_CASE_FOLD).lower()
+    lines = _LineIndex(text)
+    found = {}
+    # Per KPI, where its previous (rejected) match ended; finditer() would resume from there
+    resume_at = dict.fromkeys(remaining, 0)
+
+    # Min-heap of the next occurrence of every label, so candidates come out in text order
+    heap = []
+    for key in remaining:
+        for label in KPI_LABELS[key]:
+            pos = folded.find(label)
+            if pos != -1:
+                heap.append((pos, key, label))
+    heapify(heap)
+
+    while heap and remaining:
+        pos, key, label = heappop(heap)
+        if key not in remaining:
+            continue
+        if pos >= resume_at[key]:
+            match = _KPI_PATTERNS[key].match(text, pos)
+            if match:
+                # Context for multiplier detection: the line (or lines) containing the match
+                normalized_value = _normalize_value(match.group(1), lines.line_around(match.start(), match.end()))
+                if normalized_value is not None:
+                    # Assuming first match is usually the most relevant or desired
+                    found[key] = normalized_value
+                    remaining.discard(key)
+                    continue
+                resume_at[key] = match.end()
+        next_pos = folded.find(label, max(pos + 1, resume_at[key]))
+        if next_pos != -1:
+            heappush(heap, (next_pos, key, label))
+
+    # Keep the usual KPI order regardless of where in the text each one was found
+    for key in _KPI_PATTERNS:
+        if key in found:
+            kpis[key] = found[key]
+    return kpis
+
+
+def extract_kpis_from_pages(pages):
+    """
+    Streaming variant of extract_kpis_from_text: consumes PageRecords (or plain strings) one at a
+    time, so only the current page is held in memory. Returns (kpis, ratios).
+    """
     kpis = {}
-    ratios = {}
+    for page in pages:
+        scan_kpis(getattr(page, "text", page), kpis)
+    return kpis, compute_ratios(kpis)
 
-    # Define patterns with a wider capture group to include potential multipliers
-    # The (?:...) is a non-capturing group.
-    # We try to capture some context around the number for multiplier detection.
-    # The number itself is in the last capturing group ([\d,\.]+)
-    patterns = {
-        "Total Assets": r"(?:Total assets|Assets, total|Total Current and Non-current Assets)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Total Liabilities": r"(?:Total liabilities|Liabilities, total|Total Current and Non-current Liabilities)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Equity": r"(?:Shareholders' equity|Total equity|Equity attributable to(?: parent| owners)?)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Cash": r"Cash (?:and cash equivalents)?\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Net Profit": r"(?:Net income|Profit(?: and loss)?|Net earnings)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Revenue": r"(?:Total net sales|Revenue|Sales)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Current Assets": r"(?:Total current assets|Current assets, total)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?",
-        "Current Liabilities": r"(?:Total current liabilities|Current liabilities, total)\b[^:\d\n]*[:\s$₹]*([\d,\.]+)(?:\s*(?:in\s+thousands|millions|billions|MM|M|B|Bn|K)\b)?"
-    }
-
-    for key, pattern in patterns.items():
-        # Using finditer to get all matches and their span for context
-        for match in re.finditer(pattern, text, flags=re.IGNORECASE):
-            value_str_raw = match.group(1)
-            # Extract context for multiplier detection: e.g., the line containing the match
-            # This is a simple context; a more advanced approach might use a fixed window around the match
-            line_start = text.rfind('\n', 0, match.start()) + 1
-            line_end = text.find('\n', match.end())
-            if line_end == -1: line_end = len(text)
-            context_for_multiplier = text[line_start:line_end] # Capture the whole line or segment
-
-            normalized_value = _normalize_value(value_str_raw, context_for_multiplier)
-            if normalized_value is not None:
-                kpis[key] = normalized_value
-                # Assuming first match is usually the most relevant or desired
-                break 
+
+def extract_kpis_from_text(text):
+    kpis = scan_kpis(text, {})
+    return kpis, compute_ratios(kpis)
+
+
+def compute_ratios(kpis):
+    ratios = {}
 
     # Derived Ratios
     try:
@@ -97,4 +201,4 @@ def extract_kpis_from_text(text):
         print(f"Error calculating financial ratios: {e}")
         # Keep existing ratios if possible, or mark them N/A
 
-    return kpis, ratios
\ No newline at end of file
+    return ratios
\ No newline at end of file
@@ -1,58 +1,237 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+import atexit
 import datetime
+import glob
+import os
 import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+from xml.sax.saxutils import escape
 
-def generate_pdf(summary, kpis, ratios, output_path="financial_report.pdf"):
-    c = canvas.Canvas(output_path, pagesize=letter)
+from utils import metrics
+
+# Reports are written to unique files in REPORT_DIR, so concurrent requests never share a path.
+# Files older than REPORT_TTL_SECONDS are removed as new ones are created; a live session touches
+# its report whenever it is used, so only abandoned reports age out (sessions also remove their
+# own report when they are cleared or replace it).
+REPORT_DIR = os.getenv("REPORT_DIR", os.path.join(tempfile.gettempdir(), "financial_reports"))
+REPORT_TTL_SECONDS = float(os.getenv("REPORT_TTL_SECONDS", "3600"))
+# Renders run in this many worker processes: layout is pure Python and holds the GIL, so threads
+# would only take it off the request thread without rendering reports in parallel
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Optional TTF font for the body text (e.g. DejaVuSans.ttf), for characters like ₹ and ⚠ that the
+# built-in Helvetica can't draw
+REPORT_FONT = os.getenv("REPORT_FONT", "")
+
+TITLE = "Smart Financial Summary Agent"
+_CLEANUP_INTERVAL_SECONDS = 60
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+# --------------------------
+# 📁 Report files
+# --------------------------
+def cleanup_reports(max_age=REPORT_TTL_SECONDS):
+    """Removes report files older than max_age seconds. Returns how many were removed."""
+    removed = 0
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(REPORT_DIR, "*.pdf")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def new_report_path(prefix="financial_report"):
+    """A fresh, unique path in REPORT_DIR. Also removes expired reports (at most once a minute)."""
+    global _last_cleanup
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    with _cleanup_lock:
+        due = time.monotonic() - _last_cleanup >= _CLEANUP_INTERVAL_SECONDS
+        if due:
+            _last_cleanup = time.monotonic()
+    if due:
+        cleanup_reports()
+    return os.path.join(REPORT_DIR, f"{prefix}_{uuid.uuid4().hex}.pdf")
+
+
+# --------------------------
+# 🎨 Layout (built once per process)
+# --------------------------
+@lru_cache(maxsize=None)
+def _fonts():
+    """(regular, bold) font names. Registering a TTF parses it, so it's done once and reused."""
+    if REPORT_FONT:
+        try:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+
+            pdfmetrics.registerFont(TTFont("ReportFont", REPORT_FONT))
+            return "ReportFont", "ReportFont"
+        except Exception as e:
+            print(f"Warning: could not load REPORT_FONT {REPORT_FONT}, using Helvetica. Error: {e}")
+    return "Helvetica", "Helvetica-Bold"
+
+
+@lru_cache(maxsize=None)
+def _styles():
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    regular, bold = _fonts()
+    base = getSampleStyleSheet()
+    return {
+        "heading": ParagraphStyle("ReportHeading", parent=base["Heading2"], fontName=bold, fontSize=12, spaceBefore=12, spaceAfter=6),
+        "body": ParagraphStyle("ReportBody", parent=base["BodyText"], fontName=regular, fontSize=11, leading=14, spaceAfter=4),
+        "bullet": ParagraphStyle("ReportBullet", parent=base["BodyText"], fontName=regular, fontSize=11, leading=14, leftIndent=12, bulletIndent=2),
+        "cell": ParagraphStyle("ReportCell", parent=base["BodyText"], fontName=regular, fontSize=10, leading=12),
+    }
+
+
+@lru_cache(maxsize=None)
+def _table_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    _, bold = _fonts()
+    return TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), bold),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E8EDF3")),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#B0B8C4")),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("ALIGN", (1, 1), (1, -1), "RIGHT"),
+    ])
+
+
+def _draw_page(canvas, doc):
+    # Header and footer on every page: title, generation time, page number
+    from reportlab.lib.pagesizes import letter
+
+    regular, bold = _fonts()
     width, height = letter
-    margin = 40
-
-    # --- Title (Centered) ---
-    title = "Smart Financial Summary Agent"
-    c.setFont("Helvetica-Bold", 16)
-    c.drawCentredString(width / 2, height - 50, title)
-
-    # --- Timestamp (Top-left) ---
-    c.setFont("Helvetica", 10)
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-    c.drawString(margin, height - 70, f"Generated on: {now}")
-
-    # --- Begin Body ---
-    text = c.beginText(margin, height - 100)
-    text.setFont("Helvetica-Bold", 12)
-    text.textLine("Executive Summary")
-    text.setFont("Helvetica", 11)
-
-    # Clean Markdown (**text**) formatting
-    cleaned_summary = re.sub(r"\*\*(.*?)\*\*", r"\1", summary)
-    for line in cleaned_summary.strip().split('\n'):
-        text.textLine(line)
-
-    # --- KPIs ---
-    text.textLine("")
-    text.setFont("Helvetica-Bold", 12)
-    text.textLine("Key Financial KPIs")
-    text.setFont("Helvetica", 11)
-    for key, value in kpis.items():
-        text.textLine(f"- {key}: {value:,.2f}")
-
-    # --- Ratios ---
+    canvas.saveState()
+    canvas.setFont(bold, 16)
+    canvas.drawCentredString(width / 2, height - 50, TITLE)
+    canvas.setFont(regular, 10)
+    canvas.drawString(doc.leftMargin, height - 70, f"Generated on: {doc.generated_on}")
+    canvas.drawRightString(width - doc.rightMargin, 30, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+def _inline(text):
+    # Escape for reportlab's mini-markup, keeping Markdown **bold** as bold
+    return re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", escape(text))
+
+
+def _summary_flowables(summary):
+    from reportlab.platypus import Paragraph
+
+    styles = _styles()
+    flowables = []
+    for line in summary.strip().split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        heading = re.match(r"^#{1,6}\s+(.*)", line)
+        bullet = re.match(r"^[-*•]\s+(.*)", line)
+        if heading:
+            flowables.append(Paragraph(_inline(heading.group(1)), styles["heading"]))
+        elif bullet:
+            flowables.append(Paragraph(_inline(bullet.group(1)), styles["bullet"], bulletText="•"))
+        else:
+            flowables.append(Paragraph(_inline(line), styles["body"]))
+    return flowables
+
+
+def _table(header, rows):
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Table
+
+    cell = _styles()["cell"]
+    data = [header] + [[Paragraph(_inline(str(name)), cell), Paragraph(_inline(str(value)), cell)] for name, value in rows]
+    table = Table(data, colWidths=[3.2 * inch, 3.2 * inch], repeatRows=1)
+    table.setStyle(_table_style())
+    return table
+
+
+# --------------------------
+# 🖨️ Rendering
+# --------------------------
+@metrics.timed("pdf_report", log=True)
+def generate_pdf(summary, kpis, ratios, output_path=None):
+    """
+    Renders the report (summary, KPIs, ratios) as a multi-page PDF and returns its path.
+    Without output_path, a unique file in REPORT_DIR is used.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    output_path = output_path or new_report_path()
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    styles = _styles()
+
+    story = [Paragraph("Executive Summary", styles["heading"])]
+    story += _summary_flowables(summary or "")
+    story.append(Spacer(1, 8))
+    story.append(Paragraph("Key Financial KPIs", styles["heading"]))
+    if kpis:
+        story.append(_table(["KPI", "Value"], [(key, f"{value:,.2f}" if isinstance(value, (int, float)) else value) for key, value in kpis.items()]))
+    else:
+        story.append(Paragraph("No financial KPIs found.", styles["body"]))
+    story.append(Paragraph("Financial Ratios", styles["heading"]))
     if ratios:
-        text.textLine("")
-        text.setFont("Helvetica-Bold", 12)
-        text.textLine("Financial Ratios")
-        text.setFont("Helvetica", 11)
-        for key, value in ratios.items():
-            text.textLine(f"- {key}: {value}")
+        story.append(_table(["Ratio", "Value"], list(ratios.items())))
     else:
-        text.textLine("")
-        text.setFont("Helvetica", 11)
-        text.textLine("⚠ No financial ratios found.")
+        story.append(Paragraph("⚠ No financial ratios found.", styles["body"]))
+
+    # The top margin leaves room for the header drawn by _draw_page
+    doc = SimpleDocTemplate(output_path, pagesize=letter, leftMargin=40, rightMargin=40, topMargin=90, bottomMargin=50, title=TITLE)
+    doc.generated_on = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    doc.build(story, onFirstPage=_draw_page, onLaterPages=_draw_page)
+    return output_path
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" like the extraction pool: the app process may already run torch threads
+            _pool = ProcessPoolExecutor(max_workers=max(1, REPORT_WORKERS), mp_context=get_context("spawn"))
+        return _pool
+
+
+def _shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(_shutdown_pool)
 
-    # Finish
-    c.drawText(text)
-    c.showPage()
-    c.save()
 
-    return output_path
\ No newline at end of file
+def submit_pdf(summary, kpis, ratios, output_path=None):
+    """
+    Renders in the report pool (REPORT_WORKERS processes). Returns a Future of the report path.
+    The path is chosen here, so expired reports are cleaned up by this process.
+    """
+    output_path = output_path or new_report_path()
+    start = time.perf_counter()
+    future = _get_pool().submit(generate_pdf, summary, kpis, ratios, output_path)
+    # The worker's own metrics stay in the worker; record the render (with queueing) here
+    future.add_done_callback(lambda _: metrics.observe("pdf_report_seconds", time.perf_counter() - start, pool="process"))
+    return future
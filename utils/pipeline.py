@@ -0,0 +1,77 @@
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils import metrics
+
+_Stage = namedtuple("_Stage", ["fn", "args", "deps", "optional", "default"])
+
+
+class TaskGraph:
+    """
+    Minimal task-graph executor for the upload pipeline. Stages run on a thread pool as soon as
+    the stages they depend on have finished, so independent stages overlap and the wall-clock
+    time approaches the longest dependency chain instead of the sum of all stages.
+
+    A stage is called as fn(*args, *dependency_results). If a required stage raises, run()
+    re-raises that exception (stages still running are abandoned); a failing optional stage is
+    logged and its default is passed on instead.
+    """
+
+    def __init__(self, max_workers=None, metric=None):
+        self.max_workers = max_workers
+        self.metric = metric # if set, stage timings are also recorded as "<metric>_seconds{stage=...}"
+        self._stages = {}
+        self.timings = {} # stage name -> seconds, filled in as stages finish
+
+    def add(self, name, fn, args=(), deps=(), optional=False, default=None):
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'.")
+        self._stages[name] = _Stage(fn, tuple(args), tuple(deps), optional, default)
+
+    def __len__(self):
+        return len(self._stages)
+
+    def _timed(self, name, stage, dep_results):
+        start = time.perf_counter()
+        try:
+            return stage.fn(*stage.args, *dep_results)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            if self.metric:
+                metrics.observe(f"{self.metric}_seconds", self.timings[name], stage=name)
+
+    def run(self):
+        """Runs every stage, yielding (name, result) pairs in completion order."""
+        results = {}
+        waiting = dict(self._stages)
+        running = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers or max(1, len(waiting)), thread_name_prefix="pipeline")
+        try:
+            while waiting or running:
+                ready = [name for name, stage in waiting.items() if all(dep in results for dep in stage.deps)]
+                for name in ready:
+                    stage = waiting.pop(name)
+                    future = pool.submit(self._timed, name, stage, [results[dep] for dep in stage.deps])
+                    running[future] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        stage = self._stages[name]
+                        if not stage.optional:
+                            raise
+                        print(f"Warning: optional stage '{name}' failed: {e}")
+                        result = stage.default
+                    results[name] = result
+                    yield name, result
+        finally:
+            # Don't wait for abandoned stages (e.g. after a failure); they finish in the background.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def format_timings(self):
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
@@ -1,44 +1,277 @@
+import hashlib
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from langchain.docstore.document import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_groq import ChatGroq
+from utils import index_store, metrics, qa_cache
+from utils.disk_cache import file_sha256
+from utils.extraction_cache import EXTRACTOR_VERSION
 
 load_dotenv()
 
-def build_qa_chain_from_text(text: str):
-    # ✅ 1. Split the plain text into smaller chunks with optimized separators
-    # Prioritize splitting by paragraph, then lines, then words, to maintain semantic coherence.
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,
-        chunk_overlap=100,
-        separators=["\n\n", "\n", " ", ""] # Try splitting by double newline (paragraph), then single newline, then space
-    )
-    chunks = text_splitter.split_text(text)
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+# While pages stream in, chunks are embedded and added to the index in batches of this size.
+EMBED_BATCH_CHUNKS = int(os.getenv("EMBED_BATCH_CHUNKS", "64"))
+QA_MODEL = "llama3-8b-8192"
+# Corpus questions compare several filings, so they get a larger context than single-document ones
+CORPUS_TOKEN_BUDGET = int(os.getenv("CORPUS_TOKEN_BUDGET", "3000"))
+
+# LangChain, torch/sentence-transformers and FAISS are imported on first use rather than at
+# module load.
+
+
+def get_embeddings():
+    """Returns the process-wide embedding service (shared model + vector cache), loading it on the first call."""
+    from utils.embeddings import get_embeddings as get_embedding_service
+    return get_embedding_service()
+
+
+def warm_up():
+    """Optional warm-up hook: imports the Q&A stack and loads the embedding model ahead of the first upload."""
+    get_embeddings()
+    import langchain.chains  # noqa: F401
+    import langchain_community.vectorstores  # noqa: F401
+    import langchain_core.language_models.chat_models  # noqa: F401
+
+
+def _index_settings():
+    from utils.embeddings import EMBEDDING_MODEL_NAME
+
+    # Everything that shapes the stored index besides the document content itself
+    return {
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "extractor_version": EXTRACTOR_VERSION,
+    }
+
+
+def index_key_for_file(file_path, content_hash=None):
+    """Index store key for an uploaded file, known before any page is extracted. content_hash: its SHA-256, if known."""
+    return index_store.index_key(content_hash or file_sha256(file_path), _index_settings())
+
+
+def index_key_for_text(text):
+    return index_store.index_key(hashlib.sha256(text.encode("utf-8")).hexdigest(), _index_settings())
+
+
+class QAIndexBuilder:
+    """
+    Builds the FAISS index incrementally from a stream of pages. Each page is chunked as it
+    arrives and chunks are embedded in batches, so apart from the index itself only a small
+    window of text is held in memory. Chunks never span pages and carry their page number.
+
+    With an index_key, a previously persisted index for the same document is reloaded from the
+    index store (memory-mapped) and add_page() becomes a no-op; otherwise the finished index is
+    persisted under that key.
+
+    embeddings overrides the shared embedding service (e.g. a deterministic stub for offline
+    benchmarks); such indexes are never persisted.
+
+    base is a utils.revisions.Revision: when this document is a new version of one indexed
+    before, the previous index is patched instead of rebuilt. Chunks of changed or removed pages
+    are deleted, and add_page() only embeds the pages that changed.
+    """
+
+    def __init__(self, index_key=None, embeddings=None, base=None):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        # ✅ 1. Split the plain text into smaller chunks with optimized separators
+        # Prioritize splitting by paragraph, then lines, then words, to maintain semantic coherence.
+        self._text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", " ", ""] # Try splitting by double newline (paragraph), then single newline, then space
+        )
+        self._pending = []
+        self.vectorstore = None
+        self.chunk_count = 0
+        self.embeddings = embeddings or get_embeddings()
+        # Content key of the document; also scopes the Q&A retrieval cache (not with custom embeddings)
+        self.document_key = index_key if embeddings is None else None
+        self.index_key = index_key if index_store.is_enabled() and embeddings is None else None
+        self.from_store = False
+        self._saved = False
+        self._reused_pages = set()
+        if self.index_key:
+            with metrics.span("faiss_load"):
+                self.vectorstore = index_store.load(self.index_key, self.embeddings)
+            if self.vectorstore is not None:
+                self.from_store = True
+                self.chunk_count = self.vectorstore.index.ntotal
+                print(f"✅ Loaded persisted FAISS index ({self.chunk_count} chunks), skipping embedding.")
+        if self.index_key and not self.from_store and base is not None and base.index_key:
+            self._patch_from(base)
+
+    def _patch_from(self, revision):
+        # Writable copy of the previous version's index (a memory-mapped one can't be modified)
+        with metrics.span("faiss_load"):
+            vectorstore = index_store.load(revision.index_key, self.embeddings, mmap=False)
+        if vectorstore is None:
+            return
+        old_to_new = {old_page: new_page for new_page, old_page in revision.page_map.items()}
+        stale = []
+        for doc_id in list(vectorstore.index_to_docstore_id.values()):
+            document = vectorstore.docstore.search(doc_id)
+            # Chunks never span pages, so every chunk belongs to exactly one page
+            new_page = old_to_new.get(document.metadata.get("page"))
+            if new_page is None:
+                stale.append(doc_id)
+            else:
+                document.metadata["page"] = new_page
+        with metrics.span("faiss_delete"):
+            if stale:
+                vectorstore.delete(stale)
+        self.vectorstore = vectorstore
+        self.chunk_count = vectorstore.index.ntotal
+        self._reused_pages = set(revision.page_map)
+        metrics.inc("chunks_reused_total", self.chunk_count)
+        print(f"♻️ Patching the previous FAISS index: {self.chunk_count} chunks kept, {len(stale)} removed.")
+
+    def add_page(self, page):
+        """Accepts a PageRecord or a plain string."""
+        from langchain.docstore.document import Document
+
+        if self.from_store:
+            return
+
+        text = getattr(page, "text", page)
+        page_num = getattr(page, "page_num", 0)
+        if page_num in self._reused_pages:
+            return # already in the patched index
+        for chunk in self._text_splitter.split_text(text):
+            self._pending.append(Document(page_content=chunk, metadata={"page": page_num}))
+        if len(self._pending) >= EMBED_BATCH_CHUNKS:
+            self._flush()
+
+    def _flush(self):
+        from langchain_community.vectorstores import FAISS
+
+        if not self._pending:
+            return
+        # ✅ 2-3. Embed the batch (shared model, loaded once per process) and add it to the FAISS store
+        with metrics.span("faiss_add"):
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_documents(self._pending, self.embeddings)
+            else:
+                self.vectorstore.add_documents(self._pending)
+        metrics.inc("chunks_indexed_total", len(self._pending))
+        self.chunk_count += len(self._pending)
+        self._pending = []
+
+    @property
+    def is_persisted(self):
+        """True once the finished index is in the index store (loaded from it, or saved by build_index())."""
+        return self.from_store or self._saved
+
+    def build_index(self):
+        """Embeds the remaining chunks and persists the index. Returns the FAISS vector store."""
+        self._flush()
+        if self.vectorstore is None:
+            raise ValueError("No text to index for Q&A.")
+        if self.index_key and not self.from_store and not self._saved:
+            with metrics.span("faiss_save"):
+                index_store.save(self.index_key, self.vectorstore)
+            self._saved = True # a second call (e.g. adding to the corpus) doesn't save again
+        stats = self.embeddings.stats() if hasattr(self.embeddings, "stats") else {}
+        metrics.log_event("qa_index_ready", chunks=self.chunk_count, from_store=self.from_store, patched=bool(self._reused_pages), embeddings=stats)
+        return self.vectorstore
+
+    def build_chain(self, llm=None):
+        return _build_qa_chain(self.build_index(), llm=llm, document_key=self.document_key)
+
+
+_retriever_class = None
+
+
+def _hybrid_retriever(vectorstore, document_key=None):
+    """
+    Hybrid BM25 + FAISS retriever (see utils/retrieval.py). With a document_key, each question is
+    embedded once (the vector is shared with the answer cache) and the chunks retrieved for the
+    same or a similar question on this document are reused.
+    """
+    global _retriever_class
+    if _retriever_class is None:
+        from langchain_core.retrievers import BaseRetriever
+
+        class HybridRetriever(BaseRetriever):
+            searcher: object
+            document_key: Optional[str] = None
+
+            def _get_relevant_documents(self, query, *, run_manager=None):
+                embed_query = self.searcher.vectorstore.embeddings.embed_query
+                if not self.document_key or not qa_cache.is_enabled():
+                    return self.searcher.search(query, embed_query(query))
+                cache = qa_cache.get_cache()
+                vector = cache.question_vector(self.document_key, query, embed_query)
+                documents = cache.get_retrieval(self.document_key, query, vector)
+                if documents is None:
+                    documents = self.searcher.search(query, vector)
+                    cache.put_retrieval(self.document_key, query, vector, documents)
+                return documents
+
+        _retriever_class = HybridRetriever
+    # The BM25 index is built here, once per document
+    from utils.retrieval import HybridSearcher
+    return _retriever_class(searcher=HybridSearcher(vectorstore), document_key=document_key)
+
+
+_corpus_retriever_class = None
+
+
+def _corpus_retriever(company=None, periods=None):
+    """Retriever over the whole corpus (see utils/corpus.py), restricted to a company and/or periods."""
+    global _corpus_retriever_class
+    if _corpus_retriever_class is None:
+        from langchain_core.retrievers import BaseRetriever
+
+        class CorpusRetriever(BaseRetriever):
+            company: Optional[str] = None
+            periods: Optional[list] = None
 
-    documents = [Document(page_content=chunk) for chunk in chunks]
+            def _get_relevant_documents(self, query, *, run_manager=None):
+                from utils.corpus import get_corpus
+                from utils.embeddings import EMBEDDING_MODEL_NAME
+                from utils.retrieval import fit_token_budget
 
-    print(f"\n✅ Total chunks created: {len(documents)}")
-    print(f"Example chunk length: {len(documents[0].page_content) if documents else 0}") # For debugging chunk size
+                vector = get_embeddings().embed_query(query)
+                documents = get_corpus().search(vector, company=self.company, periods=set(self.periods or ()) or None, embedding_model=EMBEDDING_MODEL_NAME)
+                return fit_token_budget(documents, CORPUS_TOKEN_BUDGET, stage="corpus")
 
+        _corpus_retriever_class = CorpusRetriever
+    return _corpus_retriever_class(company=company, periods=sorted(periods) if periods else None)
 
-    # ✅ 2. Create sentence embeddings
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 
-    # ✅ 3. Create FAISS vector store from chunked documents
-    vectorstore = FAISS.from_documents(documents, embeddings)
+def build_corpus_chain(company=None, periods=None, llm=None):
+    """Q&A chain over every document in the corpus that matches the company / periods filters."""
+    return _qa_chain(_corpus_retriever(company, periods), llm=llm)
 
-    # ✅ 4. Create retriever
-    # Consider increasing k (number of documents to retrieve) for more context, e.g., retriever = vectorstore.as_retriever(k=5)
-    retriever = vectorstore.as_retriever()
 
-    # ✅ 5. Load Groq LLM
-    llm = ChatGroq(model_name="llama3-8b-8192", api_key=os.getenv("GROQ_API_KEY"))
+def add_to_corpus(builder, file_name, company="", period=""):
+    """Adds a built QAIndexBuilder's index to the corpus. Returns the catalog entry, or None for stub-embedded indexes."""
+    from utils.corpus import get_corpus
+    from utils.embeddings import EMBEDDING_MODEL_NAME
+
+    if not builder.document_key:
+        return None
+    vectorstore = builder.vectorstore if builder.is_persisted else builder.build_index()
+    return get_corpus().add(builder.document_key, vectorstore, file_name, company, period, embedding_model=EMBEDDING_MODEL_NAME)
+
+
+def _build_qa_chain(vectorstore, llm=None, document_key=None):
+    # ✅ 4. Create retriever: hybrid BM25 + dense search, k and context token budget set in utils/retrieval.py
+    return _qa_chain(_hybrid_retriever(vectorstore, document_key), llm=llm)
+
+
+def _qa_chain(retriever, llm=None):
+    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
+
+    # ✅ 5. Load Groq LLM on the shared, pooled client (unless another LangChain LLM, e.g. a local stub, was passed in)
+    if llm is None:
+        from utils.llm_client import get_chat_model
+        llm = get_chat_model(QA_MODEL, temperature=0.7)
 
     # ✅ 6. Create refined prompt
     prompt_template = """
@@ -67,4 +300,70 @@ def build_qa_chain_from_text(text: str):
         chain_type_kwargs={"prompt": prompt}
     )
 
-    return qa_chain
\ No newline at end of file
+    return qa_chain
+
+
+_callbacks = None
+
+
+def metrics_callbacks():
+    """
+    LangChain callbacks that time the FAISS retrieval and the LLM call of a Q&A chain run and count
+    its tokens. Pass them per call, so they reach the chain's children:
+    qa_chain.invoke(inputs, config={"callbacks": metrics_callbacks()})
+    """
+    global _callbacks
+    if _callbacks is None:
+        import time
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class MetricsCallbackHandler(BaseCallbackHandler):
+            def __init__(self):
+                self._starts = {}
+
+            def _start(self, run_id):
+                self._starts[run_id] = time.perf_counter()
+
+            def _end(self, run_id, name, **labels):
+                start = self._starts.pop(run_id, None)
+                if start is not None:
+                    metrics.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+            def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+                self._start(run_id)
+
+            def on_retriever_end(self, documents, *, run_id, **kwargs):
+                self._end(run_id, "faiss_query")
+
+            def on_retriever_error(self, error, *, run_id, **kwargs):
+                self._starts.pop(run_id, None)
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self._start(run_id)
+
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._start(run_id)
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                self._end(run_id, "llm_request", model=QA_MODEL)
+                usage = (response.llm_output or {}).get("token_usage") or {}
+                metrics.inc("llm_tokens_total", usage.get("prompt_tokens", 0), model=QA_MODEL, kind="prompt")
+                metrics.inc("llm_tokens_total", usage.get("completion_tokens", 0), model=QA_MODEL, kind="completion")
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._starts.pop(run_id, None)
+
+        _callbacks = [MetricsCallbackHandler()]
+    return _callbacks
+
+
+def build_qa_chain_from_pages(pages, index_key=None, embeddings=None, llm=None):
+    """Builds the Q&A chain from a stream of PageRecords (or strings), embedding as pages arrive."""
+    builder = QAIndexBuilder(index_key=index_key, embeddings=embeddings)
+    for page in pages:
+        builder.add_page(page)
+    return builder.build_chain(llm=llm)
+
+
+def build_qa_chain_from_text(text: str, embeddings=None, llm=None):
+    return build_qa_chain_from_pages([text], index_key=index_key_for_text(text), embeddings=embeddings, llm=llm)
\ No newline at end of file
@@ -0,0 +1,206 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+# Per-document Q&A cache. Two layers, both keyed by the document's content key (the Q&A index
+# key), so a changed document never sees answers or chunks cached for its previous version:
+#   answers    - exact hits on the normalized question, then semantic hits when the question
+#                embedding is close enough to a cached question with the same numbers (years,
+#                quarters...) (no retrieval, no LLM call)
+#   retrievals - chunk sets retrieved for a question embedding, reused for similar questions
+#                whose answer isn't cached (skips the FAISS search; the LLM still answers)
+#
+# QA_CACHE=0 disables both layers.
+QA_CACHE_SIMILARITY = float(os.getenv("QA_CACHE_SIMILARITY", "0.95"))
+QA_RETRIEVAL_SIMILARITY = float(os.getenv("QA_RETRIEVAL_SIMILARITY", "0.90"))
+QA_CACHE_TTL_SECONDS = float(os.getenv("QA_CACHE_TTL_SECONDS", "3600"))
+QA_CACHE_MAX_ENTRIES = int(os.getenv("QA_CACHE_MAX_ENTRIES", "256")) # per document and layer
+QA_CACHE_MAX_DOCUMENTS = int(os.getenv("QA_CACHE_MAX_DOCUMENTS", "32"))
+
+
+def is_enabled():
+    return os.getenv("QA_CACHE", "1") != "0"
+
+
+def normalize_question(question):
+    """Lowercases and strips punctuation and extra whitespace: "What was the Net Profit ?" -> "what was the net profit"."""
+    return " ".join(re.sub(r"[^\w\s%]", " ", question.lower()).split())
+
+
+def _numbers(key):
+    """Digit tokens of a normalized question ("net profit fy2023 q4" -> {"2023", "4"})."""
+    return frozenset(re.findall(r"\d+", key))
+
+
+def _unit(vector):
+    import numpy as np
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Layer:
+    """LRU + TTL map from normalized question to (unit vector, value, created)."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    def _expired(self, created, now):
+        return now - created > self.ttl_seconds
+
+    def get_exact(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry[2], now):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def get_similar(self, vector, threshold, now, question_key=""):
+        """
+        Returns the value of the most similar live entry with cosine similarity >= threshold.
+        Only entries with the same numbers as question_key qualify: "net profit in 2023" and "...in
+        2024" embed almost identically but must not share an answer or chunks.
+        """
+        import numpy as np
+
+        for key in [key for key, entry in self._entries.items() if self._expired(entry[2], now)]:
+            del self._entries[key]
+        numbers = _numbers(question_key)
+        keys = [key for key, entry in self._entries.items() if entry[0] is not None and _numbers(key) == numbers]
+        if vector is None or not keys:
+            return None, 0.0
+        matrix = np.stack([self._entries[key][0] for key in keys])
+        scores = matrix @ _unit(vector) # unit vectors, so this is the cosine similarity
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None, float(scores[best])
+        self._entries.move_to_end(keys[best])
+        return self._entries[keys[best]][1], float(scores[best])
+
+    def put(self, key, vector, value, now):
+        self._entries[key] = (_unit(vector) if vector is not None else None, value, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class _DocumentCache:
+    def __init__(self, max_entries, ttl_seconds):
+        self.answers = _Layer(max_entries, ttl_seconds)
+        self.retrievals = _Layer(max_entries, ttl_seconds)
+        # Question embeddings, so a question is embedded once for both layers
+        self.vectors = OrderedDict()
+        self.max_entries = max_entries
+
+
+class QACache:
+    def __init__(self, max_entries=QA_CACHE_MAX_ENTRIES, max_documents=QA_CACHE_MAX_DOCUMENTS, ttl_seconds=QA_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self.ttl_seconds = ttl_seconds
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _document(self, document_key):
+        document = self._documents.get(document_key)
+        if document is None:
+            document = self._documents[document_key] = _DocumentCache(self.max_entries, self.ttl_seconds)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        self._documents.move_to_end(document_key)
+        return document
+
+    def question_vector(self, document_key, question, embed_query):
+        """Embedding of question (float32 array), computed with embed_query on the first call only."""
+        key = normalize_question(question)
+        with self._lock:
+            vectors = self._document(document_key).vectors
+            vector = vectors.get(key)
+            if vector is not None:
+                vectors.move_to_end(key)
+                return vector
+        import numpy as np
+
+        # Embed outside the lock; concurrent questions shouldn't queue behind the model
+        vector = np.asarray(embed_query(question), dtype=np.float32)
+        with self._lock:
+            document = self._document(document_key)
+            document.vectors[key] = vector
+            while len(document.vectors) > document.max_entries:
+                document.vectors.popitem(last=False)
+        return vector
+
+    def get_answer(self, document_key, question, embed_query=None):
+        """
+        Returns a cached answer for question, or None. Exact (normalized) matches are checked first;
+        with embed_query, a semantically similar cached question is accepted as well.
+        """
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            answer = self._document(document_key).answers.get_exact(key, now)
+        if answer is not None:
+            metrics.inc("qa_cache_lookups_total", layer="answer", result="exact")
+            return answer
+        if embed_query is not None:
+            vector = self.question_vector(document_key, question, embed_query)
+            with self._lock:
+                answer, _ = self._document(document_key).answers.get_similar(vector, QA_CACHE_SIMILARITY, now, key)
+            if answer is not None:
+                metrics.inc("qa_cache_lookups_total", layer="answer", result="semantic")
+                return answer
+        metrics.inc("qa_cache_lookups_total", layer="answer", result="miss")
+        return None
+
+    def put_answer(self, document_key, question, answer, embed_query=None):
+        vector = self.question_vector(document_key, question, embed_query) if embed_query is not None else None
+        with self._lock:
+            self._document(document_key).answers.put(normalize_question(question), vector, answer, time.monotonic())
+
+    def get_retrieval(self, document_key, question, vector):
+        """Cached chunk set for this question (exact) or a similar question embedding, or None."""
+        now = time.monotonic()
+        with self._lock:
+            layer = self._document(document_key).retrievals
+            key = normalize_question(question)
+            documents = layer.get_exact(key, now)
+            if documents is None:
+                documents, _ = layer.get_similar(vector, QA_RETRIEVAL_SIMILARITY, now, key)
+        metrics.inc("qa_cache_lookups_total", layer="retrieval", result="miss" if documents is None else "hit")
+        return documents
+
+    def put_retrieval(self, document_key, question, vector, documents):
+        with self._lock:
+            self._document(document_key).retrievals.put(normalize_question(question), vector, list(documents), time.monotonic())
+
+    def invalidate(self, document_key):
+        """Drops every cached answer, chunk set and question vector for a document."""
+        with self._lock:
+            self._documents.pop(document_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Returns the process-wide Q&A cache (shared by all sessions; entries are per document)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QACache()
+    return _cache
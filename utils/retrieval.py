@@ -0,0 +1,151 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from heapq import nlargest
+
+from utils import metrics
+
+# Hybrid retrieval for the Q&A chain: dense FAISS search plus an in-memory BM25 index over the
+# same chunks, fused by weighted reciprocal rank, optionally reranked by a cross-encoder, then cut
+# to RETRIEVAL_K chunks within RETRIEVAL_TOKEN_BUDGET tokens of context.
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+# Candidates taken from each of FAISS and BM25 before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# Share of the fused score given to BM25 (0 = dense only, 1 = BM25 only)
+RETRIEVAL_BM25_WEIGHT = float(os.getenv("RETRIEVAL_BM25_WEIGHT", "0.5"))
+# Upper bound on the tokens of context stuffed into the Q&A prompt (0 = no limit)
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1500"))
+# Optional CPU reranker, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2" (empty = off)
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+
+_RRF_K = 60 # standard reciprocal-rank-fusion damping constant
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:[.,]\d+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how in is it its of on or that the "
+    "their this to was were what when which who why with".split()
+)
+
+
+def tokenize(text):
+    """Lowercase word and number tokens; thousands separators are dropped so "1,234" matches "1234"."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token[0].isdigit():
+            token = token.replace(",", "")
+        elif token in _STOPWORDS:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a list of texts, with an inverted index of token -> [(position, term frequency)]."""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self._lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                self._postings[token].append((position, tf))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def search(self, query, n):
+        """Returns up to n (position, score) pairs, best first."""
+        count = len(self._lengths)
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / self._avg_length)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return nlargest(n, scores.items(), key=lambda item: item[1])
+
+
+_reranker = None
+_reranker_failed = False
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Returns the shared cross-encoder, or None when RERANKER_MODEL isn't set or fails to load."""
+    global _reranker, _reranker_failed
+    if not RERANKER_MODEL or _reranker is not None or _reranker_failed:
+        return _reranker
+    with _reranker_lock:
+        if _reranker is None and not _reranker_failed:
+            try:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(RERANKER_MODEL, device="cpu")
+            except Exception as e:
+                print(f"Warning: reranker {RERANKER_MODEL} failed to load, continuing without it. Error: {e}")
+                _reranker_failed = True
+    return _reranker
+
+
+class HybridSearcher:
+    """
+    Hybrid search over a LangChain FAISS store. The BM25 index is built once, from the chunks in
+    the store's index order, so FAISS positions and BM25 positions refer to the same chunk.
+    """
+
+    def __init__(self, vectorstore, k=RETRIEVAL_K, candidates=RETRIEVAL_CANDIDATES,
+                 bm25_weight=RETRIEVAL_BM25_WEIGHT, token_budget=RETRIEVAL_TOKEN_BUDGET):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.candidates = max(candidates, k)
+        self.bm25_weight = bm25_weight
+        self.token_budget = token_budget
+        with metrics.span("bm25_build"):
+            docstore, ids = vectorstore.docstore, vectorstore.index_to_docstore_id
+            self._documents = [docstore.search(ids[position]) for position in range(len(ids))]
+            self.bm25 = BM25Index(document.page_content for document in self._documents) if bm25_weight > 0 else None
+
+    def _dense(self, vector, n):
+        import numpy as np
+
+        with metrics.span("faiss_search"):
+            _, positions = self.vectorstore.index.search(np.asarray([vector], dtype=np.float32), n)
+        return [int(position) for position in positions[0] if position >= 0]
+
+    def search(self, query, vector):
+        """Returns the chunks (LangChain Documents) for query; vector is the query embedding."""
+        fused = defaultdict(float)
+        if self.bm25_weight < 1:
+            for rank, position in enumerate(self._dense(vector, self.candidates)):
+                fused[position] += (1 - self.bm25_weight) / (_RRF_K + rank)
+        if self.bm25 is not None:
+            with metrics.span("bm25_search"):
+                for rank, (position, _) in enumerate(self.bm25.search(query, self.candidates)):
+                    fused[position] += self.bm25_weight / (_RRF_K + rank)
+        ranked = [position for position, _ in sorted(fused.items(), key=lambda item: item[1], reverse=True)]
+
+        reranker = get_reranker()
+        if reranker is not None and len(ranked) > 1:
+            head = ranked[:max(RERANK_CANDIDATES, self.k)]
+            with metrics.span("rerank"):
+                scores = reranker.predict([(query, self._documents[position].page_content) for position in head])
+            ranked = [position for _, position in sorted(zip(scores, head), key=lambda item: item[0], reverse=True)]
+
+        return fit_token_budget([self._documents[position] for position in ranked[:self.k]], self.token_budget)
+
+
+def fit_token_budget(documents, token_budget=RETRIEVAL_TOKEN_BUDGET, stage="qa"):
+    """
+    Best chunks first until the token budget is reached (always at least one chunk). Chunks are
+    compacted first (repeated headers, chunk overlap and table padding removed), so more fit.
+    """
+    from utils.compaction import compact_documents
+    return compact_documents(documents, stage, max_tokens=token_budget)
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict, deque
+
+from utils import extraction_cache
+from utils.disk_cache import evict_lru, file_sha256, touch
+
+# Incremental re-analysis of amended filings. For every uploaded PDF a small manifest is kept,
+# keyed by its owner (the signed-in user, else the session) and the file name: per-page
+# fingerprints of the raw PDF content, the extraction cache and index store keys, and the page
+# each KPI was found on. When a new version of the same file is uploaded, unchanged pages are
+# taken from the previous version's extracted text, the previous FAISS index is patched (chunks of
+# changed pages deleted and re-added), and KPIs are only rescanned from the first changed page on.
+#
+# INCREMENTAL=0 disables it.
+REVISIONS_DIR = os.getenv("REVISIONS_DIR", os.path.join(".cache", "revisions"))
+REVISIONS_MAX_MB = float(os.getenv("REVISIONS_MAX_MB", "64"))
+
+
+def is_enabled():
+    return os.getenv("INCREMENTAL", "1") != "0" and REVISIONS_MAX_MB > 0
+
+
+def _stream_bytes(stream):
+    # Raw (still compressed) bytes where available: hashing them is much cheaper than decoding scans
+    data = stream.get_rawdata()
+    return data if data is not None else stream.get_data()
+
+
+# Back-links to the page tree; following them would hash the whole document into every page
+_BACK_LINKS = {"Parent", "P"}
+
+
+def _update(digest, obj, memo):
+    # Hashes a PDF object and everything it references. memo maps object ids to their digests, so
+    # objects shared by many pages (fonts, logos) are hashed once per document.
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+    if isinstance(obj, PDFObjRef):
+        if obj.objid not in memo:
+            memo[obj.objid] = b"" # in progress: a reference cycle back to it hashes as empty
+            sub_digest = hashlib.sha256()
+            _update(sub_digest, obj.resolve(), memo)
+            memo[obj.objid] = sub_digest.digest()
+        digest.update(memo[obj.objid])
+    elif isinstance(obj, PDFStream):
+        _update(digest, obj.attrs, memo)
+        digest.update(_stream_bytes(obj))
+    elif isinstance(obj, dict):
+        for key in sorted(obj):
+            if key not in _BACK_LINKS:
+                digest.update(str(key).encode("utf-8"))
+                _update(digest, obj[key], memo)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _update(digest, item, memo)
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+
+
+def _page_fingerprint(page_obj, memo):
+    from pdfminer.pdftypes import resolve1
+
+    digest = hashlib.sha256(repr((page_obj.mediabox, page_obj.attrs.get("Rotate"))).encode("utf-8"))
+    for stream in page_obj.contents:
+        digest.update(_stream_bytes(resolve1(stream)))
+    # Text and images also depend on resources outside the content stream: a rescanned page keeps
+    # the same "/Im0 Do", and a re-embedded font may map the same glyphs to different text
+    # (ToUnicode). Fonts and XObjects are hashed with everything they reference, which includes
+    # the resources of nested forms.
+    resources = resolve1(page_obj.resources) or {}
+    for key in ("Font", "XObject"):
+        digest.update(key.encode("utf-8"))
+        _update(digest, resources.get(key), memo)
+    return digest.hexdigest()
+
+
+def page_fingerprints(file_path):
+    """
+    Per-page fingerprints of a PDF, from its raw content streams, fonts and XObjects (no text
+    extraction or rendering). Returns None for other formats or when a page can't be fingerprinted.
+    """
+    if os.path.splitext(file_path)[1].lower() != ".pdf":
+        return None
+    try:
+        import pdfplumber
+        memo = {}
+        with pdfplumber.open(file_path) as pdf:
+            return [_page_fingerprint(page.page_obj, memo) for page in pdf.pages]
+    except Exception as e:
+        print(f"Warning: could not fingerprint the pages of {os.path.basename(file_path)}, analyzing it in full. Error: {e}")
+        return None
+
+
+def match_pages(old_fingerprints, new_fingerprints):
+    """Maps each unchanged page of the new version to its page in the old one: {new_page: old_page}."""
+    positions = defaultdict(deque)
+    for page_num, fingerprint in enumerate(old_fingerprints):
+        positions[fingerprint].append(page_num)
+    page_map = {}
+    for page_num, fingerprint in enumerate(new_fingerprints):
+        if positions.get(fingerprint):
+            page_map[page_num] = positions[fingerprint].popleft()
+    return page_map
+
+
+def _manifest_path(file_path, owner):
+    # Versions of a document are recognized by owner and file name; the content hash tells them
+    # apart. Without the owner, two users' unrelated "annual_report.pdf" would share text and chunks.
+    name = json.dumps([owner, os.path.basename(file_path).lower()])
+    return os.path.join(REVISIONS_DIR, hashlib.sha256(name.encode("utf-8")).hexdigest() + ".json")
+
+
+def _load_manifest(file_path, owner):
+    path = _manifest_path(file_path, owner)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable revision manifest {path}: {e}")
+        return None
+    touch(path)
+    return manifest
+
+
+class Revision:
+    """
+    One upload of a PDF, compared with the previous version of the same file (if any).
+    page_map maps unchanged pages to their old page numbers; first_changed is the first page whose
+    content (or position) differs, so everything before it is known to be identical.
+    """
+
+    def __init__(self, file_path, owner, fingerprints, previous=None, content_hash=None):
+        self.file_path = file_path
+        self.owner = owner
+        self.content_hash = content_hash or file_sha256(file_path)
+        self.fingerprints = fingerprints
+        self.previous = previous
+        self.page_map = match_pages(previous["fingerprints"], fingerprints) if previous else {}
+        self.first_changed = next(
+            (page_num for page_num in range(len(fingerprints)) if self.page_map.get(page_num) != page_num),
+            len(fingerprints),
+        )
+        self.index_key = previous.get("index_key") if previous else None
+
+    @property
+    def changed_pages(self):
+        return len(self.fingerprints) - len(self.page_map)
+
+    def reused_records(self):
+        """{page_num: PageRecord} of the unchanged pages, read from the previous version's extraction cache."""
+        if not self.page_map or not extraction_cache.is_enabled():
+            return {}
+        cached_pages = extraction_cache.load(self.previous["extraction_key"])
+        if cached_pages is None:
+            return {}
+        old_to_new = defaultdict(list)
+        for new_page, old_page in self.page_map.items():
+            old_to_new[old_page].append(new_page)
+        reused = {}
+        for record in cached_pages:
+            for new_page in old_to_new.get(record.page_num, ()):
+                reused[new_page] = record._replace(page_num=new_page, seconds=0.0)
+        return reused
+
+    def kept_kpis(self):
+        """
+        (kpis, kpi_pages) of the previous version that still hold: those found before the first
+        changed page. The first match wins, so only the pages from first_changed on need a rescan.
+        """
+        if not self.previous:
+            return {}, {}
+        kpi_pages = {key: page for key, page in self.previous["kpi_pages"].items() if page < self.first_changed}
+        kpis = {key: value for key, value in self.previous["kpis"].items() if key in kpi_pages}
+        return kpis, kpi_pages
+
+    def save(self, extraction_key, index_key, kpis, kpi_pages):
+        """Records this version as the one the next upload of the same file is compared with."""
+        manifest = {
+            "file_name": os.path.basename(self.file_path),
+            "sha256": self.content_hash,
+            "fingerprints": self.fingerprints,
+            "extraction_key": extraction_key,
+            "index_key": index_key,
+            "kpis": kpis,
+            "kpi_pages": kpi_pages,
+            "created": time.time(),
+        }
+        tmp_path = None
+        try:
+            os.makedirs(REVISIONS_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=REVISIONS_DIR, prefix=".tmp-", suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, _manifest_path(self.file_path, self.owner))
+            tmp_path = None
+            evict_lru(REVISIONS_DIR, REVISIONS_MAX_MB * 1024 * 1024)
+        except OSError as e:
+            print(f"Warning: could not write revision manifest: {e}")
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+
+def plan(file_path, owner, content_hash=None):
+    """
+    Returns the Revision for a file uploaded by owner (a user name or session id; only that owner's
+    earlier uploads are taken as previous versions), or None when incremental analysis doesn't apply
+    (disabled, not a PDF, or the pages can't be fingerprinted). Its previous is None when no earlier
+    version of the file is known, or when this exact file was analyzed before (the caches cover that).
+    content_hash is the file's SHA-256, if the caller already has it.
+    """
+    if not is_enabled():
+        return None
+    fingerprints = page_fingerprints(file_path)
+    if fingerprints is None:
+        return None
+    content_hash = content_hash or file_sha256(file_path)
+    previous = _load_manifest(file_path, owner)
+    if previous and (previous.get("sha256") == content_hash or not isinstance(previous.get("fingerprints"), list)):
+        previous = None
+    revision = Revision(file_path, owner, fingerprints, previous, content_hash)
+    if previous and not revision.page_map:
+        revision = Revision(file_path, owner, fingerprints, content_hash=content_hash) # nothing in common with the previous version
+    if revision.previous:
+        print(f"♻️ Previous version of {os.path.basename(file_path)} found: {revision.changed_pages} of {len(fingerprints)} page(s) changed.")
+    return revision
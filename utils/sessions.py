@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Idle sessions are dropped after this many seconds; the least recently used ones are dropped
+# first once more than SESSION_MAX sessions are alive.
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100"))
+
+
+class Session:
+    """Everything one browser session owns: its uploaded file, Q&A chain and PDF report."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.qa_agent = None
+        self.document_key = None # content key of the uploaded document (scopes the Q&A cache)
+        self.uploaded_file_path = None
+        self.report_path = None
+        self.last_used = time.monotonic()
+
+    def set_report(self, path):
+        """Makes path the session's report, removing the one it replaces."""
+        previous, self.report_path = self.report_path, path
+        if previous and previous != path:
+            try:
+                os.remove(previous)
+            except OSError:
+                pass
+
+    def touch(self):
+        self.last_used = time.monotonic()
+        # Keep the report's mtime fresh so the report TTL sweep doesn't remove it while in use
+        if self.report_path:
+            try:
+                os.utime(self.report_path)
+            except OSError:
+                pass
+
+    def clear(self):
+        self.qa_agent = None
+        self.document_key = None
+        self.uploaded_file_path = None
+        self.set_report(None)
+
+
+class SessionStore:
+    """
+    Session-keyed state with TTL and LRU eviction, so concurrent users never share a Q&A chain.
+    Keys are Gradio session hashes (one per browser tab / API client).
+    """
+
+    def __init__(self, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Returns the session for session_id, creating it if needed."""
+        with self._lock:
+            now = time.monotonic()
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                session = Session(session_id)
+            session.last_used = now
+            self._sessions[session_id] = session # most recently used last
+            evicted = self._evict_locked(now)
+        session.touch()
+        for old in evicted:
+            old.clear()
+        return session
+
+    def drop(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.clear()
+
+    def _evict_locked(self, now):
+        evicted = []
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            expired = now - session.last_used > self.ttl_seconds
+            if not expired and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            evicted.append(session)
+        return evicted
+
+    def __len__(self):
+        return len(self._sessions)
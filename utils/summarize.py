@@ -1,14 +1,129 @@
 import os
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from dotenv import load_dotenv
 
+from utils import compaction, metrics
+from utils.compaction import CHARS_PER_TOKEN, estimate_tokens
+
 load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-def generate_financial_summary(text):
+def get_client():
+    """The shared, pooled Groq client (see utils/llm_client.py): retries and rate limiting included."""
+    from utils.llm_client import get_client as get_llm_client
+    return get_llm_client()
+
+SUMMARY_MODEL = "llama3-70b-8192"
+# Document tokens that fit in one summary prompt (the model's 8k window also holds the
+# instructions and the 500-token answer). Longer documents go through map-reduce.
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "6000"))
+# Size of each section summarized in the map phase
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "3000"))
+# Upper bound on parallel requests to the LLM during the map phase
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+
+
+def split_into_sections(text, max_tokens=SUMMARY_SECTION_TOKENS):
+    """
+    Splits text into sections of at most max_tokens (estimated), breaking at line boundaries.
+    Lines longer than a whole section are hard-split.
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    sections = []
+    current = []
+    current_len = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            sections.append(line[:max_chars])
+            line = line[max_chars:]
+        if current_len + len(line) > max_chars and current:
+            sections.append("".join(current))
+            current, current_len = [], 0
+        current.append(line)
+        current_len += len(line)
+    if current:
+        sections.append("".join(current))
+    return [section for section in sections if section.strip()]
+
+
+def _complete(client, prompt, max_tokens):
+    with metrics.span("llm_request", model=SUMMARY_MODEL):
+        chat_completion = client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=SUMMARY_MODEL,     # Best free model with large context
+            temperature=0.3,         # Lower temperature for more factual, less creative output
+            max_tokens=max_tokens    # Limit output length to encourage conciseness
+        )
+    # Token usage as reported by the API; falls back to the local estimate for the prompt
+    usage = getattr(chat_completion, "usage", None)
+    metrics.inc("llm_tokens_total", getattr(usage, "prompt_tokens", None) or estimate_tokens(prompt), model=SUMMARY_MODEL, kind="prompt")
+    metrics.inc("llm_tokens_total", getattr(usage, "completion_tokens", None) or 0, model=SUMMARY_MODEL, kind="completion")
+    return chat_completion.choices[0].message.content.strip()
+
+
+def _summarize_section(client, section, index, total):
+    # Map step: condense one section, keeping the figures the final summary needs.
+    prompt = f"""
+    You are an expert financial analyst. Below is section {index} of {total} of a financial document.
+
+    Extract and summarize in at most 200 words:
+    -   Total Assets, Total Liabilities, Shareholder Equity, Net Profit/Net Income, Revenue, Cash and Cash Equivalents, with their reporting periods and units, exactly as stated.
+    -   Any significant risks, red flags or growth opportunities mentioned.
+
+    Do NOT make up any information. If the section contains none of the above, reply with "No key financial information."
+
+    --- BEGIN SECTION ---
+    {section}
+    --- END OF SECTION ---
+
+    Section Summary:
+    """
+    return _complete(client, prompt, max_tokens=300)
+
+
+def _map_sections(client, text):
+    """Summarizes every section of text concurrently, with at most SUMMARY_MAX_CONCURRENCY requests in flight."""
+    sections = split_into_sections(text)
+    print(f"Map-reduce summarization: {len(sections)} sections, up to {SUMMARY_MAX_CONCURRENCY} concurrent requests.")
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_MAX_CONCURRENCY)) as pool:
+        # map() returns results in section order regardless of completion order
+        partials = list(pool.map(
+            _summarize_section, repeat(client), sections, range(1, len(sections) + 1), repeat(len(sections))
+        ))
+    return "\n\n".join(
+        f"[Section {i + 1}] {partial}" for i, partial in enumerate(partials)
+        if partial and "no key financial information" not in partial.lower()
+    )
+
+
+@metrics.timed("summary", log=True)
+def generate_financial_summary(text, client=None, pages=None):
+    """
+    Generates the executive summary. Documents that don't fit in one prompt are split into
+    sections that are summarized concurrently (map) and then combined into the final summary
+    (reduce). client defaults to the shared Groq client; any object with the same
+    chat.completions.create() interface (e.g. a local stub) can be passed instead. pages, the
+    text split by page, lets compaction drop headers and footers repeated across pages.
+    """
     if not text:
         return "No text provided for summarization."
 
+    try:
+        client = client or get_client()
+        # Boilerplate, page numbers and table padding cost tokens without adding information
+        text = compaction.compact(text, stage="summary", pages=pages)
+
+        # Map phase, repeated until the partial summaries fit in one prompt
+        while compaction.count_tokens(text) > SUMMARY_CONTEXT_TOKENS:
+            reduced = _map_sections(client, text)
+            if not reduced:
+                return "No key financial information found in the document."
+            if compaction.count_tokens(reduced) >= compaction.count_tokens(text):
+                raise RuntimeError("context_length_exceeded: section summaries are not getting shorter")
+            text = reduced
+    except Exception as e:
+        return _error_message(e)
+
     # Refined prompt for more targeted and structured summaries
     prompt = f"""
     You are an expert financial analyst. Your task is to provide a concise and insightful executive summary of the following financial data.
@@ -34,14 +149,8 @@ def generate_financial_summary(text):
     """
 
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama3-70b-8192",  # Best free model with large context
-            temperature=0.3,         # Lower temperature for more factual, less creative output
-            max_tokens=500           # Limit output length to encourage conciseness
-        )
-
-        summary_content = chat_completion.choices[0].message.content.strip()
+        # Reduce phase (or the only call, for documents that fit)
+        summary_content = _complete(client, prompt, max_tokens=500)
 
         if not summary_content:
             return "No summary content returned by the model."
@@ -49,12 +158,16 @@ def generate_financial_summary(text):
         return summary_content
 
     except Exception as e:
-        # More specific error messages for common issues
-        if "rate limit" in str(e).lower():
-            return "❌ Error: API rate limit exceeded. Please try again shortly."
-        elif "invalid api key" in str(e).lower() or "authentication" in str(e).lower():
-            return "❌ Error: Invalid or missing API key. Please check your .env file."
-        elif "context_length_exceeded" in str(e).lower(): # Though llama3-70b has a large window, good to catch
-            return "❌ Error: The document is too long for the AI model to process. Please try a shorter document."
-        else:
-            return f"❌ Error generating summary: {str(e)}"
\ No newline at end of file
+        return _error_message(e)
+
+
+def _error_message(e):
+    # More specific error messages for common issues
+    if "rate limit" in str(e).lower():
+        return "❌ Error: API rate limit exceeded. Please try again shortly."
+    elif "invalid api key" in str(e).lower() or "authentication" in str(e).lower():
+        return "❌ Error: Invalid or missing API key. Please check your .env file."
+    elif "context_length_exceeded" in str(e).lower(): # Though llama3-70b has a large window, good to catch
+        return "❌ Error: The document is too long for the AI model to process. Please try a shorter document."
+    else:
+        return f"❌ Error generating summary: {str(e)}"
\ No newline at end of file